@@ -0,0 +1,258 @@
+"""
+Favourite writes that go straight to the M2M through tables.
+
+A toggle is one conditional DELETE and, only when it removed nothing, one
+INSERT ... SELECT that adds the row if the target exists and the pair is
+not stored yet. No existence check comes first, so there is no read-then-write
+window and a concurrent duplicate is absorbed by the unique constraint. Bulk
+edits insert or delete a whole id list in one statement.
+
+``m2m_changed`` (``post_add`` / ``post_remove``) is sent with the ids that
+actually changed, so the usual receivers keep working. The app signal
+modules pass every change to ``changed()``, which buffers the target's
+``favorite_count`` deltas in ``counts`` and edits the cached id sets.
+
+``ids(user)`` is the set of ids a user has favourited, for marking items
+with one membership test each. It is cached per user under
+``favids:<model>:<user>`` as a sorted integer array, tagged with the user's
+version (``...:v``) read before the rows were; versions live in the shared
+cache tier only, never in a worker's L1. Every change gives the user a
+new version, at once and again when it commits, which retires any array
+filled from rows read before the commit. An array read inside a transaction
+holding an uncommitted change for that user is never stored.
+"""
+import functools
+import threading
+import time
+import weakref
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.constants import OnConflict
+from django.db.models.signals import m2m_changed
+
+from catalog.cache import shared_cache
+from catalog.counters import CounterBuffer
+from .models import CustomUser
+
+DEFAULT_IDS_TIMEOUT = 3600
+
+
+def pack(ids):
+    """Sorted array of ``ids``, four bytes each while they fit"""
+    ids = sorted(ids)
+    return array('I' if not ids or ids[-1] < 2 ** 32 else 'Q', ids)
+
+
+class Favorites:
+    def __init__(self, descriptor):
+        field = descriptor.field
+        self.through = descriptor.through
+        self.model = field.related_model
+        self.table = connection.ops.quote_name(self.through._meta.db_table)
+        self.source_column = field.m2m_column_name()
+        self.target_column = field.m2m_reverse_name()
+        self.source = connection.ops.quote_name(self.source_column)
+        self.target = connection.ops.quote_name(self.target_column)
+        self.target_table = connection.ops.quote_name(self.model._meta.db_table)
+        self.target_pk = connection.ops.quote_name(self.model._meta.pk.column)
+        self.counts = CounterBuffer(self.model, 'favorite_count', self.through, self.target_column)
+        # Django connections are per thread, and so are their uncommitted changes
+        self._pending = threading.local()
+
+    def changed(self, instance, action, reverse, pk_set):
+        """Apply one ``m2m_changed`` call to the counters and the cached id sets"""
+        if not reverse:
+            instance.__dict__.get('_favorite_ids', {}).pop(self.model, None)
+        if action == 'pre_clear':
+            instance._cleared_favorites = self._stored(instance, reverse)
+        elif action in ('post_add', 'post_remove'):
+            pks = pk_set or ()
+            sign = 1 if action == 'post_add' else -1
+            if reverse:
+                self.counts.add([instance.pk], sign * len(pks))
+                self._invalidate(pks)
+            else:
+                self.counts.add(pks, sign)
+                self._invalidate([instance.pk])
+        elif action == 'post_clear':
+            cleared = getattr(instance, '_cleared_favorites', [])
+            if reverse:
+                self.counts.add([instance.pk], -len(cleared))
+                self._invalidate(cleared)
+            else:
+                self.counts.add(cleared, -1)
+                self._invalidate([instance.pk])
+
+    def _stored(self, instance, reverse):
+        column, other = (self.target_column, self.source_column) if reverse else (self.source_column, self.target_column)
+        return list(self.through.objects.filter(**{column: instance.pk}).values_list(other, flat=True))
+
+    def forget_user(self, user):
+        """Deleting a user drops its through rows without ``m2m_changed``"""
+        self.counts.add(self._stored(user, reverse=False), -1)
+        cache.delete_many([self._ids_key(user.pk), self._version_key(user.pk)])
+
+    def forget_target(self, obj):
+        """Same for a deleted track or movie; called before its rows go"""
+        self._invalidate(self._stored(obj, reverse=True))
+
+    def _ids_key(self, user_id):
+        return f'favids:{self.model._meta.label_lower}:{user_id}'
+
+    def _version_key(self, user_id):
+        return f'{self._ids_key(user_id)}:v'
+
+    def _ids_timeout(self):
+        return getattr(settings, 'FAVORITE_IDS_TIMEOUT', DEFAULT_IDS_TIMEOUT)
+
+    def id_array(self, user_id):
+        """The sorted array of ids ``user_id`` has favourited"""
+        key, version_key = self._ids_key(user_id), self._version_key(user_id)
+        # Another worker's bump must be seen at once, so the version skips L1
+        version = shared_cache().get(version_key)
+        entry = cache.get(key) if version is not None else None
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        if version is None:
+            shared_cache().add(version_key, time.time_ns(), None)
+            version = shared_cache().get(version_key)
+        stored = pack(self.through.objects.filter(**{self.source_column: user_id}).values_list(
+            self.target_column, flat=True,
+        ))
+        if version is not None and not self._uncommitted(user_id):
+            cache.set(key, (version, stored), self._ids_timeout())
+        return stored
+
+    def ids(self, user):
+        """Set of ids ``user`` has favourited (empty for anonymous users), loaded once per user object"""
+        if not user.is_authenticated:
+            return frozenset()
+        loaded = user.__dict__.setdefault('_favorite_ids', {})
+        if self.model not in loaded:
+            loaded[self.model] = frozenset(self.id_array(user.pk))
+        return loaded[self.model]
+
+    def _invalidate(self, user_ids):
+        """Retire the cached arrays of ``user_ids`` now and, inside a transaction, on commit"""
+        user_ids = set(user_ids)
+        if not user_ids:
+            return
+        self._bump(user_ids)
+        if connection.in_atomic_block:
+            # Fills that read the rows before the commit were tagged with the first bump
+            pending = self._pending_changes()
+            pending.append(user_ids)
+            bump = functools.partial(self._bump, user_ids)
+            # Django has no rollback hook, but releases the callback once it has
+            # run on commit or been dropped by a rollback; either way the change settled
+            weakref.finalize(bump, self._settled, pending, user_ids)
+            transaction.on_commit(bump)
+
+    def _bump(self, user_ids):
+        shared_cache().set_many({self._version_key(user_id): time.time_ns() for user_id in user_ids}, None)
+
+    def _pending_changes(self):
+        """User id sets changed in this connection's open transaction"""
+        if not connection.in_atomic_block or not hasattr(self._pending, 'changes'):
+            # Nothing is pending outside a transaction
+            self._pending.changes = []
+        return self._pending.changes
+
+    @staticmethod
+    def _settled(pending, user_ids):
+        for i, changed in enumerate(pending):
+            if changed is user_ids:
+                del pending[i]
+                break
+
+    def _uncommitted(self, user_id):
+        """Whether this connection holds an uncommitted change to ``user_id``'s favourites"""
+        return any(user_id in changed for changed in self._pending_changes())
+
+    def _changed(self, user, action, pks):
+        if pks:
+            m2m_changed.send(
+                sender=self.through, instance=user, action=action, reverse=False,
+                model=self.model, pk_set=set(pks), using=connection.alias,
+            )
+
+    def _insert(self, cursor, user_id, pks):
+        """Insert the existing targets among ``pks``; returns the ids inserted"""
+        placeholders = ', '.join(['%s'] * len(pks))
+        sql = (
+            f'{connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)} {self.table} '
+            f'({self.source}, {self.target}) '
+            f'SELECT %s, {self.target_pk} FROM {self.target_table} WHERE {self.target_pk} IN ({placeholders}) '
+            f'{connection.ops.on_conflict_suffix_sql([], OnConflict.IGNORE, None, None)}'
+        )
+        return self._execute(cursor, sql, [user_id, *pks], user_id, pks, present=False)
+
+    def _delete(self, cursor, user_id, pks, keep=False):
+        """Delete the pairs for ``pks`` (or all but ``pks`` when ``keep``); returns the ids deleted"""
+        condition = f'{self.source} = %s'
+        if pks:
+            placeholders = ', '.join(['%s'] * len(pks))
+            condition += f' AND {self.target} {"NOT IN" if keep else "IN"} ({placeholders})'
+        sql = f'DELETE FROM {self.table} WHERE {condition}'
+        return self._execute(cursor, sql, [user_id, *pks], user_id, pks, present=True, keep=keep)
+
+    def _execute(self, cursor, sql, params, user_id, pks, present, keep=False):
+        if connection.features.can_return_rows_from_bulk_insert:
+            cursor.execute(f'{sql} RETURNING {self.target}', params)
+            return {row[0] for row in cursor.fetchall()}
+        # No RETURNING: find out which rows the statement is going to touch first
+        stored = set(self.through.objects.filter(**{self.source_column: user_id}).values_list(
+            self.target_column, flat=True,
+        ))
+        cursor.execute(sql, params)
+        if present:
+            return stored - set(pks) if keep else stored & set(pks)
+        existing = set(self.model._default_manager.filter(pk__in=pks).values_list('pk', flat=True))
+        return existing - stored
+
+    def toggle(self, user, pk):
+        """True if ``pk`` is now a favourite, False if it was removed, None if it does not exist"""
+        with connection.cursor() as cursor:
+            if self._delete(cursor, user.pk, [pk]):
+                self._changed(user, 'post_remove', [pk])
+                return False
+            if self._insert(cursor, user.pk, [pk]):
+                self._changed(user, 'post_add', [pk])
+                return True
+        # Nothing inserted: another request added it first, or there is no such object
+        return True if self.model._default_manager.filter(pk=pk).exists() else None
+
+    def add(self, user, pks):
+        pks = sorted(set(pks))
+        if not pks:
+            return set()
+        with connection.cursor() as cursor:
+            added = self._insert(cursor, user.pk, pks)
+        self._changed(user, 'post_add', added)
+        return added
+
+    def remove(self, user, pks):
+        pks = sorted(set(pks))
+        if not pks:
+            return set()
+        with connection.cursor() as cursor:
+            removed = self._delete(cursor, user.pk, pks)
+        self._changed(user, 'post_remove', removed)
+        return removed
+
+    def replace(self, user, pks):
+        """Make ``pks`` the user's whole list; returns ``(added, removed)``"""
+        pks = sorted(set(pks))
+        with transaction.atomic(), connection.cursor() as cursor:
+            removed = self._delete(cursor, user.pk, pks, keep=True)
+            added = self._insert(cursor, user.pk, pks) if pks else set()
+        self._changed(user, 'post_remove', removed)
+        self._changed(user, 'post_add', added)
+        return added, removed
+
+
+favorite_tracks = Favorites(CustomUser.favorite_music)
+favorite_movies = Favorites(CustomUser.favorite_movies)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from accounts.favorites import favorite_tracks, favorite_movies
+
+
+class Command(BaseCommand):
+    help = "Flush buffered favourite counters and repair drifted Track/Movie favorite_count values"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        for label, favorites in (("tracks", favorite_tracks), ("movies", favorite_movies)):
+            fixed = favorites.counts.reconcile(batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"Repaired {len(fixed)} {label}"))
@@ -0,0 +1,29 @@
+"""
+Leaderboard endpoint served from the materialized charts
+"""
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from music.charts import CHART_SIZE, chart
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def charts(request):
+    """
+    Top-rated tracks, overall or within one genre
+    GET /api/charts/?genre=3&limit=10
+    """
+    genre = request.query_params.get('genre')
+    if genre is not None and not genre.isdigit():
+        raise ValidationError({'genre': 'Expected a genre id.'})
+    try:
+        limit = int(request.query_params.get('limit', CHART_SIZE))
+    except ValueError:
+        limit = CHART_SIZE
+    genre_id = int(genre) if genre is not None else None
+    return Response({
+        'genre': genre_id,
+        'results': chart(genre_id, limit=max(1, min(limit, CHART_SIZE))),
+    })
@@ -0,0 +1,144 @@
+"""
+Streaming catalog exports (NDJSON / CSV)
+
+GET /api/export/<resource>.ndjson
+GET /api/export/<resource>.csv
+    resource: tracks, albums, movies, reviews
+    ?after_id=<id>  resume after the last id already received
+
+Rows are flat ``values()`` projections read in primary-key order, one
+keyset chunk at a time; many-to-many ids are fetched with one query per
+chunk. Memory use does not depend on the size of the catalog.
+"""
+import csv
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import Http404, StreamingHttpResponse
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.exceptions import NotAuthenticated, ValidationError
+
+from music.models import Track, Album
+from movies.models import Movie, Review
+from .renderers import CSVRenderer, FastJSONRenderer, NDJSONRenderer
+
+CHUNK_SIZE = 1000
+
+
+class ExportSpec:
+    """Flat column projection of one model plus its many-to-many id lists"""
+
+    def __init__(self, model, fields, m2m=None, requires_auth=False):
+        self.model = model
+        self.fields = fields  # output column -> values() lookup
+        self.m2m = m2m or {}  # output column -> M2M field name on model
+        self.requires_auth = requires_auth
+
+    @property
+    def columns(self):
+        return list(self.fields) + list(self.m2m)
+
+    def m2m_ids(self, name, ids):
+        field = self.model._meta.get_field(self.m2m[name])
+        through = field.remote_field.through
+        source = field.m2m_field_name()
+        target = field.m2m_reverse_field_name()
+        grouped = defaultdict(list)
+        rows = through.objects.filter(**{f'{source}__in': ids}).order_by(target)
+        for source_id, target_id in rows.values_list(f'{source}_id', f'{target}_id'):
+            grouped[source_id].append(target_id)
+        return grouped
+
+    def rows(self, after_id=0, chunk_size=CHUNK_SIZE):
+        plain = [lookup for column, lookup in self.fields.items() if column == lookup]
+        renamed = {column: F(lookup) for column, lookup in self.fields.items() if column != lookup}
+        queryset = self.model._default_manager.order_by('pk').values(*plain, **renamed)
+        columns = self.columns
+        while True:
+            chunk = list(queryset.filter(pk__gt=after_id)[:chunk_size])
+            if not chunk:
+                return
+            ids = [row['id'] for row in chunk]
+            related = {name: self.m2m_ids(name, ids) for name in self.m2m}
+            for row in chunk:
+                for name, grouped in related.items():
+                    row[name] = grouped.get(row['id'], [])
+                yield {column: row[column] for column in columns}
+            after_id = ids[-1]
+
+
+EXPORTS = {
+    'tracks': ExportSpec(
+        Track,
+        {'id': 'id', 'title': 'title', 'duration': 'duration', 'rating': 'rating',
+         'album_id': 'album_id', 'album_title': 'album__title'},
+        m2m={'artist_ids': 'artists'},
+    ),
+    'albums': ExportSpec(
+        Album,
+        {'id': 'id', 'title': 'title', 'artist_id': 'artist_id', 'artist_name': 'artist__name',
+         'release_year': 'release_year', 'description': 'description'},
+        m2m={'genre_ids': 'genres'},
+    ),
+    'movies': ExportSpec(
+        Movie,
+        {'id': 'id', 'title': 'title', 'description': 'description', 'release_year': 'release_year',
+         'duration': 'duration', 'rating': 'rating'},
+        m2m={'genre_ids': 'genres', 'director_ids': 'directors', 'actor_ids': 'actors'},
+    ),
+    'reviews': ExportSpec(
+        Review,
+        {'id': 'id', 'movie_id': 'movie_id', 'user_id': 'user_id', 'rating': 'rating',
+         'comment': 'comment', 'created_at': 'created_at'},
+        requires_auth=True,
+    ),
+}
+
+
+class _Echo:
+    """File-like object whose write() hands the CSV line straight back"""
+
+    def write(self, value):
+        return value
+
+
+def _ndjson(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def _csv(rows, columns):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([
+            ';'.join(str(v) for v in row[column]) if isinstance(row[column], list) else row[column]
+            for column in columns
+        ])
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+@renderer_classes([FastJSONRenderer, NDJSONRenderer, CSVRenderer])
+def export(request, resource, fmt):
+    spec = EXPORTS.get(resource)
+    if spec is None or fmt not in ('ndjson', 'csv'):
+        raise Http404('Unknown export')
+    if spec.requires_auth and not request.user.is_authenticated:
+        raise NotAuthenticated()
+    try:
+        after_id = int(request.query_params.get('after_id', 0))
+    except ValueError:
+        raise ValidationError({'after_id': 'Must be an integer.'})
+
+    rows = spec.rows(after_id=after_id)
+    if fmt == 'csv':
+        response = StreamingHttpResponse(_csv(rows, spec.columns), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{resource}.csv"'
+    else:
+        response = StreamingHttpResponse(_ndjson(rows), content_type='application/x-ndjson; charset=utf-8')
+    response['Cache-Control'] = 'no-store'
+    return response
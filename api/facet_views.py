@@ -0,0 +1,30 @@
+"""
+Filter option lists with counts, served from the facet cache
+"""
+from django.http import Http404
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from catalog.facets import FACETS
+
+FACET_DEFAULT_LIMIT = 20
+FACET_MAX_LIMIT = 100
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def facet_options(request, name):
+    """
+    Options of one filter facet, optionally narrowed by name
+    GET /api/facets/artists/?q=beat&limit=20
+    """
+    facet = FACETS.get(name)
+    if facet is None:
+        raise Http404
+    query = request.query_params.get('q', '').strip()
+    try:
+        limit = int(request.query_params.get('limit', FACET_DEFAULT_LIMIT))
+    except ValueError:
+        limit = FACET_DEFAULT_LIMIT
+    limit = max(1, min(limit, FACET_MAX_LIMIT))
+    return Response({'facet': name, 'query': query, 'results': facet.search(query, limit=limit)})
@@ -0,0 +1,55 @@
+"""
+Bulk favourite edits (each kind is changed with one statement) and the
+viewer's favourite id sets
+"""
+from django.contrib.auth import get_user_model
+from django.utils.cache import patch_cache_control
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from accounts.favorites import favorite_tracks, favorite_movies
+from catalog.conditional import not_modified, set_validators, validators
+from .serializers import FavoriteIdsSerializer
+
+FAVORITES = {'tracks': favorite_tracks, 'movies': favorite_movies}
+
+
+@api_view(['POST', 'PUT', 'DELETE'])
+@permission_classes([permissions.IsAuthenticated])
+def favorites(request):
+    """
+    Add (POST), remove (DELETE) or replace (PUT) favourite tracks and movies
+    POST /api/favorites/ {"tracks": [1, 2], "movies": [7]}
+    Only the kinds present in the body are changed; unknown ids are ignored.
+    """
+    serializer = FavoriteIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    results = {}
+    for kind, ids in serializer.validated_data.items():
+        store = FAVORITES[kind]
+        if request.method == 'POST':
+            added, removed = store.add(request.user, ids), set()
+        elif request.method == 'DELETE':
+            added, removed = set(), store.remove(request.user, ids)
+        else:
+            added, removed = store.replace(request.user, ids)
+        results[kind] = {'added': sorted(added), 'removed': sorted(removed)}
+    return Response(results)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def favorite_ids(request):
+    """
+    Sorted ids of the viewer's favourite tracks and movies, from the per-user cache
+    GET /api/favorites/ids/
+    """
+    user = request.user
+    etag, last_modified = validators((), [(get_user_model(), user.pk)], [request.get_full_path(), user.pk])
+    response = not_modified(request._request, etag, last_modified)
+    if response is None:
+        response = set_validators(Response({
+            kind: store.id_array(user.pk).tolist() for kind, store in FAVORITES.items()
+        }), etag, last_modified)
+    patch_cache_control(response, private=True)
+    return response
@@ -0,0 +1,48 @@
+"""
+Filter backends shared by the API viewsets
+"""
+from rest_framework import filters
+
+
+class IndexedSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter that answers ``?search=`` from the view's ``search_index``
+    instead of an ``icontains`` OR-chain. Views without an index keep the
+    stock ``search_fields`` behaviour.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        index = getattr(view, 'search_index', None)
+        if index is None:
+            return super().filter_queryset(request, queryset, view)
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return index.search(queryset, query)
+
+
+class RelevanceOrderingFilter(filters.OrderingFilter):
+    """
+    OrderingFilter that sorts search results by relevance unless the
+    client asked for an explicit ``?ordering=``. Names in the view's
+    ``ordering_aliases`` (e.g. ``popularity``) expand to their fields;
+    ``-popularity`` expands to the same fields reversed.
+    """
+
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        aliases = getattr(view, 'ordering_aliases', {})
+        ordering = []
+        for term in fields:
+            if term in aliases:
+                ordering.extend(aliases[term])
+            elif term.startswith('-') and term[1:] in aliases:
+                ordering.extend(field[1:] if field.startswith('-') else f'-{field}' for field in aliases[term[1:]])
+            else:
+                ordering.extend(super().remove_invalid_fields(queryset, [term], view, request))
+        return ordering
+
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params.get(self.ordering_param)
+        if not params and 'search_rank' in queryset.query.annotations:
+            return ['-search_rank'] + list(self.get_default_ordering(view) or [])
+        return super().get_ordering(request, queryset, view)
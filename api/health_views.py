@@ -61,6 +61,12 @@ def health_detailed(request):
         health_status['checks']['cache'] = 'error'
         health_status['status'] = 'unhealthy'
     
+    # The check above can pass from the in-process tier alone; the shared tier
+    # being down degrades caching (stale reads) but does not stop serving
+    l2_available = getattr(cache, 'l2_available', None)
+    if l2_available is not None:
+        health_status['checks']['shared_cache'] = 'ok' if l2_available() else 'degraded'
+    
     http_status = status.HTTP_200_OK if health_status['status'] == 'healthy' else status.HTTP_503_SERVICE_UNAVAILABLE
     
     return Response(health_status, status=http_status)
@@ -0,0 +1,15 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+def _available(classes):
+    return [item for item in classes if getattr(item, 'available', True)]
+
+
+class CatalogContentNegotiation(DefaultContentNegotiation):
+    """Accept-header negotiation that skips renderers/parsers whose library is not installed"""
+
+    def select_parser(self, request, parsers):
+        return super().select_parser(request, _available(parsers))
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return super().select_renderer(request, _available(renderers), format_suffix)
@@ -0,0 +1,230 @@
+"""
+Pagination for catalog list endpoints.
+
+Page-number pagination stays the default. Passing ``?cursor=`` (or setting
+``API_CURSOR_PAGINATION = True``) switches to keyset pagination: the cursor
+carries the ordering values of the last row seen and the next page is a
+range scan from there, so there is no COUNT and no OFFSET and page 10,000
+costs the same as page 1. The ordering chosen by OrderingFilter is kept and
+the primary key is appended as a tie-breaker.
+"""
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime, parse_time
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+# Tags for cursor values JSON cannot carry at full precision
+DATETIME_TAG = '$dt'
+TIME_TAG = '$t'
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder rounds datetimes and times to milliseconds, which
+    would skip rows whose ordering values differ by less than that; keep
+    microseconds and tag the type so ``decode_value`` restores it.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return {DATETIME_TAG: o.isoformat()}
+        if isinstance(o, datetime.time):
+            return {TIME_TAG: o.isoformat()}
+        return super().default(o)
+
+
+def decode_value(value):
+    if isinstance(value, dict) and len(value) == 1:
+        (tag, text), = value.items()
+        parsed = None
+        if isinstance(text, str):
+            parsed = parse_datetime(text) if tag == DATETIME_TAG else parse_time(text) if tag == TIME_TAG else None
+        if parsed is None:
+            raise ValueError('Invalid cursor value')
+        return parsed
+    if isinstance(value, (dict, list)):
+        raise ValueError('Invalid cursor value')
+    return value
+
+
+class CatalogPagination(PageNumberPagination):
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def use_cursor(self, request):
+        if self.cursor_query_param in request.query_params:
+            return True
+        if self.page_query_param in request.query_params:
+            return False
+        return getattr(settings, 'API_CURSOR_PAGINATION', False)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.use_cursor(request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        ordering = self.get_keyset_ordering(queryset)
+        if ordering is None:
+            self.cursor_mode = False
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.ordering = ordering
+        page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(request, len(ordering))
+        keys = [(name, desc != reverse, nullable) for name, desc, nullable in ordering]
+
+        queryset = queryset.order_by(*[order_expression(*key) for key in keys])
+        if values is not None:
+            queryset = queryset.filter(after_condition(keys, values))
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = bool(rows), has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None and bool(rows)
+        self.rows = rows
+        return rows
+
+    def get_keyset_ordering(self, queryset):
+        """Return ``[(field, descending, nullable), ...]`` ending in ``pk``"""
+        order_by = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not all(isinstance(term, str) for term in order_by):
+            return None
+        ordering = []
+        for term in order_by:
+            desc = term.startswith('-')
+            name = term.lstrip('-')
+            if name == 'id':
+                name = 'pk'
+            ordering.append((name, desc, is_nullable(queryset, name)))
+        if not any(name == 'pk' for name, _, _ in ordering):
+            ordering.append(('pk', ordering[-1][1] if ordering else False, False))
+        return ordering
+
+    def decode_cursor(self, request, length):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            values, reverse = payload['v'], bool(payload.get('r'))
+            if not isinstance(values, list) or len(values) != length:
+                raise ValueError('Invalid cursor')
+            values = [decode_value(value) for value in values]
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def encode_cursor(self, row, reverse):
+        values = [row_value(row, name) for name, _, _ in self.ordering]
+        payload = json.dumps({'v': values, 'r': int(reverse)}, cls=CursorEncoder)
+        encoded = urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not getattr(self, 'cursor_mode', False):
+            return super().get_next_link()
+        return self.encode_cursor(self.rows[-1], False) if self.has_next and self.rows else None
+
+    def get_previous_link(self):
+        if not getattr(self, 'cursor_mode', False):
+            return super().get_previous_link()
+        return self.encode_cursor(self.rows[0], True) if self.has_previous and self.rows else None
+
+    def get_paginated_response(self, data):
+        if not getattr(self, 'cursor_mode', False):
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        parameters.append({
+            'name': self.cursor_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Keyset cursor; pass an empty value to start cursor pagination.',
+            'schema': {'type': 'string'},
+        })
+        return parameters
+
+
+def is_nullable(queryset, path):
+    """Whether any hop of a ``a__b__c`` ordering path can be NULL"""
+    if path == 'pk':
+        return False
+    if path in queryset.query.annotations:
+        return True
+    model = queryset.model
+    for part in path.split('__'):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return True
+        if field.null:
+            return True
+        model = field.related_model or model
+    return False
+
+
+def row_value(obj, path):
+    value = obj
+    for part in path.split('__'):
+        if value is None:
+            return None
+        value = getattr(value, part)
+    return value
+
+
+def order_expression(name, desc, nullable):
+    # NULLs sort before every value ascending (after every value descending)
+    # on all backends, which the cursor comparison below relies on
+    if nullable:
+        return F(name).desc(nulls_last=True) if desc else F(name).asc(nulls_first=True)
+    return f'-{name}' if desc else name
+
+
+def after_condition(keys, values):
+    """
+    Rows strictly after ``values`` in the ordering ``keys``:
+    ``a > x OR (a = x AND (b > y OR (b = y AND ...)))``, with a leading
+    ``a >= x`` bound so the database can range-scan an index on ``a``.
+    """
+    condition = None
+    for (name, desc, nullable), value in reversed(list(zip(keys, values))):
+        after = _strictly_after(name, desc, nullable, value)
+        if condition is not None:
+            equal = Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value})
+            tail = equal & condition
+            after = tail if after is None else after | tail
+        condition = after if after is not None else Q(pk__in=[])
+    name, desc, nullable = keys[0]
+    if values[0] is not None and not nullable:
+        condition &= Q(**{f'{name}__{"lte" if desc else "gte"}': values[0]})
+    return condition
+
+
+def _strictly_after(name, desc, nullable, value):
+    if value is None:
+        return None if desc else Q(**{f'{name}__isnull': False})
+    after = Q(**{f'{name}__{"lt" if desc else "gt"}': value})
+    if desc and nullable:
+        after |= Q(**{f'{name}__isnull': True})
+    return after
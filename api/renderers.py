@@ -0,0 +1,70 @@
+"""
+Fast API renderers.
+
+``FastJSONRenderer`` produces the same bytes as DRF's ``JSONRenderer`` using
+orjson when it is installed, and falls back to the stdlib encoder otherwise
+(or for indented output and values orjson cannot encode). The one spelling
+difference is floats outside [1e-4, 1e16), which orjson writes without the
+exponent padding of ``repr()`` (``1e16`` rather than ``1e+16``): the same
+number, and not a range any catalog field produces.
+``MessagePackRenderer`` serves ``application/msgpack`` when msgpack is
+installed. ``NDJSONRenderer`` and ``CSVRenderer`` only let a client ask for
+an export format by ``Accept``; exports stream their own body, so these just
+render error payloads, as JSON.
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+# Values orjson cannot encode natively are converted exactly as DRF's encoder does
+_default = encoders.JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type or '', renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # Datetimes go through DRF's encoder (millisecond precision, 'Z' suffix)
+            ret = orjson.dumps(data, default=_default,
+                               option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer for the two JavaScript line terminators
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    available = msgpack is not None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+class NDJSONRenderer(FastJSONRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class CSVRenderer(FastJSONRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
@@ -0,0 +1,55 @@
+"""
+Search endpoints that sit beside the resource viewsets
+"""
+from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework import permissions
+from rest_framework.response import Response
+from catalog.autocomplete import autocomplete as autocomplete_index, SOURCES
+from catalog.unified_search import unified_search, SOURCES as SEARCH_SOURCES
+
+AUTOCOMPLETE_DEFAULT_LIMIT = 5
+AUTOCOMPLETE_MAX_LIMIT = 20
+SEARCH_DEFAULT_LIMIT = 5
+SEARCH_MAX_LIMIT = 20
+
+
+def _int_param(request, name, default, maximum):
+    try:
+        value = int(request.query_params.get(name, default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(value, maximum))
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+def autocomplete(request):
+    """
+    Prefix suggestions for the search box, answered from memory
+    GET /api/autocomplete/?q=beat&limit=5&types=artists,tracks
+    """
+    query = request.query_params.get('q', '').strip()
+    limit = _int_param(request, 'limit', AUTOCOMPLETE_DEFAULT_LIMIT, AUTOCOMPLETE_MAX_LIMIT)
+    types = request.query_params.get('types')
+    kinds = [kind.strip() for kind in types.split(',')] if types else list(SOURCES)
+    return Response({
+        'query': query,
+        'results': autocomplete_index.lookup(query, kinds=kinds, limit=limit),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def search(request):
+    """
+    Search tracks, albums, artists, movies and people in one request
+    GET /api/search/?q=nolan&limit=5&types=movies,people
+    """
+    query = request.query_params.get('q', '').strip()
+    limit = _int_param(request, 'limit', SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT)
+    types = request.query_params.get('types')
+    types = [t.strip() for t in types.split(',')] if types else list(SEARCH_SOURCES)
+    if not query:
+        return Response({'query': '', 'results': [], 'meta': {'counts': {}, 'timings_ms': {}, 'total_ms': 0}})
+    return Response(unified_search(query, limit=limit, types=types))
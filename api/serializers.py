@@ -1,36 +1,38 @@
 from rest_framework import serializers
+from catalog.flex_fields import FlexFieldsMixin
+from catalog.relations import BulkPrimaryKeyRelatedField
 from movies.models import Movie, Genre as MovieGenre, Director, Actor, Review
 
 
-class MovieGenreSerializer(serializers.ModelSerializer):
+class MovieGenreSerializer(FlexFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = MovieGenre
         fields = ["id", "name"]
 
 
-class DirectorSerializer(serializers.ModelSerializer):
+class DirectorSerializer(FlexFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Director
         fields = ["id", "name", "bio"]
 
 
-class ActorSerializer(serializers.ModelSerializer):
+class ActorSerializer(FlexFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Actor
         fields = ["id", "name", "bio"]
 
 
-class MovieSerializer(serializers.ModelSerializer):
+class MovieSerializer(FlexFieldsMixin, serializers.ModelSerializer):
     genres = MovieGenreSerializer(many=True, read_only=True)
-    genre_ids = serializers.PrimaryKeyRelatedField(
+    genre_ids = BulkPrimaryKeyRelatedField(
         many=True, queryset=MovieGenre.objects.all(), source="genres", write_only=True
     )
     directors = DirectorSerializer(many=True, read_only=True)
-    director_ids = serializers.PrimaryKeyRelatedField(
+    director_ids = BulkPrimaryKeyRelatedField(
         many=True, queryset=Director.objects.all(), source="directors", write_only=True
     )
     actors = ActorSerializer(many=True, read_only=True)
-    actor_ids = serializers.PrimaryKeyRelatedField(
+    actor_ids = BulkPrimaryKeyRelatedField(
         many=True, queryset=Actor.objects.all(), source="actors", write_only=True
     )
 
@@ -57,3 +59,21 @@ class ReviewSerializer(serializers.ModelSerializer):
         model = Review
         fields = ["id", "movie", "user", "rating", "comment", "created_at"]
         read_only_fields = ["user", "created_at"]
+
+
+class FavoriteIdsSerializer(serializers.Serializer):
+    """Track and movie ids for the bulk favourites endpoint"""
+
+    MAX_IDS = 500
+
+    tracks = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), max_length=MAX_IDS, required=False,
+    )
+    movies = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), max_length=MAX_IDS, required=False,
+    )
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError("Expected tracks and/or movies.")
+        return attrs
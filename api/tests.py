@@ -1,7 +1,7 @@
 """
 Integration tests for API endpoints
 """
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APITransactionTestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from music.models import Artist, Genre, Album, Track
@@ -148,3 +148,1136 @@ class PaginationTests(APITestCase):
         self.assertIn('results', response.data)
         self.assertEqual(len(response.data['results']), 5)  # Remaining items
 
+
+
+class AutocompleteTests(APITestCase):
+    """Test the in-memory autocomplete endpoint"""
+
+    def setUp(self):
+        from catalog.autocomplete import autocomplete
+        autocomplete.clear()
+        self.addCleanup(autocomplete.clear)
+        self.artist = Artist.objects.create(name="The Beatles")
+        self.album = Album.objects.create(title="Beat Street", artist=self.artist, release_year=1984)
+        self.track = Track.objects.create(title="Beautiful Day", album=self.album, duration=200)
+        self.movie = Movie.objects.create(title="Beetlejuice", description="Ghost", release_year=1988)
+        self.actor = Actor.objects.create(name="Beatrice Straight")
+
+    def test_prefix_matches_any_word(self):
+        response = self.client.get('/api/autocomplete/', {'q': 'bea'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([a['id'] for a in results['artists']], [self.artist.id])
+        self.assertEqual([a['id'] for a in results['albums']], [self.album.id])
+        self.assertEqual([t['id'] for t in results['tracks']], [self.track.id])
+        self.assertEqual([a['id'] for a in results['actors']], [self.actor.id])
+        self.assertEqual(results['movies'], [])
+
+    def test_typo_fallback_and_type_filter(self):
+        response = self.client.get('/api/autocomplete/', {'q': 'beatels', 'types': 'artists'})
+        self.assertEqual(list(response.data['results']), ['artists'])
+        self.assertEqual([a['id'] for a in response.data['results']['artists']], [self.artist.id])
+
+    def test_signals_update_index_without_queries(self):
+        self.client.get('/api/autocomplete/', {'q': 'x'})
+        Director.objects.create(name="Tim Burton")
+        self.movie.delete()
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/autocomplete/', {'q': 'tim bur'})
+        self.assertEqual(response.data['results']['directors'][0]['name'], "Tim Burton")
+        response = self.client.get('/api/autocomplete/', {'q': 'beetle'})
+        self.assertEqual(response.data['results']['movies'], [])
+
+
+    def test_typo_fallback_among_common_trigrams(self):
+        from catalog.autocomplete import PrefixIndex
+        rows = [("tracks", i, f"The Beat Track {i}") for i in range(1000)] + [("artists", 1, "The Beatles")]
+        index = PrefixIndex.from_rows(rows)
+        self.assertEqual(index.lookup("beatels", ["artists"], 5)["artists"], [{"id": 1, "name": "The Beatles"}])
+        self.assertEqual(len(index.lookup("beat trakc", ["tracks"], 5)["tracks"]), 5)
+
+    def test_changes_during_a_rebuild_are_replayed(self):
+        from unittest import mock
+        from catalog.autocomplete import autocomplete
+        self.client.get('/api/autocomplete/', {'q': 'x'})
+        read_rows = autocomplete._rows
+
+        def rows_then_writes():
+            rows = list(read_rows())
+            # Saved and deleted after the rebuild read the rows
+            Director.objects.create(name="Tim Burton")
+            self.movie.delete()
+            yield from rows
+
+        with mock.patch.object(autocomplete, '_rows', rows_then_writes):
+            autocomplete.rebuild()
+        response = self.client.get('/api/autocomplete/', {'q': 'tim bur'})
+        self.assertEqual(response.data['results']['directors'][0]['name'], "Tim Burton")
+        self.assertEqual(self.client.get('/api/autocomplete/', {'q': 'beetle'}).data['results']['movies'], [])
+
+
+class UnifiedSearchTests(APITestCase):
+    """Test the cross-catalog search endpoint"""
+
+    def setUp(self):
+        self.artist = Artist.objects.create(name="Nolan Sisters")
+        self.album = Album.objects.create(title="Nolan Classics", artist=self.artist, release_year=1980)
+        self.track = Track.objects.create(title="Nolan Blues", album=self.album, duration=200)
+        self.director = Director.objects.create(name="Christopher Nolan")
+        self.movie = Movie.objects.create(title="Memento", description="Memory loss", release_year=2000)
+        self.movie.directors.add(self.director)
+
+    def test_search_merges_all_sources(self):
+        response = self.client.get('/api/search/', {'q': 'nolan'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        found = {(r['type'], r['id']) for r in response.data['results']}
+        self.assertEqual(found, {
+            ('tracks', self.track.id), ('albums', self.album.id), ('artists', self.artist.id),
+            ('movies', self.movie.id), ('people', self.director.id),
+        })
+        scores = [r['score'] for r in response.data['results']]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(set(response.data['meta']['timings_ms']), {'tracks', 'albums', 'artists', 'movies', 'people'})
+
+    def test_scores_are_comparable_across_sources(self):
+        response = self.client.get('/api/search/', {'q': 'nolan'})
+        scores = {r['type']: r['score'] for r in response.data['results']}
+        # The movie only matches through its director: the weakest tier, not its source's 1.0
+        self.assertEqual(scores['movies'], 0.25)
+        self.assertEqual(scores['artists'], 0.75)
+        self.assertEqual(scores['people'], 0.5)
+        self.assertEqual(response.data['results'][-1]['type'], 'movies')
+
+    def test_types_and_limit(self):
+        Director.objects.create(name="Jonathan Nolan")
+        response = self.client.get('/api/search/', {'q': 'nolan', 'types': 'people', 'limit': 1})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['type'], 'people')
+
+    def test_empty_query(self):
+        response = self.client.get('/api/search/')
+        self.assertEqual(response.data['results'], [])
+
+
+class UnifiedSearchFanOutTests(APITransactionTestCase):
+    """Outside a transaction the sources run on the thread pool; APITestCase never gets there"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        artist = Artist.objects.create(name="Nolan Sisters")
+        album = Album.objects.create(title="Nolan", artist=artist, release_year=1980)
+        Track.objects.create(title="Nolan Blues", album=album, duration=200)
+        Track.objects.create(title="Blues for Nolan", album=album, duration=200)
+        Director.objects.create(name="Christopher Nolan")
+        Actor.objects.create(name="Nolan North")
+        Movie.objects.create(title="Nolan", description="d", release_year=2000)
+
+    def test_sources_run_in_parallel_and_merge_like_inline(self):
+        import threading
+        from unittest import mock
+        from django.db import connection, transaction
+        from catalog import unified_search
+
+        threads = {}
+
+        def recorded(name, source):
+            def run(query, limit):
+                self.assertFalse(connection.in_atomic_block)
+                threads[name] = threading.current_thread().name
+                return source(query, limit)
+            return run
+
+        wrapped = {name: recorded(name, source) for name, source in unified_search.SOURCES.items()}
+        with mock.patch.dict(unified_search.SOURCES, wrapped):
+            response = self.client.get("/api/search/", {"q": "nolan"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(threads), set(unified_search.SOURCES))
+        self.assertTrue(all(name.startswith("search") for name in threads.values()), threads)
+
+        # Same merged ranking as the inline path taken inside a transaction
+        with transaction.atomic():
+            inline = unified_search.unified_search("nolan")["results"]
+        merged = [(r["type"], r["id"], r["score"]) for r in response.data["results"]]
+        self.assertEqual(merged, [(r["type"], r["id"], r["score"]) for r in inline])
+        self.assertEqual(merged[0][2], 1.0)
+        self.assertEqual(len(merged), 7)
+
+
+class CursorPaginationTests(APITestCase):
+    """Test opt-in keyset pagination"""
+
+    def setUp(self):
+        artist = Artist.objects.create(name="Test Artist")
+        album_a = Album.objects.create(title="A Album", artist=artist, release_year=2020)
+        album_b = Album.objects.create(title="B Album", artist=artist, release_year=2021)
+        # Duplicate titles and NULL albums exercise the tie-breaker and NULL ordering
+        for i in range(45):
+            album = [album_a, album_b, None][i % 3]
+            Track.objects.create(title=f"Track {i % 7}", album=album, duration=180)
+
+    def walk(self, params):
+        ids = []
+        response = self.client.get('/api/tracks/', {'cursor': '', **params})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(t['id'] for t in response.data['results'])
+            if not response.data['next']:
+                return ids, response
+            response = self.client.get(response.data['next'])
+
+    def expected_order(self, field, descending):
+        tracks = Track.objects.select_related('album')
+        value = (lambda t: t.title) if field == 'title' else (lambda t: t.album.title if t.album else None)
+        # NULLs first ascending, last descending; id breaks ties in the same direction
+        key = lambda t: (value(t) is not None, value(t) or '', t.id)
+        return [t.id for t in sorted(tracks, key=key, reverse=descending)]
+
+    def test_cursor_walk_visits_every_row_in_order(self):
+        for ordering in ['title', '-title', 'album__title', '-album__title']:
+            ids, _ = self.walk({'ordering': ordering})
+            field = ordering.lstrip('-').replace('album__title', 'album')
+            self.assertEqual(ids, self.expected_order(field, ordering.startswith('-')), ordering)
+
+    def test_previous_link_returns_prior_page(self):
+        first = self.client.get('/api/tracks/', {'cursor': ''})
+        second = self.client.get(first.data['next'])
+        self.assertIsNone(first.data['previous'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/tracks/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_keeps_sub_millisecond_timestamps(self):
+        from datetime import datetime, timedelta, timezone
+        from movies.models import Review
+        user = get_user_model().objects.create_user(username='cursor', password='pass12345')
+        movie = Movie.objects.create(title='Cursor Movie', description='d', release_year=2000, duration=90)
+        base = datetime(2024, 1, 1, 12, 0, 0, 100000, tzinfo=timezone.utc)
+        # 45 reviews within one millisecond, every few sharing a timestamp
+        Review.objects.bulk_create([
+            Review(movie=movie, user=user, rating=5, created_at=base + timedelta(microseconds=(i * 7) % 900))
+            for i in range(45)
+        ])
+        self.client.force_authenticate(user)
+        ids = []
+        response = self.client.get('/api/reviews/', {'cursor': ''})
+        while True:
+            ids.extend(r['id'] for r in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        expected = Review.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+
+    def test_tampered_cursor_value(self):
+        from base64 import urlsafe_b64encode
+        cursor = urlsafe_b64encode(b'{"v": [{"$dt": "yesterday"}, 1]}').decode('ascii')
+        response = self.client.get('/api/tracks/', {'cursor': cursor})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ExportTests(APITestCase):
+    """Test streaming NDJSON/CSV exports"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', password='TestPass123')
+        self.artist = Artist.objects.create(name="Export Artist")
+        self.album = Album.objects.create(title="Export Album", artist=self.artist, release_year=2001)
+        self.tracks = []
+        for i in range(5):
+            track = Track.objects.create(title=f"Export {i}", album=self.album, duration=100 + i)
+            track.artists.add(self.artist)
+            self.tracks.append(track)
+
+    def read(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_export_honours_format_accept_headers(self):
+        for url, accept in [('/api/export/tracks.ndjson', 'application/x-ndjson'), ('/api/export/tracks.csv', 'text/csv')]:
+            response = self.client.get(url, HTTP_ACCEPT=accept)
+            self.assertIn(accept, response['Content-Type'])
+            self.assertIn('Export 0', self.read(response))
+        # Errors still come back with their status under the export media type
+        response = self.client.get('/api/export/reviews.csv', HTTP_ACCEPT='text/csv')
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+        response = self.client.get('/api/export/tracks.csv', {'after_id': 'x'}, HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ndjson_streams_flat_rows_and_resumes(self):
+        import json
+        response = self.client.get('/api/export/tracks.ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([r['id'] for r in rows], [t.id for t in self.tracks])
+        self.assertEqual(rows[0]['album_title'], "Export Album")
+        self.assertEqual(rows[0]['artist_ids'], [self.artist.id])
+
+        response = self.client.get('/api/export/tracks.ndjson', {'after_id': self.tracks[2].id})
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([r['id'] for r in rows], [t.id for t in self.tracks[3:]])
+
+    def test_chunks_use_constant_queries_per_chunk(self):
+        from api.export_views import EXPORTS
+        with self.assertNumQueries(2 * 3 + 1):
+            rows = list(EXPORTS['tracks'].rows(chunk_size=2))
+        self.assertEqual(len(rows), 5)
+
+    def test_csv_export(self):
+        import csv
+        import io
+        response = self.client.get('/api/export/albums.csv')
+        rows = list(csv.reader(io.StringIO(self.read(response))))
+        self.assertEqual(rows[0][:3], ['id', 'title', 'artist_id'])
+        self.assertEqual(rows[1][1], "Export Album")
+
+    def test_reviews_require_auth_and_unknown_is_404(self):
+        self.assertEqual(self.client.get('/api/export/reviews.ndjson').status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/export/reviews.csv').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/api/export/users.csv').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="sparse", password="pass12345")
+        self.artist = Artist.objects.create(name="Sparse Artist", bio="Long bio")
+        self.album = Album.objects.create(title="Sparse Album", artist=self.artist, release_year=2001, description="d")
+        self.track = Track.objects.create(title="Sparse Track", album=self.album, duration=120)
+        self.track.artists.add(self.artist)
+        self.director = Director.objects.create(name="Sparse Director", bio="Director bio")
+        self.movie = Movie.objects.create(title="Sparse Movie", description="Plot", release_year=2001, duration=90)
+        self.movie.directors.add(self.director)
+
+    def test_fields_select_top_level_keys(self):
+        resp = self.client.get("/api/tracks/", {"fields": "id,title"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data["results"], [{"id": self.track.id, "title": "Sparse Track"}])
+
+    def test_unexpanded_relations_render_as_ids(self):
+        resp = self.client.get("/api/tracks/", {"fields": "id,album,artists"})
+        self.assertEqual(resp.data["results"][0], {"id": self.track.id, "album": self.album.id, "artists": [self.artist.id]})
+
+        resp = self.client.get(f"/api/tracks/{self.track.id}/", {"expand": "album"})
+        self.assertEqual(resp.data["album"]["title"], "Sparse Album")
+        self.assertEqual(resp.data["album"]["artist"], self.artist.id)
+        self.assertEqual(resp.data["artists"], [self.artist.id])
+
+    def test_dotted_fields_expand_nested_relation(self):
+        resp = self.client.get("/api/tracks/", {"fields": "title,album.title,album.artist.name"})
+        self.assertEqual(
+            resp.data["results"][0],
+            {"title": "Sparse Track", "album": {"title": "Sparse Album", "artist": {"name": "Sparse Artist"}}},
+        )
+
+    def test_queryset_follows_projection(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get("/api/movies/", {"fields": "id,title,directors.name"})
+        self.assertEqual(resp.data["results"][0], {"id": self.movie.id, "title": "Sparse Movie", "directors": [{"name": "Sparse Director"}]})
+        sql = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('"bio"', sql)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get("/api/tracks/", {"fields": "id,title"})
+        sql = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn("music_album", sql)
+        self.assertNotIn("music_track_artists", sql)
+
+    def test_playlist_expand_and_default_shape(self):
+        from music.models import Playlist
+        playlist = Playlist.objects.create(user=self.user, name="Mix")
+        playlist.tracks.add(self.track)
+        self.client.force_authenticate(self.user)
+
+        resp = self.client.get(f"/api/playlists/{playlist.id}/", {"fields": "name,tracks.title"})
+        self.assertEqual(resp.data, {"name": "Mix", "tracks": [{"title": "Sparse Track"}]})
+        resp = self.client.get(f"/api/playlists/{playlist.id}/")
+        self.assertEqual(resp.data["tracks"][0]["album"]["artist"]["bio"], "Long bio")
+
+
+class QueryCountTests(APITestCase):
+    """Query counts per endpoint must not depend on how many rows a page holds"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username="counter", password="pass12345")
+        self.artist = Artist.objects.create(name="Counted")
+        self.genre = Genre.objects.create(name="Counted Genre")
+        self.movie_genre = MovieGenre.objects.create(name="Counted Genre")
+        self.director = Director.objects.create(name="Counted Director")
+        self.actor = Actor.objects.create(name="Counted Actor")
+        from music.models import Playlist
+        self.playlist = Playlist.objects.create(user=self.user, name="Counted")
+        self.client.force_authenticate(self.user)
+        # The viewer's favourite ids are cached per user, not per page
+        from accounts.favorites import favorite_tracks, favorite_movies
+        favorite_tracks.id_array(self.user.pk)
+        favorite_movies.id_array(self.user.pk)
+
+    def add_rows(self, count):
+        start = Track.objects.count()
+        for i in range(start, start + count):
+            album = Album.objects.create(title=f"Album {i}", artist=self.artist, release_year=2000)
+            album.genres.add(self.genre)
+            track = Track.objects.create(title=f"Track {i}", album=album, duration=100)
+            track.artists.add(self.artist)
+            self.playlist.tracks.add(track)
+            movie = Movie.objects.create(title=f"Movie {i}", description="d", release_year=2000, duration=90)
+            movie.genres.add(self.movie_genre)
+            movie.directors.add(self.director)
+            movie.actors.add(self.actor)
+
+    def assertConstantQueries(self, url, expected, params=None):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        counts = []
+        for rows in (2, 23):
+            self.add_rows(rows)
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.get(url, params or {})
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts, [expected, expected], url)
+
+    def test_track_endpoints(self):
+        # count, page, albums (+artist), album genres, track artists
+        self.assertConstantQueries("/api/tracks/", 5)
+
+    def test_track_serializer_path(self):
+        # count, page (+album, artist), album genres, track artists
+        self.assertConstantQueries("/api/tracks/", 4, {"expand": "album.artist,album.genres,artists"})
+
+    def test_album_endpoints(self):
+        # count, page, albums (+artist), genres
+        self.assertConstantQueries("/api/albums/", 4)
+        # count, page (+artist), genres
+        self.assertConstantQueries("/api/albums/", 3, {"expand": "artist,genres"})
+
+    def test_movie_endpoint(self):
+        # count, page, genres, directors, actors
+        self.assertConstantQueries("/api/movies/", 5)
+
+    def test_playlist_endpoint(self):
+        # user, count, page, tracks (+album, artist), album genres, track artists
+        self.assertConstantQueries("/api/playlists/", 5)
+        self.assertConstantQueries(f"/api/playlists/{self.playlist.id}/", 4)
+
+    def test_toggle_favorite(self):
+        self.add_rows(1)
+        track = Track.objects.get()
+        movie = Movie.objects.get()
+        # conditional delete, then conditional insert
+        with self.assertNumQueries(2):
+            self.client.post(f"/api/tracks/{track.id}/toggle_favorite/")
+        with self.assertNumQueries(2):
+            self.client.post(f"/api/movies/{movie.id}/toggle_favorite/")
+        # removing is the delete alone
+        with self.assertNumQueries(1):
+            self.client.post(f"/api/tracks/{track.id}/toggle_favorite/")
+
+
+class RepresentationCacheTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.artist = Artist.objects.create(name="Cached Artist")
+        self.genre = Genre.objects.create(name="Cached Genre")
+        self.album = Album.objects.create(title="Cached Album", artist=self.artist, release_year=2000)
+        self.track = Track.objects.create(title="Cached Track", album=self.album, duration=100)
+        self.track.artists.add(self.artist)
+        self.director = Director.objects.create(name="Cached Director")
+        self.movie = Movie.objects.create(title="Cached Movie", release_year=2000, duration=90)
+        self.movie.directors.add(self.director)
+
+    def test_warm_list_only_queries_the_page(self):
+        first = self.client.get("/api/tracks/").data
+        # count, page
+        with self.assertNumQueries(2):
+            second = self.client.get("/api/tracks/").data
+        self.assertEqual(first, second)
+
+    def test_warm_detail_skips_the_database(self):
+        url = f"/api/tracks/{self.track.id}/"
+        first = self.client.get(url).data
+        with self.assertNumQueries(0):
+            second = self.client.get(url).data
+        self.assertEqual(dict(first), second)
+
+    def test_related_edits_bump_versions(self):
+        self.client.get("/api/tracks/")
+        self.client.get(f"/api/albums/{self.album.id}/")
+        self.artist.name = "Renamed Artist"
+        self.artist.save()
+        self.album.genres.add(self.genre)
+
+        track = self.client.get("/api/tracks/").data["results"][0]
+        self.assertEqual(track["artists"][0]["name"], "Renamed Artist")
+        self.assertEqual(track["album"]["genres"], [{"id": self.genre.id, "name": "Cached Genre"}])
+        album = self.client.get(f"/api/albums/{self.album.id}/").data
+        self.assertEqual(album["artist"]["name"], "Renamed Artist")
+
+    def test_movie_people_edits_and_deletes(self):
+        self.client.get("/api/movies/")
+        self.director.name = "Renamed Director"
+        self.director.save()
+        self.assertEqual(self.client.get("/api/movies/").data["results"][0]["directors"][0]["name"], "Renamed Director")
+
+        url = f"/api/movies/{self.movie.id}/"
+        self.client.get(url)
+        self.movie.delete()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_fills_before_commit_are_retired(self):
+        from django.db import transaction
+        from api.views import track_representations
+        url = f"/api/tracks/{self.track.id}/"
+        stale = dict(self.client.get(url).data)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.track.title = "Committed Track"
+                self.track.save()
+                # Another worker, still reading the old row, refills the cache
+                hits, versions = track_representations.lookup([self.track.id])
+                track_representations.store({self.track.id: stale}, versions)
+        self.assertEqual(self.client.get(url).data["title"], "Committed Track")
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.artist = Artist.objects.create(name="Stamped Artist")
+        self.album = Album.objects.create(title="Stamped Album", artist=self.artist, release_year=2000)
+        self.track = Track.objects.create(title="Stamped Track", album=self.album, duration=100)
+
+    def test_list_returns_304_without_queries(self):
+        resp = self.client.get("/api/tracks/")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        etag = resp["ETag"]
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn("Last-Modified", resp)
+
+        with self.assertNumQueries(0):
+            resp = self.client.get("/api/tracks/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.assertNotEqual(self.client.get("/api/tracks/", {"page": 1})["ETag"], etag)
+        self.artist.name = "Restamped"
+        self.artist.save()
+        self.assertEqual(self.client.get("/api/tracks/", HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_detail_uses_object_stamp(self):
+        url = f"/api/albums/{self.album.id}/"
+        etag = self.client.get(url)["ETag"]
+        Track.objects.create(title="Elsewhere", duration=10)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.album.genres.add(Genre.objects.create(name="Stamped Genre"))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_if_modified_since(self):
+        resp = self.client.get(f"/api/tracks/{self.track.id}/")
+        resp = self.client.get(f"/api/tracks/{self.track.id}/", HTTP_IF_MODIFIED_SINCE=resp["Last-Modified"])
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_html_page_validators_follow_viewer_favorites(self):
+        user = User.objects.create_user(username="stamped", password="pass12345")
+        self.client.force_login(user)
+        etag = self.client.get("/music/tracks/")["ETag"]
+        self.assertEqual(self.client.get("/music/tracks/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        user.favorite_music.add(self.track)
+        self.assertEqual(self.client.get("/music/tracks/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_stamps_move_again_on_commit(self):
+        from django.db import transaction
+        url = f"/api/albums/{self.album.id}/"
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.album.genres.add(Genre.objects.create(name="Pending Genre"))
+                # Validators handed out before the commit
+                etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+
+class RendererTests(APITestCase):
+    def setUp(self):
+        artist = Artist.objects.create(name="Ünïcode Artist", bio="line\u2028separator")
+        self.album = Album.objects.create(title="Rendered", artist=artist, release_year=2000)
+        Track.objects.create(title="Rendered Track", album=self.album, duration=100, rating=4.25)
+
+    def test_fast_json_is_byte_compatible(self):
+        import datetime
+        import decimal
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import FastJSONRenderer
+
+        data = {
+            "text": "кириллица \u2028 \u2029 \"quoted\"",
+            "when": datetime.datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc),
+            "day": datetime.date(2024, 1, 2),
+            "price": decimal.Decimal("1.50"),
+            "values": [1, 2.5, None, True, {"nested": []}],
+            1: "int key",
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        resp = self.client.get("/api/tracks/")
+        self.assertEqual(resp.content, JSONRenderer().render(resp.data))
+
+    def test_msgpack_negotiation(self):
+        import msgpack
+        resp = self.client.get("/api/albums/", HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(resp.content), self.client.get("/api/albums/").json())
+
+    def test_msgpack_request_body(self):
+        import msgpack
+        user = User.objects.create_user(username="packer", password="pass12345")
+        self.client.force_authenticate(user)
+        resp = self.client.post(
+            "/api/playlists/", msgpack.packb({"name": "Packed", "track_ids": []}), content_type="application/msgpack",
+        )
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.data["name"], "Packed")
+
+
+class TieredCacheTests(APITestCase):
+    def make_cache(self, **options):
+        from catalog.cache import TieredCache
+        options.setdefault("L2", "shared")
+        tiered = TieredCache(None, {"OPTIONS": options, "KEY_PREFIX": "tiered-test"})
+        self.addCleanup(tiered.clear)
+        return tiered
+
+    def test_l1_serves_reads_and_is_bounded(self):
+        from unittest import mock
+        tiered = self.make_cache(L1_MAX_ENTRIES=2)
+        for key in ("a", "b", "c"):
+            tiered.set(key, key.upper(), 60)
+        with mock.patch.object(tiered.l2, "get", wraps=tiered.l2.get) as l2_get:
+            self.assertEqual(tiered.get("c"), "C")
+            self.assertEqual(l2_get.call_count, 0)
+            # "a" was evicted from L1 and comes back from the shared tier
+            self.assertEqual(tiered.get("a"), "A")
+            self.assertEqual(l2_get.call_count, 1)
+
+    def test_serves_stale_when_shared_tier_is_down(self):
+        import time
+        from unittest import mock
+        tiered = self.make_cache(L1_TIMEOUT=0.05, STALE_TIMEOUT=60)
+        tiered.set("key", {"v": 1}, 60)
+        time.sleep(0.06)
+        with mock.patch.object(tiered.l2, "get", side_effect=ConnectionError):
+            self.assertEqual(tiered.get("key"), {"v": 1})
+            self.assertIsNone(tiered.get("unknown"))
+        with mock.patch.object(tiered.l2, "get_many", side_effect=ConnectionError):
+            self.assertEqual(tiered.get_many(["key", "unknown"]), {"key": {"v": 1}})
+
+    def test_l2_only_prefixes_skip_l1(self):
+        from unittest import mock
+        tiered = self.make_cache(L2_ONLY_PREFIXES=("stamp:",))
+        tiered.set_many({"stamp:a": 1, "other": 1}, 60)
+        # Another worker moves both keys in the shared tier
+        tiered.l2.set_many({"stamp:a": 2, "other": 2}, 60)
+        self.assertEqual(tiered.get("stamp:a"), 2)
+        self.assertEqual(tiered.get_many(["stamp:a", "other"]), {"stamp:a": 2, "other": 1})
+        tiered.add("stamp:b", 1, 60)
+        tiered.incr("stamp:b")
+        with mock.patch.object(tiered.l2, "get", side_effect=ConnectionError):
+            # Nothing was kept in L1 to fall back on
+            self.assertIsNone(tiered.get("stamp:b"))
+            self.assertEqual(tiered.get("other"), 1)
+
+    def test_stamps_and_versions_are_l2_only(self):
+        from django.core.cache import cache
+        from catalog import conditional, query_cache, representations
+        from catalog.cache import shared_cache
+        for key in (conditional._key(Track), representations._version_key(Track, 1), query_cache._generation_key(Track)):
+            cache.set(key, 1, None)
+            shared_cache().set(key, 2, None)
+            self.assertEqual(cache.get(key), 2, key)
+
+    def test_incr_goes_through_shared_tier(self):
+        tiered = self.make_cache()
+        with self.assertRaises(ValueError):
+            tiered.incr("counter")
+        tiered.set("counter", 1, 60)
+        self.assertEqual(tiered.incr("counter"), 2)
+        self.assertEqual(tiered.l2.get("counter"), 2)
+        self.assertEqual(tiered.get("counter"), 2)
+
+    def test_memoize_single_flight_and_soft_expiry(self):
+        import time
+        from django.core.cache import cache
+        from catalog.cache import memoize
+        cache.clear()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(memoize("memo-key", compute, timeout=60, soft_timeout=0.05), 1)
+        self.assertEqual(memoize("memo-key", compute, timeout=60, soft_timeout=0.05), 1)
+        self.assertEqual(len(calls), 1)
+        time.sleep(0.06)
+        # Past the soft TTL the old value is returned while it is refreshed
+        self.assertEqual(memoize("memo-key", compute, timeout=60, soft_timeout=0.05), 1)
+        self.assertEqual(memoize("memo-key", compute, timeout=60, soft_timeout=0.05), 2)
+
+        # Another worker holds the lock for a cold key: wait for its result
+        cache.add("memo:lock:cold-key", 1, 30)
+        self.assertEqual(memoize("cold-key", compute, timeout=60, wait=0.1), 3)
+
+    def test_health_reports_shared_tier(self):
+        response = self.client.get("/api/health/detailed/")
+        self.assertEqual(response.data["checks"]["shared_cache"], "ok")
+
+
+class ChartTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.artist = Artist.objects.create(name="Chart Artist")
+        self.rock = Genre.objects.create(name="Chart Rock")
+        self.album = Album.objects.create(title="Chart Album", artist=self.artist, release_year=2000)
+        self.album.genres.add(self.rock)
+        self.tracks = [
+            Track.objects.create(title=f"Chart {i:02d}", album=self.album, duration=100, rating=i)
+            for i in range(25)
+        ]
+        self.single = Track.objects.create(title="Single", duration=100, rating=4.5)
+        self.single.artists.add(self.artist)
+
+    def titles(self, params=None):
+        return [entry["title"] for entry in self.client.get("/api/charts/", params or {}).data["results"]]
+
+    def test_home_renders_without_queries(self):
+        self.client.get("/")
+        with self.assertNumQueries(0):
+            response = self.client.get("/")
+        self.assertContains(response, "Chart 24")
+        self.assertNotContains(response, "Chart 14")
+
+    def test_rating_changes_move_entries_incrementally(self):
+        self.assertEqual(self.titles()[:2], ["Chart 24", "Chart 23"])
+        low = self.tracks[0]
+        low.rating = 100
+        low.save()
+        demoted = self.tracks[24]
+        demoted.rating = -1
+        demoted.save()
+        with self.assertNumQueries(0):
+            titles = self.titles()
+        self.assertEqual(titles[:2], ["Chart 00", "Chart 23"])
+        self.assertNotIn("Chart 24", titles)
+        self.assertEqual(self.titles({"genre": self.rock.id})[:2], ["Chart 00", "Chart 23"])
+
+    def test_board_matches_database_after_many_changes(self):
+        self.titles()
+        self.titles({"genre": self.rock.id})
+        for track in self.tracks[10:]:
+            track.rating = 0
+            track.save()
+        self.tracks[3].delete()
+        expected = list(
+            Track.objects.order_by("-rating", "title", "id").values_list("title", flat=True)[:10]
+        )
+        self.assertEqual(self.titles(), expected)
+        self.assertEqual(self.titles({"limit": 3}), expected[:3])
+
+    def test_genre_boards_follow_membership(self):
+        self.assertNotIn("Single", self.titles({"genre": self.rock.id}))
+        self.single.rating = 50
+        self.single.save()
+        self.assertEqual(self.client.get("/api/charts/").data["results"][0]["artist"], "Chart Artist")
+        album = Album.objects.create(title="Chart Single", artist=self.artist, release_year=2001)
+        self.single.album = album
+        self.single.rating = 99
+        self.single.save()
+        self.assertNotIn("Single", self.titles({"genre": self.rock.id}))
+        album.genres.add(self.rock)
+        self.assertEqual(self.titles({"genre": self.rock.id})[0], "Single")
+        self.assertEqual(self.client.get("/api/charts/").data["results"][0]["album_title"], "Chart Single")
+
+    def test_rejects_bad_genre(self):
+        response = self.client.get("/api/charts/", {"genre": "rock"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FacetTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.beatles = Artist.objects.create(name="The Beatles")
+        self.beach = Artist.objects.create(name="Beach House")
+        self.genre = Genre.objects.create(name="Facet Pop")
+        album = Album.objects.create(title="Facet Album", artist=self.beatles, release_year=1965)
+        album.genres.add(self.genre)
+        for i in range(3):
+            Track.objects.create(title=f"Facet {i}", album=album, duration=100).artists.add(self.beatles)
+        Movie.objects.create(title="Facet Movie", release_year=1999, duration=90)
+
+    def test_artist_search_with_counts(self):
+        results = self.client.get("/api/facets/artists/", {"q": "bea"}).data["results"]
+        # Prefix matches on the normalised name come before inner matches
+        self.assertEqual([r["name"] for r in results], ["Beach House", "The Beatles"])
+        self.assertEqual(results[1]["count"], 3)
+        with self.assertNumQueries(0):
+            self.client.get("/api/facets/artists/", {"q": "the"})
+        self.assertEqual(self.client.get("/api/facets/nope/").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_writes_invalidate_options(self):
+        self.assertEqual(self.client.get("/api/facets/music-genres/").data["results"][0]["count"], 3)
+        Track.objects.create(title="Facet 3", album=Album.objects.get(), duration=100)
+        self.assertEqual(self.client.get("/api/facets/music-genres/").data["results"][0]["count"], 4)
+        Movie.objects.create(title="Facet Sequel", release_year=1999, duration=90)
+        years = self.client.get("/api/facets/movie-years/").data["results"]
+        self.assertEqual(years, [{"id": 1999, "name": 1999, "count": 2}])
+
+    def test_list_pages_use_cached_facets(self):
+        self.client.get("/music/tracks/")
+        self.client.get("/movies/")
+        from catalog.facets import FACETS
+        from unittest import mock
+        with mock.patch.object(FACETS["music-genres"], "compute") as compute:
+            response = self.client.get("/music/tracks/", {"sort": "-title"})
+        compute.assert_not_called()
+        self.assertContains(response, "Facet Pop (3)")
+        self.assertNotContains(response, "Beach House")
+        self.assertContains(self.client.get("/movies/", {"sort": "title"}), "1999 (1)")
+
+
+class FavoriteTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username="fan", password="TestPass123")
+        album = Album.objects.create(title="Fav Album", artist=Artist.objects.create(name="Fav Artist"), release_year=2001)
+        self.tracks = [Track.objects.create(title=f"Fav {i}", album=album, duration=100) for i in range(3)]
+        self.movie = Movie.objects.create(title="Fav Movie", release_year=2001, duration=90)
+        self.client.force_authenticate(self.user)
+
+    def test_toggle(self):
+        track = self.tracks[0]
+        url = f"/api/tracks/{track.id}/toggle_favorite/"
+        self.assertTrue(self.client.post(url).data["is_favorited"])
+        self.assertTrue(self.user.favorite_music.filter(pk=track.pk).exists())
+        self.assertFalse(self.client.post(url).data["is_favorited"])
+        self.assertFalse(self.user.favorite_music.exists())
+        response = self.client.post("/api/movies/999/toggle_favorite/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(self.user.favorite_movies.exists())
+
+    def test_reversed_popularity_ordering(self):
+        for track, count in zip(self.tracks, (5, 0, 5)):
+            Track.objects.filter(pk=track.pk).update(favorite_count=count)
+        ids = [t["id"] for t in self.client.get("/api/tracks/", {"ordering": "-popularity"}).data["results"]]
+        self.assertEqual(ids, [self.tracks[1].id, self.tracks[2].id, self.tracks[0].id])
+
+    def test_toggle_sends_m2m_changed(self):
+        from django.db.models.signals import m2m_changed
+        seen = []
+
+        def receiver(sender, action, pk_set, **kwargs):
+            seen.append((action, pk_set))
+        m2m_changed.connect(receiver, sender=User.favorite_movies.through)
+        try:
+            self.client.post(f"/api/movies/{self.movie.id}/toggle_favorite/")
+            self.client.post(f"/api/movies/{self.movie.id}/toggle_favorite/")
+        finally:
+            m2m_changed.disconnect(receiver, sender=User.favorite_movies.through)
+        self.assertEqual(seen, [("post_add", {self.movie.id}), ("post_remove", {self.movie.id})])
+
+    def test_bulk_add_remove_replace(self):
+        first, second, third = (track.id for track in self.tracks)
+        response = self.client.post("/api/favorites/", {"tracks": [first, second, 999], "movies": [self.movie.id]},
+                                    format="json")
+        self.assertEqual(response.data["tracks"], {"added": [first, second], "removed": []})
+        self.assertEqual(response.data["movies"], {"added": [self.movie.id], "removed": []})
+        # Already stored ids are not reported again
+        response = self.client.post("/api/favorites/", {"tracks": [first]}, format="json")
+        self.assertEqual(response.data, {"tracks": {"added": [], "removed": []}})
+
+        # savepoint, delete the rest, insert the new ones, release
+        with self.assertNumQueries(4):
+            response = self.client.put("/api/favorites/", {"tracks": [second, third]}, format="json")
+        self.assertEqual(response.data["tracks"], {"added": [third], "removed": [first]})
+        self.assertEqual(set(self.user.favorite_music.values_list("pk", flat=True)), {second, third})
+
+        with self.assertNumQueries(1):
+            response = self.client.delete("/api/favorites/", {"tracks": [second, first]}, format="json")
+        self.assertEqual(response.data["tracks"], {"added": [], "removed": [second]})
+        self.assertEqual(self.user.favorite_movies.get(), self.movie)
+
+    def test_bulk_validation(self):
+        for body in ({}, {"tracks": ["x"]}, {"movies": [0]}, {"tracks": list(range(1, 502))}):
+            response = self.client.post("/api/favorites/", body, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+        self.client.force_authenticate(None)
+        response = self.client.post("/api/favorites/", {"tracks": [1]}, format="json")
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+
+class FavoriteCountTests(APITransactionTestCase):
+    """Counter deltas wait for commits, so these tests run without a wrapping transaction"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from catalog.counters import flush_all
+        cache.clear()
+        self.addCleanup(flush_all)
+        self.users = [User.objects.create_user(username=f"fan{i}", password="TestPass123") for i in range(3)]
+        album = Album.objects.create(title="Popular", artist=Artist.objects.create(name="Popular"), release_year=2001)
+        self.tracks = [Track.objects.create(title=f"Popular {i}", album=album, duration=100) for i in range(3)]
+        self.movies = [Movie.objects.create(title=f"Popular {i}", release_year=2001, duration=90) for i in range(2)]
+
+    def counts(self, model):
+        return dict(model.objects.order_by("pk").values_list("pk", "favorite_count"))
+
+    def test_toggles_are_buffered_then_flushed_in_one_update(self):
+        from accounts.favorites import favorite_tracks
+        track = self.tracks[0]
+        for user in self.users:
+            self.client.force_authenticate(user)
+            self.client.post(f"/api/tracks/{track.id}/toggle_favorite/")
+        self.client.post(f"/api/tracks/{self.tracks[1].id}/toggle_favorite/")
+        # Nothing has touched the counted rows yet
+        self.assertEqual(Track.objects.get(pk=track.pk).favorite_count, 0)
+        self.assertEqual(favorite_tracks.counts.pending(), {track.id: 3, self.tracks[1].id: 1})
+        # savepoint, one UPDATE per distinct delta, release
+        with self.assertNumQueries(4):
+            self.assertEqual(favorite_tracks.counts.flush(), [track.id, self.tracks[1].id])
+        self.assertEqual(self.counts(Track), {track.id: 3, self.tracks[1].id: 1, self.tracks[2].id: 0})
+        self.client.post(f"/api/tracks/{track.id}/toggle_favorite/")
+        favorite_tracks.counts.flush()
+        self.assertEqual(Track.objects.get(pk=track.pk).favorite_count, 2)
+
+    def test_rolled_back_changes_are_not_counted(self):
+        from django.db import transaction
+        from accounts.favorites import favorite_tracks
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.users[0].favorite_music.add(self.tracks[0])
+            raise RuntimeError
+        self.assertEqual(favorite_tracks.counts.pending(), {})
+
+    def test_flush_inside_a_rolled_back_block_keeps_the_deltas(self):
+        from django.db import transaction
+        from accounts.favorites import favorite_tracks
+        self.users[0].favorite_music.add(self.tracks[0])
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.assertEqual(favorite_tracks.counts.flush(), [])
+            raise RuntimeError
+        self.assertEqual(favorite_tracks.counts.pending(), {self.tracks[0].id: 1})
+        with transaction.atomic():
+            favorite_tracks.counts.flush()
+            self.assertEqual(Track.objects.get(pk=self.tracks[0].pk).favorite_count, 0)
+        # Written once the enclosing block commits
+        self.assertEqual(Track.objects.get(pk=self.tracks[0].pk).favorite_count, 1)
+
+    def test_flushes_when_due(self):
+        from django.test import override_settings
+        with override_settings(COUNTER_FLUSH_SIZE=1):
+            self.users[0].favorite_movies.add(self.movies[0])
+        self.assertEqual(Movie.objects.get(pk=self.movies[0].pk).favorite_count, 1)
+
+    def test_every_m2m_path_is_counted(self):
+        from catalog.counters import flush_all
+        movie, other = self.movies
+        self.users[0].favorite_movies.add(movie, other)
+        movie.favored_by_users.add(self.users[1], self.users[2])
+        flush_all()
+        self.assertEqual(self.counts(Movie), {movie.id: 3, other.id: 1})
+
+        self.users[0].favorite_movies.clear()
+        flush_all()
+        self.assertEqual(self.counts(Movie), {movie.id: 2, other.id: 0})
+        movie.favored_by_users.remove(self.users[1])
+        self.users[2].delete()
+        flush_all()
+        self.assertEqual(self.counts(Movie), {movie.id: 0, other.id: 0})
+
+    def test_reconcile_repairs_drift(self):
+        from io import StringIO
+        from django.core.management import call_command
+        self.users[0].favorite_music.add(*self.tracks[:2])
+        Track.objects.filter(pk=self.tracks[2].pk).update(favorite_count=7)
+        out = StringIO()
+        call_command("reconcile_favorite_counts", stdout=out)
+        # Pending deltas are flushed first; only the tampered row has drifted
+        self.assertIn("Repaired 1 tracks", out.getvalue())
+        self.assertEqual(self.counts(Track), {self.tracks[0].id: 1, self.tracks[1].id: 1, self.tracks[2].id: 0})
+
+    def test_popularity_ordering(self):
+        from catalog.counters import flush_all
+        first, second, third = self.tracks
+        for user in self.users:
+            user.favorite_music.add(third)
+        self.users[0].favorite_music.add(second)
+        self.users[0].favorite_movies.add(self.movies[1])
+        flush_all()
+        ids = [t["id"] for t in self.client.get("/api/tracks/", {"ordering": "popularity"}).data["results"]]
+        self.assertEqual(ids, [third.id, second.id, first.id])
+        cursor_page = self.client.get("/api/tracks/", {"ordering": "popularity", "cursor": ""}).data["results"]
+        self.assertEqual([t["id"] for t in cursor_page], [third.id, second.id, first.id])
+        movies = self.client.get("/api/movies/", {"ordering": "popularity"}).data["results"]
+        self.assertEqual([m["id"] for m in movies], [self.movies[1].id, self.movies[0].id])
+
+        page = self.client.get("/music/tracks/", {"sort": "popularity"}).context["page_obj"]
+        self.assertEqual([t.id for t in page], [third.id, second.id, first.id])
+        # A flush retires the cached page ids
+        self.users[1].favorite_music.add(first)
+        self.users[2].favorite_music.add(first)
+        flush_all()
+        page = self.client.get("/music/tracks/", {"sort": "popularity"}).context["page_obj"]
+        self.assertEqual([t.id for t in page], [third.id, first.id, second.id])
+
+
+class FavoriteIdsTests(APITransactionTestCase):
+    """Cached id arrays are only stored from committed rows, so these tests really commit"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from catalog.counters import flush_all
+        cache.clear()
+        self.addCleanup(flush_all)
+        self.user = User.objects.create_user(username="marker", password="TestPass123")
+        self.other = User.objects.create_user(username="viewer", password="TestPass123")
+        album = Album.objects.create(title="Marked", artist=Artist.objects.create(name="Marked"), release_year=2001)
+        self.tracks = [Track.objects.create(title=f"Marked {i}", album=album, duration=100) for i in range(3)]
+        self.movie = Movie.objects.create(title="Marked", release_year=2001, duration=90)
+
+    def test_ids_endpoint_follows_changes(self):
+        from accounts.favorites import favorite_tracks
+        self.client.force_authenticate(self.user)
+        response = self.client.get("/api/favorites/ids/")
+        self.assertEqual(response.data, {"tracks": [], "movies": []})
+        self.assertIn("private", response["Cache-Control"])
+
+        self.client.post("/api/favorites/", {"tracks": [self.tracks[2].id, self.tracks[0].id]}, format="json")
+        self.client.post(f"/api/movies/{self.movie.id}/toggle_favorite/")
+        response = self.client.get("/api/favorites/ids/")
+        self.assertEqual(response.data, {"tracks": [self.tracks[0].id, self.tracks[2].id], "movies": [self.movie.id]})
+        # Refilled once, then served from the cache without touching the database
+        with self.assertNumQueries(0):
+            self.client.get("/api/favorites/ids/")
+        etag = response["ETag"]
+        self.assertEqual(self.client.get("/api/favorites/ids/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.tracks[0].favored_by_users.clear()
+        self.tracks[2].delete()
+        self.assertEqual(favorite_tracks.id_array(self.user.pk).tolist(), [])
+        self.assertEqual(self.client.get("/api/favorites/ids/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_fill_racing_a_commit_is_not_served(self):
+        from unittest import mock
+        from accounts import favorites
+        from accounts.favorites import favorite_tracks
+        pack = favorites.pack
+
+        def pack_then_commit_a_change(ids):
+            packed = pack(ids)
+            if not self.user.favorite_music.exists():
+                # Another request commits a favourite after the fill read the rows
+                self.user.favorite_music.add(self.tracks[1])
+            return packed
+
+        with mock.patch.object(favorites, "pack", pack_then_commit_a_change):
+            self.assertEqual(favorite_tracks.id_array(self.user.pk).tolist(), [])
+        self.assertEqual(favorite_tracks.id_array(self.user.pk).tolist(), [self.tracks[1].id])
+
+    def test_rolled_back_changes_never_reach_the_cache(self):
+        from django.db import transaction
+        from accounts.favorites import favorite_tracks
+        self.assertEqual(favorite_tracks.id_array(self.user.pk).tolist(), [])
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.user.favorite_music.add(self.tracks[0])
+            # The transaction sees its own row, but does not cache it
+            self.assertEqual(favorite_tracks.id_array(self.user.pk).tolist(), [self.tracks[0].id])
+            raise RuntimeError
+        self.assertEqual(favorite_tracks.id_array(self.user.pk).tolist(), [])
+
+        with transaction.atomic():
+            self.user.favorite_music.add(self.tracks[0])
+            favorite_tracks.id_array(self.user.pk)
+        self.assertEqual(favorite_tracks.id_array(self.user.pk).tolist(), [self.tracks[0].id])
+
+    def test_rolled_back_savepoint_leaves_nothing_pending(self):
+        from django.core.cache import cache
+        from django.db import transaction
+        from accounts.favorites import favorite_tracks
+        with transaction.atomic():
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.user.favorite_music.add(self.tracks[0])
+                raise RuntimeError
+            self.assertEqual(favorite_tracks.id_array(self.user.pk).tolist(), [])
+        # The fill inside the outer transaction was stored
+        with self.assertNumQueries(0):
+            self.assertEqual(favorite_tracks.id_array(self.user.pk).tolist(), [])
+
+        with transaction.atomic():
+            with transaction.atomic():
+                self.user.favorite_music.add(self.tracks[1])
+            # A released savepoint is still uncommitted
+            self.assertEqual(favorite_tracks.id_array(self.user.pk).tolist(), [self.tracks[1].id])
+            _, stored = cache.get(favorite_tracks._ids_key(self.user.pk))
+            self.assertEqual(stored.tolist(), [])
+
+    def test_other_workers_bumps_are_seen_at_once(self):
+        import time
+        from accounts.favorites import favorite_tracks
+        from catalog.cache import shared_cache
+        self.assertEqual(favorite_tracks.id_array(self.user.pk).tolist(), [])
+        # Another worker stores a favourite and bumps the version in the shared tier only
+        self.user.favorite_music.through.objects.create(customuser=self.user, track=self.tracks[1])
+        shared_cache().set(favorite_tracks._version_key(self.user.pk), time.time_ns(), None)
+        self.assertEqual(favorite_tracks.id_array(self.user.pk).tolist(), [self.tracks[1].id])
+
+    def test_api_marks_favorites_per_viewer(self):
+        from django.core.cache import cache
+        self.user.favorite_music.add(self.tracks[1])
+        self.client.force_authenticate(self.user)
+        marked = {t["id"]: t["is_favorited"] for t in self.client.get("/api/tracks/").data["results"]}
+        self.assertEqual(marked, {self.tracks[0].id: False, self.tracks[1].id: True, self.tracks[2].id: False})
+        # The shared representation entry carries no viewer state
+        _, cached = cache.get(f"rep:music.track:{self.tracks[1].id}")
+        self.assertNotIn("is_favorited", cached)
+        self.assertTrue(self.client.get(f"/api/tracks/{self.tracks[1].id}/").data["is_favorited"])
+        mine = self.client.get("/api/tracks/")["ETag"]
+
+        self.client.force_authenticate(self.other)
+        response = self.client.get("/api/tracks/")
+        self.assertNotEqual(response["ETag"], mine)
+        self.assertFalse(any(t["is_favorited"] for t in response.data["results"]))
+        self.client.force_authenticate(None)
+        self.assertFalse(self.client.get(f"/api/movies/{self.movie.id}/").data["is_favorited"])
+        self.assertNotIn("is_favorited", self.client.get("/api/tracks/", {"fields": "id,title"}).data["results"][0])
+
+    def test_html_pages_mark_favorites_from_the_cached_set(self):
+        from accounts.favorites import favorite_tracks, favorite_movies
+        self.user.favorite_music.add(self.tracks[0])
+        self.user.favorite_movies.add(self.movie)
+        self.client.force_login(self.user)
+        favorite_tracks.id_array(self.user.pk)
+        favorite_movies.id_array(self.user.pk)
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f"/music/tracks/{self.tracks[0].id}/")
+        self.assertTrue(response.context["is_favorited"])
+        self.assertFalse(any("favorite_music" in query["sql"] for query in ctx.captured_queries))
+        self.assertTrue(self.client.get(f"/movies/{self.movie.id}/").context["is_favorited"])
+        album = self.client.get(f"/music/albums/{self.tracks[0].album_id}/").context["tracks"]
+        self.assertEqual([t.is_favorited for t in album], [True, False, False])
+        page = self.client.get("/music/tracks/").context["page_obj"]
+        self.assertEqual({t.id for t in page if t.is_favorited}, {self.tracks[0].id})
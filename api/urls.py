@@ -3,6 +3,11 @@ from rest_framework.routers import DefaultRouter
 from .views import TrackViewSet, AlbumViewSet, PlaylistViewSet, MovieViewSet, ReviewViewSet
 from .auth_views import api_register, api_login, api_logout, api_user_info
 from .health_views import health_check, health_detailed, health_ready, health_live
+from .search_views import autocomplete, search
+from .export_views import export
+from .chart_views import charts
+from .facet_views import facet_options
+from .favorite_views import favorites, favorite_ids
 
 router = DefaultRouter()
 router.register(r'tracks', TrackViewSet, basename='track')
@@ -18,6 +23,18 @@ urlpatterns = [
     path('auth/login/', api_login, name='api-login'),
     path('auth/logout/', api_logout, name='api-logout'),
     path('auth/user/', api_user_info, name='api-user-info'),
+    # Search endpoints
+    path('autocomplete/', autocomplete, name='api-autocomplete'),
+    path('search/', search, name='api-search'),
+    # Bulk favourites
+    path('favorites/', favorites, name='api-favorites'),
+    path('favorites/ids/', favorite_ids, name='api-favorite-ids'),
+    # Filter options
+    path('facets/<str:name>/', facet_options, name='api-facet-options'),
+    # Leaderboards
+    path('charts/', charts, name='api-charts'),
+    # Streaming exports
+    path('export/<str:resource>.<str:fmt>', export, name='api-export'),
     # Health check endpoints
     path('health/', health_check, name='api-health'),
     path('health/detailed/', health_detailed, name='api-health-detailed'),
@@ -1,39 +1,106 @@
-from rest_framework import viewsets, permissions, filters
+from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
+from django.db.models import Prefetch, prefetch_related_objects
 from django_filters.rest_framework import DjangoFilterBackend
-from music.models import Track, Album, Playlist
-from music.serializers import TrackSerializer, AlbumSerializer, PlaylistSerializer
-from movies.models import Movie, Review
+from music import playlists
+from music.models import Track, Album, Artist, Genre, Playlist, PlaylistTrack
+from music.serializers import TrackSerializer, AlbumSerializer, PlaylistSerializer, PlaylistEntrySerializer
+from movies.models import Movie, Review, Genre as MovieGenre, Director, Actor
+from music.search import track_index
+from music.projections import serialize_tracks, serialize_albums
+from catalog.conditional import ConditionalGetMixin
+from catalog.flex_fields import FlexFieldsViewMixin, request_spec
+from catalog.representations import CachedRepresentationMixin, RepresentationCache
+from movies.search import movie_index
+from accounts.favorites import favorite_tracks, favorite_movies
 from .serializers import MovieSerializer, ReviewSerializer
+from .filters import IndexedSearchFilter, RelevanceOrderingFilter
 
 """Music API viewsets only for this project scope."""
 
-class TrackViewSet(viewsets.ModelViewSet):
+
+def track_queryset():
+    """Tracks with everything TrackSerializer renders loaded up front"""
+    return Track.objects.select_related('album__artist').prefetch_related('album__genres', 'artists')
+
+
+def serialize_movies(movies):
+    prefetch_related_objects(movies, 'genres', 'directors', 'actors')
+    return MovieSerializer(movies, many=True).data
+
+
+def _toggle(favorites, user, pk):
+    is_favorited = favorites.toggle(user, int(pk)) if str(pk).isdigit() else None
+    if is_favorited is None:
+        raise NotFound()
+    return is_favorited
+
+
+class FavoritesMixin:
+    """
+    Adds the viewer's ``is_favorited`` to every item of ``favorites`` on the
+    way out, so the cached representations stay the same for every user.
+    """
+    favorites = None
+    per_viewer = True
+
+    def mark_favorites(self, items, favorite_ids):
+        for item in items:
+            if isinstance(item, dict) and 'id' in item:
+                item['is_favorited'] = item['id'] in favorite_ids
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        fields, _ = request_spec(request)
+        data = getattr(response, 'data', None)
+        if (
+            self.action in ('list', 'retrieve') and response.status_code == 200
+            and (fields is None or 'is_favorited' in fields) and isinstance(data, (dict, list))
+        ):
+            # Copies: the dicts may be shared with the representation cache
+            if isinstance(data, list):
+                data = response.data = [dict(item) for item in data]
+            elif isinstance(data.get('results'), list):
+                data = response.data = {**data, 'results': [dict(item) for item in data['results']]}
+            else:
+                data = response.data = dict(data)
+            items = data if isinstance(data, list) else data.get('results', [data])
+            self.mark_favorites(items, self.favorites.ids(request.user))
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+track_representations = RepresentationCache(Track, serialize_tracks)
+album_representations = RepresentationCache(Album, serialize_albums)
+movie_representations = RepresentationCache(Movie, serialize_movies)
+
+
+class TrackViewSet(FavoritesMixin, ConditionalGetMixin, CachedRepresentationMixin, FlexFieldsViewMixin,
+                   viewsets.ModelViewSet):
     queryset = Track.objects.all()
+    favorites = favorite_tracks
+    representations = track_representations
+    stamp_models = (Track, Album, Artist, Genre)
     serializer_class = TrackSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, RelevanceOrderingFilter]
     filterset_fields = ['album__genres', 'artists']
     search_fields = ['title', 'album__title', 'artists__name']
-    ordering_fields = ['title', 'album__title']
+    search_index = track_index
+    ordering_fields = ['title', 'album__title', 'favorite_count']
+    ordering_aliases = {'popularity': ['-favorite_count', 'id']}
     ordering = ['title']
-    
+
+    def get_queryset(self):
+        return self.project(track_queryset())
+
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def toggle_favorite(self, request, pk=None):
-        track = self.get_object()
-        user = request.user
-        
-        if user.favorite_music.filter(id=track.id).exists():
-            user.favorite_music.remove(track)
-            is_favorited = False
-        else:
-            user.favorite_music.add(track)
-            is_favorited = True
-        
-        return Response({'is_favorited': is_favorited})
-
-class AlbumViewSet(viewsets.ModelViewSet):
+        return Response({'is_favorited': _toggle(favorite_tracks, request.user, pk)})
+
+class AlbumViewSet(ConditionalGetMixin, CachedRepresentationMixin, FlexFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Album.objects.all()
+    representations = album_representations
+    stamp_models = (Album, Artist, Genre)
     serializer_class = AlbumSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['genres', 'artist', 'release_year']
@@ -41,39 +108,100 @@ class AlbumViewSet(viewsets.ModelViewSet):
     ordering_fields = ['title', 'release_year']
     ordering = ['-release_year']
 
+    def get_queryset(self):
+        return self.project(Album.objects.select_related('artist').prefetch_related('genres'))
+
+
 # Reviews are out of scope for Music app in this repo
 
-class PlaylistViewSet(viewsets.ModelViewSet):
+class PlaylistViewSet(FavoritesMixin, FlexFieldsViewMixin, viewsets.ModelViewSet):
     serializer_class = PlaylistSerializer
     permission_classes = [permissions.IsAuthenticated]
+    favorites = favorite_tracks
+
+    def mark_favorites(self, items, favorite_ids):
+        # Playlists themselves are not favourites; their tracks are
+        for playlist in items:
+            super().mark_favorites(playlist.get('tracks', []), favorite_ids)
     
     def get_queryset(self):
-        return Playlist.objects.filter(user=self.request.user)
+        queryset = Playlist.objects.filter(user=self.request.user).order_by('pk')
+        if self.action in ('update', 'partial_update'):
+            # Edits only need the row; the response is read back after saving
+            return queryset
+        return self.project(self._with_tracks(queryset))
+
+    def _with_tracks(self, queryset):
+        tracks = track_queryset().order_by(*PlaylistTrack.TRACK_ORDER)
+        return queryset.prefetch_related(Prefetch('tracks', queryset=tracks))
+
+    def _reload(self, serializer):
+        serializer.instance = self._with_tracks(Playlist.objects.filter(pk=serializer.instance.pk)).get()
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+        self._reload(serializer)
 
+    def perform_update(self, serializer):
+        serializer.save()
+        self._reload(serializer)
 
-class MovieViewSet(viewsets.ModelViewSet):
+    def _entry(self, request, pk):
+        # Edits never render the playlist, so skip get_queryset()'s prefetches
+        playlist = Playlist.objects.filter(user=request.user, pk=pk).first() if str(pk).isdigit() else None
+        if playlist is None:
+            raise NotFound()
+        serializer = PlaylistEntrySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return playlist, serializer.validated_data['track_id'], serializer.validated_data.get('index')
+
+    @action(detail=True, methods=['post'])
+    def insert(self, request, pk=None):
+        playlist, track_id, index = self._entry(request, pk)
+        if not Track.objects.filter(pk=track_id).exists():
+            raise NotFound()
+        if not playlists.insert(playlist, track_id, index):
+            raise ValidationError({'track_id': ['This track is already in the playlist.']})
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def move(self, request, pk=None):
+        playlist, track_id, index = self._entry(request, pk)
+        if index is None:
+            raise ValidationError({'index': ['This field is required.']})
+        if not playlists.move(playlist, track_id, index):
+            raise NotFound()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def remove(self, request, pk=None):
+        playlist, track_id, _ = self._entry(request, pk)
+        if not playlists.remove(playlist, track_id):
+            raise NotFound()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MovieViewSet(FavoritesMixin, ConditionalGetMixin, CachedRepresentationMixin, FlexFieldsViewMixin,
+                   viewsets.ModelViewSet):
     queryset = Movie.objects.all()
+    favorites = favorite_movies
+    representations = movie_representations
+    stamp_models = (Movie, MovieGenre, Director, Actor)
     serializer_class = MovieSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, RelevanceOrderingFilter]
     filterset_fields = ["genres__name", "release_year", "directors__name", "actors__name"]
     search_fields = ["title", "description", "directors__name", "actors__name"]
-    ordering_fields = ["title", "release_year", "rating"]
+    search_index = movie_index
+    ordering_fields = ["title", "release_year", "rating", "favorite_count"]
+    ordering_aliases = {"popularity": ["-favorite_count", "id"]}
     ordering = ["-release_year"]
 
+    def get_queryset(self):
+        return self.project(Movie.objects.prefetch_related("genres", "directors", "actors"))
+
     @action(detail=True, methods=["post"], permission_classes=[permissions.IsAuthenticated])
     def toggle_favorite(self, request, pk=None):
-        movie = self.get_object()
-        user = request.user
-        if user.favorite_movies.filter(id=movie.id).exists():
-            user.favorite_movies.remove(movie)
-            is_favorited = False
-        else:
-            user.favorite_movies.add(movie)
-            is_favorited = True
-        return Response({"is_favorited": is_favorited})
+        return Response({"is_favorited": _toggle(favorite_movies, request.user, pk)})
 
 
 class ReviewViewSet(viewsets.ModelViewSet):
@@ -85,7 +213,8 @@ class ReviewViewSet(viewsets.ModelViewSet):
     ordering = ["-created_at"]
 
     def get_queryset(self):
-        return Review.objects.select_related("movie", "user")
+        # movie and user render as primary keys, so no joins are needed
+        return Review.objects.all()
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
\ No newline at end of file
@@ -0,0 +1,247 @@
+"""
+In-process prefix index for search-box autocomplete.
+
+Names of artists, albums, tracks, movies, actors and directors are kept in
+one sorted array of ``(word-suffix, kind, id)`` keys, so a prefix query is a
+bisect plus a short scan. A trigram posting table gives a typo-tolerant
+fallback when the prefix scan finds too little. The index is built lazily on
+first use, kept current by save/delete signals in this process and rebuilt
+in the background every ``AUTOCOMPLETE_REFRESH_SECONDS`` to pick up writes
+made by other workers. Changes signalled while a rebuild reads the rows are
+replayed onto the new index before it replaces the old one.
+"""
+import bisect
+import math
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+
+# kind -> (app label, model name, name field)
+SOURCES = {
+    'artists': ('music', 'Artist', 'name'),
+    'albums': ('music', 'Album', 'title'),
+    'tracks': ('music', 'Track', 'title'),
+    'movies': ('movies', 'Movie', 'title'),
+    'actors': ('movies', 'Actor', 'name'),
+    'directors': ('movies', 'Director', 'name'),
+}
+
+MAX_SCAN = 500
+TRIGRAM_MIN_LENGTH = 4
+TRIGRAM_THRESHOLD = 0.5
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse whitespace"""
+    text = unicodedata.normalize('NFKD', (text or '').lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.split())
+
+
+def trigrams(text):
+    grams = set()
+    for word in text.split():
+        padded = f' {word}'
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def kind_for_model(model):
+    for kind, (app_label, model_name, _) in SOURCES.items():
+        if model._meta.app_label == app_label and model.__name__ == model_name:
+            return kind
+    return None
+
+
+class PrefixIndex:
+    """Sorted-array prefix index with trigram fallback (not thread-safe)"""
+
+    def __init__(self):
+        self.keys = []
+        self.names = {}
+        self.grams = defaultdict(set)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from ``(kind, pk, name)`` rows with a single sort"""
+        index = cls()
+        for kind, pk, name in rows:
+            index._add(kind, pk, name, index.keys.append)
+        index.keys.sort()
+        return index
+
+    def add(self, kind, pk, name):
+        if (kind, pk) in self.names:
+            self.remove(kind, pk)
+        self._add(kind, pk, name, lambda key: bisect.insort(self.keys, key))
+
+    def _add(self, kind, pk, name, insert):
+        entry = (kind, pk)
+        text = normalize(name)
+        if not text:
+            return
+        self.names[entry] = name
+        words = text.split(' ')
+        for position in range(len(words)):
+            insert((' '.join(words[position:]), kind, pk))
+        for gram in trigrams(text):
+            self.grams[gram].add(entry)
+
+    def remove(self, kind, pk):
+        entry = (kind, pk)
+        name = self.names.pop(entry, None)
+        if name is None:
+            return
+        text = normalize(name)
+        words = text.split(' ')
+        for position in range(len(words)):
+            key = (' '.join(words[position:]), kind, pk)
+            i = bisect.bisect_left(self.keys, key)
+            if i < len(self.keys) and self.keys[i] == key:
+                del self.keys[i]
+        for gram in trigrams(text):
+            postings = self.grams.get(gram)
+            if postings is not None:
+                postings.discard(entry)
+                if not postings:
+                    del self.grams[gram]
+
+    def lookup(self, query, kinds, limit):
+        text = normalize(query)
+        results = {kind: {} for kind in kinds}
+        if not text:
+            return {kind: [] for kind in kinds}
+
+        start = bisect.bisect_left(self.keys, (text,))
+        for key, kind, pk in self.keys[start:start + MAX_SCAN]:
+            if not key.startswith(text):
+                break
+            if kind in results and len(results[kind]) < limit and pk not in results[kind]:
+                name = self.names[(kind, pk)]
+                # Whole-name prefix beats a later-word match; shorter names next
+                results[kind][pk] = (0 if normalize(name).startswith(text) else 1, len(name), name)
+                if all(len(found) >= limit for found in results.values()):
+                    break
+
+        short = [kind for kind in kinds if len(results[kind]) < limit]
+        if short and len(text) >= TRIGRAM_MIN_LENGTH:
+            for (kind, pk), score in self._similar(text):
+                if kind in short and len(results[kind]) < limit and pk not in results[kind]:
+                    name = self.names[(kind, pk)]
+                    results[kind][pk] = (2, -score, name)
+
+        return {
+            kind: [
+                {'id': pk, 'name': self.names[(kind, pk)]}
+                for pk, _ in sorted(found.items(), key=lambda item: item[1])
+            ]
+            for kind, found in results.items()
+        }
+
+    def _similar(self, text):
+        """``(entry, score)`` pairs sharing at least TRIGRAM_THRESHOLD of the query's trigrams, best first"""
+        postings = sorted((self.grams.get(gram, set()) for gram in trigrams(text)), key=len)
+        needed = max(math.ceil(TRIGRAM_THRESHOLD * len(postings)), 1)
+        # An entry missing from all of the rarest len - needed + 1 postings
+        # cannot reach ``needed`` hits, so only those are scanned for candidates
+        candidates = set().union(*postings[:len(postings) - needed + 1])
+        scored = []
+        for entry in candidates:
+            hits = sum(1 for posting in postings if entry in posting)
+            if hits >= needed:
+                scored.append((entry, hits / len(postings)))
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored
+
+
+class Autocomplete:
+    """Process-wide autocomplete index with lazy build and periodic refresh"""
+
+    def __init__(self):
+        self._index = None
+        self._built_at = 0.0
+        self._lock = threading.RLock()
+        self._refreshing = False
+        # One list of changes per rebuild that is still reading rows
+        self._recorders = []
+
+    def _rows(self):
+        for kind, (app_label, model_name, field) in SOURCES.items():
+            model = apps.get_model(app_label, model_name)
+            for pk, name in model._default_manager.values_list('pk', field).iterator():
+                yield kind, pk, name
+
+    def rebuild(self):
+        deltas = []
+        with self._lock:
+            self._recorders.append(deltas)
+        try:
+            index = PrefixIndex.from_rows(self._rows())
+        finally:
+            with self._lock:
+                self._recorders.remove(deltas)
+        with self._lock:
+            # The rows may have been read before these changes
+            for method, args in deltas:
+                method(index, *args)
+            self._index = index
+            self._built_at = time.monotonic()
+
+    def _background_rebuild(self):
+        try:
+            self.rebuild()
+        finally:
+            with self._lock:
+                self._refreshing = False
+            connection.close()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_rebuild, daemon=True).start()
+
+    def lookup(self, query, kinds=None, limit=5):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self.rebuild()
+        else:
+            max_age = getattr(settings, 'AUTOCOMPLETE_REFRESH_SECONDS', 600)
+            if max_age and time.monotonic() - self._built_at > max_age:
+                self._refresh_in_background()
+        kinds = [kind for kind in (kinds or SOURCES) if kind in SOURCES]
+        with self._lock:
+            return self._index.lookup(query, kinds, limit)
+
+    def _apply(self, method, *args):
+        """Apply a change to the current index and to every rebuild in progress"""
+        with self._lock:
+            for deltas in self._recorders:
+                deltas.append((method, args))
+            if self._index is not None:
+                method(self._index, *args)
+
+    def update(self, instance):
+        """Apply a save; a no-op until the index has been built"""
+        kind = kind_for_model(type(instance))
+        if kind is not None:
+            self._apply(PrefixIndex.add, kind, instance.pk, getattr(instance, SOURCES[kind][2]))
+
+    def discard(self, instance):
+        kind = kind_for_model(type(instance))
+        if kind is not None:
+            self._apply(PrefixIndex.remove, kind, instance.pk)
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+
+
+autocomplete = Autocomplete()
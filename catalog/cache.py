@@ -0,0 +1,347 @@
+"""
+Tiered cache: a bounded in-process LRU (L1) in front of a shared backend (L2).
+
+Configured as the ``default`` cache; L2 is another entry of ``CACHES``
+(Redis in production, a file cache elsewhere). Reads are served from L1 for
+at most ``L1_TIMEOUT`` seconds, so other workers' writes become visible
+within that window. Writes go to both tiers. Keys starting with one of the
+``L2_ONLY_PREFIXES`` (change stamps, versions, generations) skip L1, because
+serving another worker's change a few seconds late is exactly what they
+exist to prevent. When L2 is unreachable, reads
+fall back to whatever L1 still holds, expired or not, for up to
+``STALE_TIMEOUT`` seconds.
+
+``memoize()`` adds soft expiry on top: an entry past its soft TTL is still
+returned while one worker in the cluster recomputes it in the background,
+and a cold key is computed by a single worker while the others wait for its
+result.
+"""
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import close_old_connections, connection
+from django.utils.functional import cached_property
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+CACHE_LOOKUPS = Counter(
+    'catalog_cache_lookups_total', 'Tiered cache lookups by tier and result', ['tier', 'result'],
+)
+CACHE_L2_ERRORS = Counter('catalog_cache_l2_errors_total', 'Failed operations on the shared cache tier')
+CACHE_RECOMPUTES = Counter(
+    'catalog_cache_recomputes_total', 'memoize() recomputations by reason', ['reason'],
+)
+
+_MISSING = object()
+
+
+class LRU:
+    """
+    Thread-safe bounded mapping of key -> (value, fresh_until, stale_until).
+    Values are pickled, as in LocMemCache, so callers never share mutable objects.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, allow_stale=False):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            value, fresh_until, stale_until = entry
+            if now >= stale_until:
+                del self._data[key]
+                return _MISSING
+            if now >= fresh_until and not allow_stale:
+                return _MISSING
+            self._data.move_to_end(key)
+        return pickle.loads(value)
+
+    def set(self, key, value, ttl, stale_ttl):
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (value, now + ttl, now + max(ttl, stale_ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, _MISSING) is not _MISSING
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TieredCache(BaseCache):
+    """
+    OPTIONS: ``L2`` (alias of the shared cache, default ``'shared'``),
+    ``L1_MAX_ENTRIES`` (default 2048), ``L1_TIMEOUT`` (default 5 seconds),
+    ``STALE_TIMEOUT`` (default 300 seconds) and ``L2_ONLY_PREFIXES`` (key
+    prefixes never held in L1, default none).
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = options.get('L2', 'shared')
+        self.l1_timeout = options.get('L1_TIMEOUT', 5)
+        self.stale_timeout = options.get('STALE_TIMEOUT', 300)
+        self.l2_only = tuple(options.get('L2_ONLY_PREFIXES', ()))
+        self.l1 = LRU(options.get('L1_MAX_ENTRIES', 2048))
+
+    @cached_property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def _l1_key(self, key, version):
+        return self.make_and_validate_key(key, version=version)
+
+    def _in_l1(self, key):
+        return not key.startswith(self.l2_only)
+
+    def _remember(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if not self._in_l1(key):
+            return
+        timeout = self.get_backend_timeout(timeout)
+        ttl = self.l1_timeout if timeout is None else min(timeout - time.time(), self.l1_timeout)
+        if ttl > 0:
+            self.l1.set(self._l1_key(key, version), value, ttl, self.stale_timeout)
+        else:
+            self.l1.delete(self._l1_key(key, version))
+
+    def _l2_failed(self, operation, key):
+        CACHE_L2_ERRORS.inc()
+        logger.warning('Shared cache %s failed for %r', operation, key, exc_info=True)
+
+    def l2_available(self):
+        try:
+            self.l2.get('catalog-cache-ping')
+        except Exception:
+            self._l2_failed('ping', 'catalog-cache-ping')
+            return False
+        return True
+
+    def get(self, key, default=None, version=None):
+        value = self.l1.get(self._l1_key(key, version)) if self._in_l1(key) else _MISSING
+        if value is not _MISSING:
+            CACHE_LOOKUPS.labels('l1', 'hit').inc()
+            return value
+        CACHE_LOOKUPS.labels('l1', 'miss').inc()
+        try:
+            value = self.l2.get(key, _MISSING, version=version)
+        except Exception:
+            self._l2_failed('get', key)
+            return self._stale(key, default, version)
+        if value is _MISSING:
+            CACHE_LOOKUPS.labels('l2', 'miss').inc()
+            self.l1.delete(self._l1_key(key, version))
+            return default
+        CACHE_LOOKUPS.labels('l2', 'hit').inc()
+        self._remember(key, value, version=version)
+        return value
+
+    def _stale(self, key, default, version):
+        value = self.l1.get(self._l1_key(key, version), allow_stale=True)
+        if value is _MISSING:
+            CACHE_LOOKUPS.labels('l1', 'stale_miss').inc()
+            return default
+        CACHE_LOOKUPS.labels('l1', 'stale').inc()
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remaining = []
+        for key in keys:
+            value = self.l1.get(self._l1_key(key, version)) if self._in_l1(key) else _MISSING
+            if value is _MISSING:
+                remaining.append(key)
+            else:
+                found[key] = value
+        CACHE_LOOKUPS.labels('l1', 'hit').inc(len(found))
+        CACHE_LOOKUPS.labels('l1', 'miss').inc(len(remaining))
+        if not remaining:
+            return found
+        try:
+            shared = self.l2.get_many(remaining, version=version)
+        except Exception:
+            self._l2_failed('get_many', remaining)
+            for key in remaining:
+                value = self._stale(key, _MISSING, version)
+                if value is not _MISSING:
+                    found[key] = value
+            return found
+        CACHE_LOOKUPS.labels('l2', 'hit').inc(len(shared))
+        CACHE_LOOKUPS.labels('l2', 'miss').inc(len(remaining) - len(shared))
+        for key, value in shared.items():
+            self._remember(key, value, version=version)
+        found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        try:
+            self.l2.set(key, value, timeout, version=version)
+        except Exception:
+            self._l2_failed('set', key)
+        self._remember(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        try:
+            failed = self.l2.set_many(data, timeout, version=version)
+        except Exception:
+            self._l2_failed('set_many', list(data))
+            failed = []
+        for key, value in data.items():
+            self._remember(key, value, timeout, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        try:
+            added = self.l2.add(key, value, timeout, version=version)
+        except Exception:
+            self._l2_failed('add', key)
+            if self.l1.get(self._l1_key(key, version)) is not _MISSING:
+                return False
+            added = True
+        if added:
+            self._remember(key, value, timeout, version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        try:
+            return self.l2.touch(key, timeout, version=version)
+        except Exception:
+            self._l2_failed('touch', key)
+            return False
+
+    def delete(self, key, version=None):
+        self.l1.delete(self._l1_key(key, version))
+        try:
+            return self.l2.delete(key, version=version)
+        except Exception:
+            self._l2_failed('delete', key)
+            return False
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            self.l1.delete(self._l1_key(key, version))
+        try:
+            self.l2.delete_many(keys, version=version)
+        except Exception:
+            self._l2_failed('delete_many', keys)
+
+    def incr(self, key, delta=1, version=None):
+        try:
+            value = self.l2.incr(key, delta, version=version)
+        except ValueError:
+            self.l1.delete(self._l1_key(key, version))
+            raise
+        except Exception:
+            # Counters must not drift per worker; callers reseed on ValueError
+            self._l2_failed('incr', key)
+            self.l1.delete(self._l1_key(key, version))
+            raise ValueError("Key '%s' not found" % key)
+        self._remember(key, value, version=version)
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def clear(self):
+        self.l1.clear()
+        try:
+            self.l2.clear()
+        except Exception:
+            self._l2_failed('clear', '*')
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
+
+
+def _lock_key(key):
+    return f'memo:lock:{key}'
+
+
+def _store(key, value, timeout, soft_timeout):
+    cache.set(key, {'value': value, 'fresh_until': time.time() + soft_timeout}, timeout)
+
+
+def _refresh(key, compute, timeout, soft_timeout, lock_timeout):
+    try:
+        CACHE_RECOMPUTES.labels('refresh').inc()
+        _store(key, compute(), timeout, soft_timeout)
+    except Exception:
+        logger.exception('Background refresh of %r failed', key)
+    finally:
+        cache.delete(_lock_key(key))
+
+
+def _refresh_in_background(*args):
+    # Work inside a transaction (tests, atomic requests) must see its own rows
+    if connection.in_atomic_block:
+        _refresh(*args)
+        return
+
+    def run():
+        try:
+            _refresh(*args)
+        finally:
+            close_old_connections()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def memoize(key, compute, timeout, soft_timeout=None, lock_timeout=30, wait=5.0):
+    """
+    Return the cached result of ``compute()`` under ``key``.
+
+    After ``soft_timeout`` seconds (default: half of ``timeout``) the entry is
+    refreshed in the background by one worker while the old value keeps
+    being served; ``timeout`` is the hard expiry. On a cold key one worker
+    computes while the others wait up to ``wait`` seconds for its result.
+    """
+    soft_timeout = soft_timeout if soft_timeout is not None else timeout / 2
+    entry = cache.get(key)
+    if entry is not None:
+        if entry['fresh_until'] <= time.time() and cache.add(_lock_key(key), 1, lock_timeout):
+            _refresh_in_background(key, compute, timeout, soft_timeout, lock_timeout)
+        return entry['value']
+
+    if cache.add(_lock_key(key), 1, lock_timeout):
+        try:
+            CACHE_RECOMPUTES.labels('cold').inc()
+            value = compute()
+            _store(key, value, timeout, soft_timeout)
+            return value
+        finally:
+            cache.delete(_lock_key(key))
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['value']
+    CACHE_RECOMPUTES.labels('wait_timeout').inc()
+    return compute()
+
+
+def shared_cache():
+    """
+    The cluster-wide tier behind the default cache. Read-modify-write cycles
+    read from it so they never start from another worker's outdated L1 copy.
+    """
+    return getattr(cache, 'l2', cache)
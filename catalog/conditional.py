@@ -0,0 +1,159 @@
+"""
+Change stamps and conditional GET (ETag / Last-Modified) for catalog reads.
+
+Signal handlers touch a catalog-wide stamp for every model written and a
+per-object stamp for each row whose representation changed. Stamps are
+nanosecond clock readings kept in the cache, so the validators for a list
+or detail response come from a single ``get_many``, and an unchanged poll
+is answered with 304 before any query runs.
+"""
+import hashlib
+import json
+import time
+from functools import partial, wraps
+
+from django.contrib import messages
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _key(model, pk=None):
+    if pk is None:
+        return f'cs:{_label(model)}'
+    return f'cs:{_label(model)}:{pk}'
+
+
+def touch(model, pks=None):
+    """Record a change to ``model`` (catalog-wide) or to the objects in ``pks``, now and again on commit"""
+    keys = [_key(model)] if pks is None else [_key(model, pk) for pk in pks]
+    if keys:
+        _stamp(keys)
+        if connection.in_atomic_block:
+            # A validator computed before the commit may describe the old rows
+            transaction.on_commit(partial(_stamp, keys))
+
+
+def _stamp(keys):
+    now = time.time_ns()
+    cache.set_many({key: now for key in keys}, None)
+
+
+def stamps(keys):
+    values = cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        # Unknown since the cache was last cleared: treat as changed now
+        for key in missing:
+            cache.add(key, time.time_ns(), None)
+        values.update(cache.get_many(missing))
+    return [values.get(key, 0) for key in keys]
+
+
+def model_stamps(models):
+    """Current catalog-wide change stamps of ``models``, in order"""
+    return stamps([_key(model) for model in models])
+
+
+def object_stamps(model, pks):
+    """pk -> current change stamp of each object in ``pks``"""
+    pks = list(pks)
+    return dict(zip(pks, stamps([_key(model, pk) for pk in pks])))
+
+
+def validators(models=(), objects=(), variant=''):
+    """
+    Return ``(etag, last_modified)`` for content depending on ``models``
+    (catalog-wide) and ``objects`` (``(model, pk)`` pairs); ``variant``
+    distinguishes representations of the same data (URL, format, viewer).
+    """
+    keys = [_key(model) for model in models] + [_key(model, pk) for model, pk in objects]
+    values = stamps(keys)
+    payload = json.dumps([keys, values, variant], default=str)
+    etag = '"%s"' % hashlib.sha1(payload.encode()).hexdigest()  # nosec - validator, not security
+    return etag, max(values, default=0) // 1_000_000_000
+
+
+def not_modified(request, etag, last_modified):
+    """The 304 response for ``request``, or None if it has to be rendered"""
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, etag, last_modified):
+    if response.status_code != 200:
+        return response
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Clients may keep the body but must revalidate before reusing it
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def _api_variant(request):
+    return [request.get_host(), request.get_full_path(), request.META.get('HTTP_ACCEPT', '')]
+
+
+class ConditionalGetMixin:
+    """
+    ViewSet mixin emitting ETag / Last-Modified on list and detail responses.
+
+    List validators come from the catalog-wide stamps of ``stamp_models``,
+    detail validators from the object's own stamp. With ``per_viewer`` the
+    signed-in viewer and their favourites stamp are part of them too.
+    """
+    stamp_models = ()
+    per_viewer = False
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(request, self.stamp_models, (), super().list, args, kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        objects = [(self.queryset.model, pk)]
+        return self._conditional(request, (), objects, super().retrieve, args, kwargs)
+
+    def _conditional(self, request, models, objects, view, args, kwargs):
+        if request.method not in SAFE_METHODS:
+            return view(request, *args, **kwargs)
+        variant = _api_variant(request)
+        if self.per_viewer and request.user.is_authenticated:
+            objects = [*objects, (get_user_model(), request.user.pk)]
+            variant.append(request.user.pk)
+        etag, last_modified = validators(models, objects, variant)
+        response = not_modified(request._request, etag, last_modified)
+        if response is None:
+            response = set_validators(view(request, *args, **kwargs), etag, last_modified)
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+
+def conditional_page(*models):
+    """
+    Decorator for HTML list pages depending on ``models``; the viewer and
+    their favourites are part of the validators.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            # Pending flash messages must be rendered, not answered with 304
+            if request.method not in SAFE_METHODS or len(messages.get_messages(request)):
+                return view(request, *args, **kwargs)
+            user = request.user
+            objects = [(get_user_model(), user.pk)] if user.is_authenticated else []
+            variant = [request.get_full_path(), user.pk, user.is_staff]
+            etag, last_modified = validators(models, objects, variant)
+            response = not_modified(request, etag, last_modified)
+            if response is None:
+                response = set_validators(view(request, *args, **kwargs), etag, last_modified)
+            patch_vary_headers(response, ['Cookie'])
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,157 @@
+"""
+Write-behind counters denormalized onto catalog rows.
+
+``CounterBuffer.add()`` only records a delta in process memory, so a write
+never waits on (or locks) the counted row. The delta enters the buffer when
+the caller's transaction commits, so rolled-back changes are never counted.
+Pending deltas are flushed in one transaction, one
+``UPDATE ... SET n = n + delta`` per distinct delta over ids in pk order,
+once the buffer is ``COUNTER_FLUSH_SIZE`` ids large or
+``COUNTER_FLUSH_INTERVAL`` seconds old (checked on every add and at the end
+of every request), and at interpreter exit. A flush requested inside
+``atomic()`` waits for that block to commit, so a rollback cannot undo
+deltas that already left the buffer. Deltas lost with a crashed process are
+repaired by ``reconcile()``, which recounts from the source table.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connection, transaction
+from django.db.transaction import TransactionManagementError
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+from django.dispatch import receiver
+
+from . import conditional, query_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 5
+DEFAULT_FLUSH_SIZE = 500
+
+BUFFERS = []
+
+
+class CounterBuffer:
+    """
+    Pending deltas for ``model.<field>``, which counts the rows of
+    ``source`` (a model) pointing at it through ``source_column``.
+    """
+
+    def __init__(self, model, field, source, source_column):
+        self.model = model
+        self.field = field
+        self.source = source
+        self.source_column = source_column
+        self._deltas = defaultdict(int)
+        self._since = None
+        self._lock = threading.Lock()
+        BUFFERS.append(self)
+
+    def add(self, pks, delta=1):
+        """Buffer ``delta`` for each of ``pks`` once the current transaction commits"""
+        pks = list(pks)
+        transaction.on_commit(lambda: self._buffer(pks, delta))
+
+    def _buffer(self, pks, delta):
+        with self._lock:
+            for pk in pks:
+                self._deltas[pk] += delta
+            if self._since is None:
+                self._since = time.monotonic()
+        self.flush_if_due()
+
+    def pending(self):
+        with self._lock:
+            return {pk: delta for pk, delta in self._deltas.items() if delta}
+
+    def _due(self):
+        if self._since is None:
+            return False
+        size = getattr(settings, 'COUNTER_FLUSH_SIZE', DEFAULT_FLUSH_SIZE)
+        interval = getattr(settings, 'COUNTER_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+        return len(self._deltas) >= size or time.monotonic() - self._since >= interval
+
+    def flush_if_due(self):
+        if self._due():
+            self.flush()
+
+    def flush(self):
+        """Write every pending delta; returns the ids whose counter changed"""
+        if connection.in_atomic_block:
+            # A rollback of the enclosing block would undo the UPDATEs
+            transaction.on_commit(self.flush)
+            return []
+        with self._lock:
+            deltas, self._deltas, self._since = self._deltas, defaultdict(int), None
+        by_delta = defaultdict(list)
+        for pk, delta in deltas.items():
+            if delta:
+                by_delta[delta].append(pk)
+        if not by_delta:
+            return []
+        try:
+            with transaction.atomic():
+                for delta, pks in sorted(by_delta.items()):
+                    self.model.objects.filter(pk__in=sorted(pks)).update(
+                        **{self.field: Greatest(F(self.field) + delta, Value(0))}
+                    )
+        except Exception:
+            # Put the deltas back so the next flush retries them
+            with self._lock:
+                for pk, delta in deltas.items():
+                    self._deltas[pk] += delta
+                self._since = self._since or time.monotonic()
+            raise
+        self._changed()
+        return sorted(pk for pks in by_delta.values() for pk in pks)
+
+    def _changed(self):
+        # Counters are written in SQL, which the model signals never see
+        query_cache.bump(self.model)
+        conditional.touch(self.model)
+
+    def reconcile(self, batch_size=500):
+        """Flush, then reset drifted counters from one grouped query; returns the fixed ids"""
+        if connection.in_atomic_block:
+            # The deferred flush would re-apply deltas the recount already includes
+            raise TransactionManagementError('reconcile() must run outside atomic()')
+        self.flush()
+        actual = dict(
+            self.source.objects.order_by().values(self.source_column)
+            .annotate(count=Count('pk')).values_list(self.source_column, 'count')
+        )
+        drifted = []
+        for obj in self.model.objects.only('pk', self.field).iterator(chunk_size=2000):
+            count = actual.get(obj.pk, 0)
+            if getattr(obj, self.field) != count:
+                setattr(obj, self.field, count)
+                drifted.append(obj)
+        self.model.objects.bulk_update(drifted, [self.field], batch_size=batch_size)
+        if drifted:
+            self._changed()
+        return [obj.pk for obj in drifted]
+
+
+def flush_all():
+    for buffer in BUFFERS:
+        buffer.flush()
+
+
+@receiver(request_finished)
+def flush_due_counters(sender, **kwargs):
+    for buffer in BUFFERS:
+        buffer.flush_if_due()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush_all()
+    except Exception:
+        logger.exception('Flushing buffered counters at exit failed')
@@ -0,0 +1,89 @@
+"""
+Cached option lists (value, label, count) for the catalog filter controls.
+
+Each facet is computed with one aggregate query and cached under a key that
+embeds the ``query_cache`` generations of the models it depends on, so any
+write to those models retires it. Small facets are rendered straight into
+the page; large ones (artists) are searched through ``/api/facets/`` by a
+lazily loaded control instead of being dumped into every response.
+"""
+from django.conf import settings
+from django.db.models import Count
+
+from movies.models import Movie, Genre as MovieGenre
+from music.models import Track, Album, Artist, Genre
+
+from .autocomplete import normalize
+from .cache import memoize
+from .query_cache import generations
+
+DEFAULT_TIMEOUT = 3600
+
+
+class Facet:
+    """
+    ``compute`` returns the options as dicts with ``id``, ``name`` and
+    ``count``; ``models`` are the models whose writes invalidate them.
+    """
+
+    def __init__(self, name, models, compute):
+        self.name = name
+        self.models = models
+        self.compute = compute
+
+    def _key(self):
+        return f'facets:{self.name}:' + '.'.join(str(g) for g in generations(self.models))
+
+    def _build(self):
+        options = list(self.compute())
+        return {'options': options, 'keys': [normalize(str(option['name'])) for option in options]}
+
+    def _cached(self):
+        timeout = getattr(settings, 'FACET_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+        return memoize(self._key(), self._build, timeout)
+
+    def options(self):
+        return self._cached()['options']
+
+    def search(self, query='', limit=20):
+        """Options whose name contains ``query``, prefix matches first"""
+        cached = self._cached()
+        needle = normalize(query)
+        if not needle:
+            return cached['options'][:limit]
+        prefix, inner = [], []
+        for option, key in zip(cached['options'], cached['keys']):
+            if key.startswith(needle):
+                prefix.append(option)
+            elif needle in key and len(inner) < limit:
+                inner.append(option)
+            if len(prefix) >= limit:
+                break
+        return (prefix + inner)[:limit]
+
+
+def _music_genres():
+    return Genre.objects.annotate(count=Count('albums__tracks')).order_by('name').values('id', 'name', 'count')
+
+
+def _artists():
+    return Artist.objects.annotate(count=Count('tracks')).order_by('name', 'id').values('id', 'name', 'count')
+
+
+def _movie_genres():
+    return MovieGenre.objects.annotate(count=Count('movies')).order_by('name').values('id', 'name', 'count')
+
+
+def _movie_years():
+    rows = Movie.objects.values('release_year').annotate(count=Count('id')).order_by('-release_year')
+    return [{'id': row['release_year'], 'name': row['release_year'], 'count': row['count']} for row in rows]
+
+
+FACETS = {
+    facet.name: facet for facet in (
+        Facet('music-genres', [Genre, Album, Track], _music_genres),
+        Facet('artists', [Artist, Track], _artists),
+        Facet('movie-genres', [MovieGenre, Movie], _movie_genres),
+        Facet('movie-years', [Movie], _movie_years),
+    )
+}
@@ -0,0 +1,167 @@
+"""
+Sparse fieldsets (``?fields=``) and on-demand expansion (``?expand=``).
+
+    ?fields=id,title,album.title     only these fields; dotted paths pick
+                                     sub-fields of a nested relation
+    ?expand=album,album.artist       render these relations as nested objects
+
+Once either parameter is given, relations that are not expanded render as
+primary keys. Without either parameter the full nested representation is
+returned, as before. ``project_queryset`` turns the same specification into
+``only()`` / ``select_related()`` / ``Prefetch`` so the database returns just
+the columns and joins the response needs; unrequested ``bio`` and
+``description`` TextFields are never loaded.
+"""
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def parse_paths(value):
+    """``'a,b.c,b.d'`` -> ``{'a': {}, 'b': {'c': {}, 'd': {}}}``"""
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def request_spec(request):
+    """Return ``(fields, expand)`` trees for a read request, or ``(None, None)``"""
+    if request is None or request.method not in SAFE_METHODS:
+        return None, None
+    params = request.query_params
+    if FIELDS_PARAM not in params and EXPAND_PARAM not in params:
+        return None, None
+    return parse_paths(params.get(FIELDS_PARAM)) or None, parse_paths(params.get(EXPAND_PARAM))
+
+
+def _nested(field):
+    if isinstance(field, serializers.ListSerializer):
+        return type(field.child), True
+    if isinstance(field, serializers.BaseSerializer):
+        return type(field), False
+    return None, False
+
+
+class FlexFieldsMixin:
+    """
+    Serializer mixin applying a fields/expand specification, taken from the
+    ``fields``/``expand`` kwargs or from the request in the context.
+    """
+
+    def __init__(self, *args, **kwargs):
+        explicit = 'fields' in kwargs or 'expand' in kwargs
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+        if not explicit:
+            fields, expand = request_spec(self.context.get('request'))
+        if fields is not None or expand is not None:
+            self._apply_spec(fields, expand)
+
+    def _apply_spec(self, fields, expand):
+        for name, field in list(self.fields.items()):
+            if field.write_only:
+                continue
+            if fields is not None and name not in fields:
+                self.fields.pop(name)
+                continue
+            nested, many = _nested(field)
+            if nested is None:
+                continue
+            source = None if field.source == name else field.source
+            sub_fields = fields.get(name) or None if fields is not None else None
+            if expand is None or name in expand or sub_fields:
+                kwargs = {}
+                if issubclass(nested, FlexFieldsMixin):
+                    kwargs = {'fields': sub_fields, 'expand': None if expand is None else expand.get(name, {})}
+                self.fields[name] = nested(many=many, read_only=True, source=source, **kwargs)
+            else:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(many=many, read_only=True, source=source)
+
+
+def _plan(serializer, model, prefix=''):
+    """
+    Collect ``(only, select_related, prefetches)`` for a serializer instance
+    whose fields are already restricted; returns None if a field cannot be
+    mapped to a model column.
+    """
+    only, select, prefetch = [], [], []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*' or '.' in field.source:
+            return None
+        try:
+            model_field = model._meta.get_field(field.source)
+        except Exception:
+            return None
+        path = prefix + field.source
+        nested, many = _nested(field)
+        related = model_field.related_model
+        if related is None:
+            only.append(path)
+        elif many:
+            child = field.child if nested else None
+            queryset = related._default_manager.all()
+            queryset = project_serializer(queryset, child) if child is not None else queryset.only('pk')
+            if queryset is None:
+                return None
+            prefetch.append(Prefetch(path, queryset=queryset))
+        elif nested:
+            only.append(path)
+            select.append(path)
+            sub = _plan(field, related, path + '__')
+            if sub is None:
+                return None
+            only.extend(sub[0])
+            select.extend(sub[1])
+            prefetch.extend(sub[2])
+        else:
+            only.append(path)
+    return only, select, prefetch
+
+
+def project_serializer(queryset, serializer):
+    plan = _plan(serializer, queryset.model)
+    if plan is None:
+        return None
+    only, select, prefetch = plan
+    # Prefetches the view ordered (e.g. playlist tracks) keep their order
+    orderings = {
+        lookup.prefetch_to: lookup.queryset.query.order_by
+        for lookup in queryset._prefetch_related_lookups
+        if isinstance(lookup, Prefetch) and lookup.queryset is not None and lookup.queryset.query.order_by
+    }
+    prefetch = [
+        Prefetch(lookup.prefetch_to, queryset=lookup.queryset.order_by(*orderings[lookup.prefetch_to]))
+        if lookup.prefetch_to in orderings else lookup
+        for lookup in prefetch
+    ]
+    # Replace whatever eager loading the view set up with the projection's own
+    queryset = queryset.select_related(None).prefetch_related(None).only(*only)
+    if select:
+        queryset = queryset.select_related(*select)
+    return queryset.prefetch_related(*prefetch)
+
+
+def project_queryset(queryset, serializer_class, fields, expand):
+    """Restrict ``queryset`` to what ``serializer_class`` renders for this spec"""
+    if fields is None and expand is None:
+        return queryset
+    projected = project_serializer(queryset, serializer_class(fields=fields, expand=expand))
+    return queryset if projected is None else projected
+
+
+class FlexFieldsViewMixin:
+    """ViewSet mixin whose ``project()`` narrows a queryset to ``?fields=`` / ``?expand=``"""
+
+    def project(self, queryset):
+        fields, expand = request_spec(self.request)
+        return project_queryset(queryset, self.get_serializer_class(), fields, expand)
@@ -0,0 +1,159 @@
+"""
+Full-page cache for anonymous GET requests to public catalog pages.
+
+Views opt in with ``@cache_anonymous(*models)``. The middleware sits ahead
+of the session, CSRF, auth and message middleware, so a repeat anonymous
+request is answered without running any of them. Entries are keyed on the
+host, path and normalised query string, and are tagged with the models the
+page was rendered from. Each entry keeps the catalog-wide change stamps
+(``catalog.conditional``) those models had before rendering, so any write
+to one of them, or an explicit ``purge()``, retires the page. Responses
+that set a cookie (session, messages, CSRF) are never stored.
+
+Stored pages are sent with ``Cache-Control: public, max-age=...`` so that a
+proxy can serve them for a short while too. The same views are marked
+``private`` for signed-in users.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import parse_http_date_safe
+from prometheus_client import Counter
+
+from .conditional import model_stamps, touch
+
+PAGE_CACHE_LOOKUPS = Counter('catalog_page_cache_total', 'Anonymous page cache lookups by result', ['result'])
+
+DEFAULT_TIMEOUT = 600
+DEFAULT_MAX_AGE = 60
+# Query parameters that never change the page
+IGNORED_PARAMS = ('utm_', 'fbclid', 'gclid')
+MESSAGES_COOKIE = 'messages'
+
+
+def _is_anonymous_get(request):
+    return (
+        request.method == 'GET'
+        and getattr(settings, 'PAGE_CACHE_ENABLED', True)
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and MESSAGES_COOKIE not in request.COOKIES
+        and 'HTTP_AUTHORIZATION' not in request.META
+    )
+
+
+def normalize_query(params):
+    """Sorted ``(name, value)`` pairs without blanks or tracking parameters"""
+    return sorted(
+        (name, value)
+        for name, values in params.lists()
+        if not name.startswith(IGNORED_PARAMS)
+        for value in values if value.strip()
+    )
+
+
+def _key(request):
+    payload = json.dumps([request.get_host(), request.path, normalize_query(request.GET)])
+    return 'page:%s' % hashlib.sha1(payload.encode()).hexdigest()  # nosec - cache key
+
+
+def purge(*models):
+    """Retire every cached page tagged with any of ``models``"""
+    for model in models:
+        touch(model)
+
+
+def _public(response):
+    max_age = getattr(settings, 'PAGE_CACHE_MAX_AGE', DEFAULT_MAX_AGE)
+    del response['Cache-Control']
+    patch_cache_control(response, public=True, max_age=max_age)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def _fetch(request, key):
+    entry = cache.get(key)
+    if entry is None:
+        PAGE_CACHE_LOOKUPS.labels('miss').inc()
+        return None
+    models = [apps.get_model(label) for label in entry['tags']]
+    if model_stamps(models) != entry['stamps']:
+        PAGE_CACHE_LOOKUPS.labels('purged').inc()
+        return None
+    PAGE_CACHE_LOOKUPS.labels('hit').inc()
+    headers = dict(entry['headers'])
+    last_modified = parse_http_date_safe(headers.get('Last-Modified', ''))
+    response = get_conditional_response(request, etag=headers.get('ETag'), last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(entry['content'], status=entry['status'])
+        response['Content-Length'] = len(entry['content'])
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def _storable(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and getattr(response, 'page_cache_tags', None) is not None
+    )
+
+
+def _store(key, response):
+    timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+    cache.set(key, {
+        'tags': response.page_cache_tags,
+        'stamps': response.page_cache_stamps,
+        'status': response.status_code,
+        'headers': [(name, value) for name, value in response.items() if name != 'Content-Length'],
+        'content': response.content,
+    }, timeout)
+
+
+class AnonymousPageCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _is_anonymous_get(request):
+            return self.get_response(request)
+        key = _key(request)
+        response = _fetch(request, key)
+        if response is not None:
+            return response
+        request.page_cache_candidate = True
+        response = self.get_response(request)
+        if _storable(response):
+            _store(key, _public(response))
+        return response
+
+
+def cache_anonymous(*models):
+    """
+    Decorator for public pages rendered from ``models``: anonymous responses
+    are stored by ``AnonymousPageCacheMiddleware``, the rest marked private.
+    """
+    labels = [model._meta.label_lower for model in models]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            candidate = getattr(request, 'page_cache_candidate', False)
+            # Stamps are read before rendering so a concurrent write retires the entry
+            stamps = model_stamps(models) if candidate else None
+            response = view(request, *args, **kwargs)
+            if candidate and not request.user.is_authenticated:
+                response.page_cache_tags = labels
+                response.page_cache_stamps = stamps
+            elif request.method in ('GET', 'HEAD'):
+                patch_cache_control(response, private=True)
+            return response
+        return wrapper
+    return decorator
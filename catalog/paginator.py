@@ -0,0 +1,125 @@
+"""
+Paginator for HTML list pages that avoids exact COUNTs on large result sets.
+
+The total is taken, in order of preference, from a short-lived cache entry
+keyed by the filter set, from table statistics (unfiltered lists only), or
+from a count capped at ``LIST_COUNT_THRESHOLD`` rows, which is shown as
+"более N" instead of an exact figure.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connection
+from django.utils.functional import cached_property
+
+DEFAULT_THRESHOLD = 10000
+DEFAULT_COUNT_TIMEOUT = 60
+
+EXACT = 'exact'
+CAPPED = 'capped'
+ESTIMATED = 'estimated'
+
+
+def estimate_table_rows(model):
+    """Row count from planner statistics, or None when unavailable"""
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            elif connection.vendor == 'sqlite':
+                # Populated by ANALYZE; each row's first number is the table's row count
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if not row or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate > 0 else None
+
+
+class CatalogPaginator(Paginator):
+    """
+    Paginator with cached, estimated or capped totals.
+
+    ``count_key`` is the cache key for the filter set (without the page
+    number); ``estimate`` allows table statistics for unfiltered lists;
+    ``page_hint`` is the requested page, so a capped count always reaches
+    far enough to include it; ``known_count`` is a ``(count, mode)`` pair
+    recorded earlier.
+    """
+
+    def __init__(self, object_list, per_page, *, count_key=None, estimate=False,
+                 page_hint=None, known_count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+        self.estimate = estimate
+        self.known_count = known_count
+        try:
+            self.page_hint = max(int(page_hint), 1)
+        except (TypeError, ValueError):
+            self.page_hint = 1
+        self.count_mode = EXACT
+
+    @property
+    def threshold(self):
+        return getattr(settings, 'LIST_COUNT_THRESHOLD', DEFAULT_THRESHOLD)
+
+    @cached_property
+    def count(self):
+        if self.known_count is not None:
+            count, self.count_mode = self.known_count
+            return count
+        # Rows needed for the requested page to have at least one item
+        needed = (self.page_hint - 1) * self.per_page + 1
+        cached = cache.get(self.count_key) if self.count_key else None
+        if cached is not None and self._reaches(cached, needed):
+            count, self.count_mode = cached
+            return count
+        count, self.count_mode = self._compute_count(needed)
+        if self.count_key:
+            timeout = getattr(settings, 'LIST_COUNT_CACHE_TIMEOUT', DEFAULT_COUNT_TIMEOUT)
+            cache.set(self.count_key, (count, self.count_mode), timeout)
+        return count
+
+    @staticmethod
+    def _reaches(known, needed):
+        """Whether a recorded total covers the requested page"""
+        count, mode = known
+        if mode == CAPPED:
+            # The capped count includes one row past the cap
+            return needed < count
+        if mode == ESTIMATED:
+            return needed <= count
+        return True
+
+    def _compute_count(self, needed):
+        model = getattr(self.object_list, 'model', None)
+        if self.estimate and model is not None:
+            estimated = estimate_table_rows(model)
+            # Statistics can lag behind the table; never let them hide the requested page
+            if estimated is not None and estimated >= max(self.threshold, needed):
+                return estimated, ESTIMATED
+        if not hasattr(self.object_list, 'query'):
+            return len(self.object_list), EXACT
+        cap = max(self.threshold, needed)
+        count = self.object_list[:cap + 1].count()
+        return (count, CAPPED) if count > cap else (count, EXACT)
+
+    @property
+    def count_display(self):
+        count = self.count
+        if self.count_mode == CAPPED:
+            return f'более {count - 1}'
+        if self.count_mode == ESTIMATED:
+            return f'≈{count}'
+        return str(count)
+
+    @property
+    def num_pages_display(self):
+        if self.count_mode == EXACT:
+            return str(self.num_pages)
+        return f'{self.num_pages}+'
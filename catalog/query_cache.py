@@ -0,0 +1,127 @@
+"""
+Result cache for catalog list pages.
+
+A list request is reduced to its normalised filter parameters; the ids and
+total count of the resulting page are cached under a key that also embeds
+a generation number for every model the list depends on. Saving or deleting
+any of those models bumps its generation, so stale entries are simply never
+read again and expire on their own.
+"""
+import functools
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.core.paginator import Page
+
+from .paginator import CatalogPaginator
+
+PARAMS = ('q', 'search', 'genre', 'artist', 'sort', 'page', 'year', 'min_rating')
+# Parameters that do not change which rows match
+UNFILTERED_PARAMS = {'sort', 'page'}
+DEFAULT_TIMEOUT = 300
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _generation_key(model):
+    return f'qc:gen:{_label(model)}'
+
+
+def bump(model):
+    """Invalidate every cached list that depends on ``model``, now and again on commit"""
+    key = _generation_key(model)
+    _increment(key)
+    if connection.in_atomic_block:
+        # A list read before the commit may have been cached under the new generation
+        transaction.on_commit(functools.partial(_increment, key))
+
+
+def _increment(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Start from the clock so a lost counter never reuses an old value
+        cache.set(key, time.time_ns(), None)
+
+
+def generations(models):
+    keys = [_generation_key(model) for model in models]
+    values = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in values}
+    if missing:
+        for key, value in missing.items():
+            cache.add(key, value, None)
+        values.update(cache.get_many(list(missing)))
+    return [values.get(key, 0) for key in keys]
+
+
+def normalize_params(params):
+    """Keep the known list parameters, normalising free-text search"""
+    normalized = {}
+    for name in PARAMS:
+        value = params.get(name)
+        if value in (None, ''):
+            continue
+        value = str(value).strip()
+        if name in ('q', 'search'):
+            value = ' '.join(value.lower().split())
+        if value:
+            normalized[name] = value
+    normalized.setdefault('page', '1')
+    return normalized
+
+
+def make_key(namespace, params, gens):
+    payload = json.dumps([params, gens], sort_keys=True, default=str)
+    digest = hashlib.sha1(payload.encode()).hexdigest()  # nosec - cache key, not security
+    return f'qc:{namespace}:{digest}'
+
+
+class _CountedList:
+    """Stand-in object list so a Paginator can report a cached total"""
+
+    def __init__(self, count):
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+
+def cached_page(namespace, params, depends_on, queryset, hydrate, per_page):
+    """
+    Return the requested page of ``queryset``.
+
+    On a hit only the page's rows are loaded, from ``hydrate`` (a queryset
+    carrying the select/prefetch the template needs), in cached order.
+    """
+    normalized = normalize_params(params)
+    gens = generations(depends_on)
+    key = make_key(namespace, normalized, gens)
+    entry = cache.get(key)
+    if entry is None:
+        filters = {name: value for name, value in normalized.items() if name not in UNFILTERED_PARAMS}
+        paginator = CatalogPaginator(
+            queryset, per_page,
+            count_key=make_key(f'{namespace}:count', filters, gens),
+            estimate=not filters,
+            page_hint=normalized['page'],
+        )
+        page = paginator.get_page(normalized['page'])
+        entry = {
+            'number': page.number,
+            'count': (paginator.count, paginator.count_mode),
+            'ids': [obj.pk for obj in page.object_list],
+        }
+        cache.set(key, entry, getattr(settings, 'QUERY_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+        return page
+
+    rows = hydrate.in_bulk(entry['ids']) if entry['ids'] else {}
+    objects = [rows[pk] for pk in entry['ids'] if pk in rows]
+    paginator = CatalogPaginator(_CountedList(entry['count'][0]), per_page, known_count=entry['count'])
+    return Page(objects, entry['number'], paginator)
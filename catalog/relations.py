@@ -0,0 +1,51 @@
+"""
+Primary key list fields that validate in one query.
+
+DRF's ``PrimaryKeyRelatedField(many=True)`` looks every id up with its own
+``queryset.get()``, so writing a 2,000-track playlist costs 2,000 queries.
+``BulkPrimaryKeyRelatedField`` is a drop-in replacement whose ``many=True``
+form resolves the whole list with a single ``pk__in`` query, keeping the
+per-id error messages and the order of the input (duplicates dropped).
+"""
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        queryset = child.get_queryset()
+        pk_field = queryset.model._meta.pk
+        pks = []
+        for value in data:
+            if child.pk_field is not None:
+                value = child.pk_field.to_internal_value(value)
+            try:
+                if isinstance(value, bool):
+                    raise TypeError
+                pks.append(pk_field.to_python(value))
+            except (TypeError, ValueError, DjangoValidationError):
+                child.fail('incorrect_type', data_type=type(value).__name__)
+        pks = list(dict.fromkeys(pks))
+        found = {obj.pk: obj for obj in queryset.filter(pk__in=pks)} if pks else {}
+        for pk in pks:
+            if pk not in found:
+                child.fail('does_not_exist', pk_value=pk)
+        return [found[pk] for pk in pks]
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """``PrimaryKeyRelatedField`` whose ``many=True`` form validates with one query"""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
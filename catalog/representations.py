@@ -0,0 +1,129 @@
+"""
+Per-object cache of serialized API representations.
+
+Each object's dict is cached under ``rep:<model>:<pk>`` together with the
+version it was built for; the current version lives under
+``rep:ver:<model>:<pk>``. Signal handlers bump versions whenever the object,
+its many-to-many links or a related row (artist, genre, person) changes, so
+outdated entries are never served. A page is assembled with a single
+``get_many`` covering both versions and representations, and only the
+misses are serialized, in one batch.
+"""
+import functools
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from rest_framework.response import Response
+
+from .flex_fields import request_spec
+
+DEFAULT_TIMEOUT = 3600
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _version_key(model, pk):
+    return f'rep:ver:{_label(model)}:{pk}'
+
+
+def _data_key(model, pk):
+    return f'rep:{_label(model)}:{pk}'
+
+
+def bump(model, pks):
+    """Give every object in ``pks`` a new version, now and again on commit"""
+    keys = [_version_key(model, pk) for pk in pks]
+    if keys:
+        # A dropped counter is reseeded from the clock on the next read,
+        # which is always ahead of the value it replaces
+        cache.delete_many(keys)
+        if connection.in_atomic_block:
+            # A read before the commit reseeds a version for the old rows
+            transaction.on_commit(functools.partial(cache.delete_many, keys))
+
+
+class RepresentationCache:
+    """
+    Versioned representations of one model; ``serialize`` turns a list of
+    instances into a list of dicts in the same order.
+    """
+
+    def __init__(self, model, serialize):
+        self.model = model
+        self.serialize = serialize
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'REPRESENTATION_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+    def lookup(self, pks):
+        """Return ``(hits, versions)``: fresh dicts and current versions by pk"""
+        version_keys = {pk: _version_key(self.model, pk) for pk in pks}
+        data_keys = {pk: _data_key(self.model, pk) for pk in pks}
+        found = cache.get_many(list(version_keys.values()) + list(data_keys.values()))
+        missing = [key for key in version_keys.values() if key not in found]
+        if missing:
+            for key in missing:
+                cache.add(key, time.time_ns(), None)
+            found.update(cache.get_many(missing))
+        versions = {pk: found.get(key) for pk, key in version_keys.items()}
+        hits = {}
+        for pk, key in data_keys.items():
+            entry = found.get(key)
+            if entry is not None and versions[pk] is not None and entry[0] == versions[pk]:
+                hits[pk] = entry[1]
+        return hits, versions
+
+    def store(self, items, versions):
+        """Cache ``{pk: data}`` under the versions returned by ``lookup``"""
+        entries = {
+            _data_key(self.model, pk): (versions[pk], data)
+            for pk, data in items.items() if versions.get(pk) is not None
+        }
+        if entries:
+            cache.set_many(entries, self.timeout)
+
+    def get_many(self, objects):
+        """Representations of ``objects`` in order, serializing only the misses"""
+        objects = list(objects)
+        hits, versions = self.lookup([obj.pk for obj in objects])
+        misses = [obj for obj in objects if obj.pk not in hits]
+        if misses:
+            fresh = {obj.pk: data for obj, data in zip(misses, self.serialize(misses))}
+            self.store(fresh, versions)
+            hits.update(fresh)
+        return [hits[obj.pk] for obj in objects]
+
+
+class CachedRepresentationMixin:
+    """
+    ViewSet mixin serving list pages and detail responses from
+    ``representations``; requests with ``?fields=`` / ``?expand=`` bypass it.
+    """
+    representations = None
+
+    def list(self, request, *args, **kwargs):
+        if request_spec(request) != (None, None):
+            return super().list(request, *args, **kwargs)
+        # Page rows need no related data; cache misses are serialized in bulk
+        queryset = self.filter_queryset(self.representations.model._default_manager.all())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(self.representations.get_many(queryset))
+        return self.get_paginated_response(self.representations.get_many(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field, '')
+        if request_spec(request) != (None, None) or not str(lookup).isdigit():
+            return super().retrieve(request, *args, **kwargs)
+        pk = int(lookup)
+        hits, versions = self.representations.lookup([pk])
+        if pk in hits:
+            return Response(hits[pk])
+        response = super().retrieve(request, *args, **kwargs)
+        self.representations.store({pk: dict(response.data)}, versions)
+        return response
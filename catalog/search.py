@@ -0,0 +1,191 @@
+"""
+Full-text search indexes for catalog models.
+
+Each index keeps one search document per object in a side table:
+an FTS5 virtual table on SQLite and a weighted ``tsvector`` column with a
+GIN index on PostgreSQL. Other backends fall back to ``icontains`` lookups.
+"""
+import re
+from functools import reduce
+from operator import or_
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Column weights: FTS5 bm25() multipliers for the PostgreSQL weight labels
+BM25_WEIGHTS = {'A': 10.0, 'B': 4.0, 'C': 2.0, 'D': 1.0}
+
+_registry = {}
+
+
+def register(index):
+    """Register a search index so management commands can find it"""
+    _registry[index.table] = index
+    return index
+
+
+def get_indexes():
+    return list(_registry.values())
+
+
+def tokenize(query):
+    return TOKEN_RE.findall((query or '').lower())
+
+
+def create_search_table(schema_editor, table, columns):
+    """Create the side table for an index (used from migrations)"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {table} USING fts5('
+            f'{", ".join(columns)}, tokenize="unicode61 remove_diacritics 2")'
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE TABLE {table} (object_id bigint PRIMARY KEY, document tsvector NOT NULL)'
+        )
+        schema_editor.execute(f'CREATE INDEX {table}_document_idx ON {table} USING GIN (document)')
+
+
+def drop_search_table(schema_editor, table):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class SearchIndex:
+    """
+    Base class for a per-model search index.
+
+    Subclasses set ``model``, ``table``, ``columns`` (name -> weight label
+    ``A``..``D``) and ``fallback_lookups``, and implement ``document()``.
+    """
+    model = None
+    table = None
+    columns = {}
+    fallback_lookups = ()
+
+    def document(self, obj):
+        """Return a dict of column name -> text for ``obj``"""
+        raise NotImplementedError
+
+    def get_queryset(self):
+        """Queryset used to load objects for (re)indexing"""
+        return self.model._default_manager.all()
+
+    @property
+    def vendor(self):
+        return connection.vendor
+
+    @property
+    def supported(self):
+        return self.vendor in ('sqlite', 'postgresql')
+
+    # Writing
+
+    def update(self, ids, queryset=None):
+        """Re-index the given object ids; ids that no longer exist are dropped"""
+        ids = {int(pk) for pk in ids if pk is not None}
+        if not ids or not self.supported:
+            return
+        if queryset is None:
+            queryset = self.get_queryset()
+        objects = list(queryset.filter(pk__in=ids))
+        self.remove(ids)
+        self._insert(objects)
+
+    def remove(self, ids):
+        ids = [int(pk) for pk in ids if pk is not None]
+        if not ids or not self.supported:
+            return
+        key = 'rowid' if self.vendor == 'sqlite' else 'object_id'
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE {key} IN ({placeholders})', ids)
+
+    def rebuild(self, queryset=None, batch_size=500):
+        """Drop every row and index all objects again; returns the count"""
+        if not self.supported:
+            return 0
+        if queryset is None:
+            queryset = self.get_queryset()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+        total = 0
+        batch = []
+        for obj in queryset.order_by('pk').iterator(chunk_size=batch_size):
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                total += self._insert(batch)
+                batch = []
+        total += self._insert(batch)
+        return total
+
+    def _insert(self, objects):
+        if not objects:
+            return 0
+        names = list(self.columns)
+        rows = []
+        for obj in objects:
+            doc = self.document(obj)
+            rows.append([obj.pk] + [doc.get(name) or '' for name in names])
+        if self.vendor == 'sqlite':
+            sql = (
+                f'INSERT INTO {self.table} (rowid, {", ".join(names)}) '
+                f'VALUES (%s, {", ".join(["%s"] * len(names))})'
+            )
+        else:
+            vector = ' || '.join(
+                f"setweight(to_tsvector('simple', %s), '{self.columns[name]}')" for name in names
+            )
+            sql = f'INSERT INTO {self.table} (object_id, document) VALUES (%s, {vector})'
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        return len(rows)
+
+    # Querying
+
+    def match_expression(self, query):
+        """Build a prefix-matching query for the backend, or None if empty"""
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        if self.vendor == 'sqlite':
+            return ' '.join(f'"{token}"*' for token in tokens)
+        return ' & '.join(f'{token}:*' for token in tokens)
+
+    def search(self, queryset, query):
+        """
+        Filter ``queryset`` to objects matching ``query`` and annotate
+        ``search_rank`` (higher is more relevant).
+        """
+        if not self.supported:
+            return self._fallback_search(queryset, query)
+        expression = self.match_expression(query)
+        if expression is None:
+            return queryset.none()
+        outer = f'{self.model._meta.db_table}.{self.model._meta.pk.column}'
+        if self.vendor == 'sqlite':
+            weights = ', '.join(str(BM25_WEIGHTS[label]) for label in self.columns.values())
+            ids_sql = f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s'
+            rank_sql = (
+                f'SELECT -bm25({self.table}, {weights}) FROM {self.table} '
+                f'WHERE {self.table} MATCH %s AND rowid = {outer}'
+            )
+        else:
+            ids_sql = f"SELECT object_id FROM {self.table} WHERE document @@ to_tsquery('simple', %s)"
+            rank_sql = (
+                f"SELECT ts_rank_cd(document, to_tsquery('simple', %s)) FROM {self.table} "
+                f'WHERE object_id = {outer}'
+            )
+        return queryset.filter(pk__in=RawSQL(ids_sql, [expression])).annotate(
+            search_rank=RawSQL(rank_sql, [expression], output_field=FloatField())
+        )
+
+    def _fallback_search(self, queryset, query):
+        condition = reduce(or_, [Q(**{lookup: query}) for lookup in self.fallback_lookups])
+        return queryset.filter(condition).distinct().annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
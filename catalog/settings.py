@@ -39,6 +39,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django_prometheus.middleware.PrometheusBeforeMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'catalog.page_cache.AnonymousPageCacheMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,6 +64,9 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            'libraries': {
+                'fragments': 'catalog.fragments',
+            },
         },
     },
 ]
@@ -87,6 +91,37 @@ else:
         }
     }
 
+# Cache: per-worker LRU (L1) in front of a shared tier (L2). Production needs
+# Redis (REDIS_URL): the generation counters and single-flight locks rely on
+# its atomic incr/add, and every worker must see the same tier. Without it,
+# L2 is a per-process LocMemCache - fine for the dev server and keeps each
+# test run isolated, but not shared between workers.
+if os.environ.get('REDIS_URL'):
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+else:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tunehub-shared',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+CACHES = {
+    'default': {
+        'BACKEND': 'catalog.cache.TieredCache',
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_MAX_ENTRIES': int(os.environ.get('CACHE_L1_MAX_ENTRIES', 2048)),
+            'L1_TIMEOUT': int(os.environ.get('CACHE_L1_TIMEOUT', 5)),
+            'STALE_TIMEOUT': 300,
+            # Change stamps, representation versions and list-cache generations
+            'L2_ONLY_PREFIXES': ('cs:', 'rep:ver:', 'qc:gen:'),
+        },
+    },
+    'shared': SHARED_CACHE,
+}
+
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
 USE_I18N = True
@@ -141,11 +176,26 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'api.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'api.parsers.MessagePackParser',
+    ],
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'api.negotiation.CatalogContentNegotiation',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.CatalogPagination',
     'PAGE_SIZE': 20,
     'EXCEPTION_HANDLER': 'api.exceptions.custom_exception_handler',
 }
 
+# Serve API lists with keyset (cursor) pagination by default instead of ?page=
+API_CURSOR_PAGINATION = os.environ.get('API_CURSOR_PAGINATION', 'False').lower() == 'true'
+
 CORS_ALLOW_ALL_ORIGINS = True
 
 LOGGING = {
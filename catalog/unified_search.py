@@ -0,0 +1,163 @@
+"""
+Cross-catalog search: one query fanned out to every source in parallel.
+
+Each source returns ``(id, label fields, score)`` rows. Scores come from one
+absolute scale shared by every source: how the row's name or title matches
+the query (exact, prefix, substring, or only through other fields such as
+an album, a director or the description). Full-text ranks only order rows
+within their tier, so a source holding nothing but weak matches never tops
+the merged list.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Case, IntegerField, Value, When
+
+from movies.models import Movie, Actor, Director
+from movies.search import movie_index
+from music.models import Track, Album, Artist
+from music.search import track_index
+
+# Match tier -> score; tiers are the ones computed by _match_rank
+TIER_SCORES = {3: 1.0, 2: 0.75, 1: 0.5, 0: 0.25}
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'SEARCH_FANOUT_WORKERS', 5),
+            thread_name_prefix='search',
+        )
+    return _executor
+
+
+def _match_rank(field, query):
+    """Tier of ``field`` against ``query``: exact 3, prefix 2, substring 1, otherwise 0"""
+    return Case(
+        When(**{f'{field}__iexact': query}, then=Value(3)),
+        When(**{f'{field}__istartswith': query}, then=Value(2)),
+        When(**{f'{field}__icontains': query}, then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def _name_match(queryset, field, query):
+    """icontains search ranked exact > prefix > substring"""
+    return queryset.filter(**{f'{field}__icontains': query}).annotate(
+        match_rank=_match_rank(field, query),
+    ).order_by('-match_rank', field)
+
+
+def search_tracks(query, limit):
+    rows = track_index.search(Track.objects.all(), query).annotate(
+        match_rank=_match_rank('title', query),
+    ).order_by('-match_rank', '-search_rank', 'title')
+    return [
+        {'id': t['id'], 'title': t['title'], 'album': t['album__title'], 'score': TIER_SCORES[t['match_rank']]}
+        for t in rows.values('id', 'title', 'album__title', 'match_rank')[:limit]
+    ]
+
+
+def search_albums(query, limit):
+    rows = _name_match(Album.objects.all(), 'title', query)
+    return [
+        {
+            'id': a['id'], 'title': a['title'], 'artist': a['artist__name'],
+            'release_year': a['release_year'], 'score': TIER_SCORES[a['match_rank']],
+        }
+        for a in rows.values('id', 'title', 'artist__name', 'release_year', 'match_rank')[:limit]
+    ]
+
+
+def search_artists(query, limit):
+    rows = _name_match(Artist.objects.all(), 'name', query)
+    return [
+        {'id': a['id'], 'name': a['name'], 'score': TIER_SCORES[a['match_rank']]}
+        for a in rows.values('id', 'name', 'match_rank')[:limit]
+    ]
+
+
+def search_movies(query, limit):
+    rows = movie_index.search(Movie.objects.all(), query).annotate(
+        match_rank=_match_rank('title', query),
+    ).order_by('-match_rank', '-search_rank', '-release_year')
+    return [
+        {
+            'id': m['id'], 'title': m['title'], 'release_year': m['release_year'],
+            'score': TIER_SCORES[m['match_rank']],
+        }
+        for m in rows.values('id', 'title', 'release_year', 'match_rank')[:limit]
+    ]
+
+
+def search_people(query, limit):
+    people = []
+    for role, model in (('director', Director), ('actor', Actor)):
+        people.extend(
+            {'id': p['id'], 'name': p['name'], 'role': role, 'score': TIER_SCORES[p['match_rank']]}
+            for p in _name_match(model.objects.all(), 'name', query).values('id', 'name', 'match_rank')[:limit]
+        )
+    people.sort(key=lambda p: (-p['score'], p['name']))
+    return people[:limit]
+
+
+SOURCES = {
+    'tracks': search_tracks,
+    'albums': search_albums,
+    'artists': search_artists,
+    'movies': search_movies,
+    'people': search_people,
+}
+
+
+def _timed(source, query, limit, in_worker):
+    started = time.perf_counter()
+    try:
+        return SOURCES[source](query, limit), (time.perf_counter() - started) * 1000
+    finally:
+        if in_worker:
+            close_old_connections()
+
+
+def unified_search(query, limit=5, types=None):
+    """
+    Run every requested source and merge the results.
+
+    Sources run concurrently on a thread pool, except inside a transaction
+    (e.g. ``ATOMIC_REQUESTS``), where other connections could not see the
+    caller's uncommitted writes, so they run inline instead.
+    """
+    types = [t for t in (types or SOURCES) if t in SOURCES]
+    started = time.perf_counter()
+    if connection.in_atomic_block or len(types) < 2:
+        outcomes = {t: _timed(t, query, limit, False) for t in types}
+    else:
+        executor = _get_executor()
+        futures = {t: executor.submit(_timed, t, query, limit, True) for t in types}
+        outcomes = {t: future.result() for t, future in futures.items()}
+
+    results = []
+    timings = {}
+    counts = {}
+    for source, (rows, elapsed) in outcomes.items():
+        timings[source] = round(elapsed, 2)
+        counts[source] = len(rows)
+        results.extend({'type': source, **row} for row in rows)
+    # Stable: rows of one tier keep their source's own order
+    results.sort(key=lambda row: -row['score'])
+
+    return {
+        'query': query,
+        'results': results,
+        'meta': {
+            'counts': counts,
+            'timings_ms': timings,
+            'total_ms': round((time.perf_counter() - started) * 1000, 2),
+        },
+    }
@@ -1,14 +1,20 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from music.models import Track, Album
+from catalog.page_cache import cache_anonymous
+from accounts.favorites import favorite_tracks
+from music import charts
+from music.models import Track, Album, Artist
 from movies.models import Movie
 from movies.forms import MovieForm
 from music.forms import TrackForm, AlbumForm
 
+@cache_anonymous(Track, Album, Artist)
 def home(request):
-    # Get popular tracks (sorted by rating, limit to 10)
-    popular_tracks = Track.objects.select_related('album', 'album__artist').prefetch_related('artists').order_by('-rating', 'title')[:10]
+    # Top 10 by rating, from the materialized leaderboard (no catalog queries)
+    popular_tracks = charts.chart()
+    favorite_ids = favorite_tracks.ids(request.user)
+    popular_tracks = [{**entry, 'is_favorited': entry['id'] in favorite_ids} for entry in popular_tracks]
     
     context = {
         'popular_tracks': popular_tracks,
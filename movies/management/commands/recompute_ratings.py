@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from movies.ratings import recompute
+from movies.signals import ratings_changed
+
+
+class Command(BaseCommand):
+    help = "Repair drifted movie rating aggregates (rating_sum, rating_count, rating) from the reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        fixed = recompute(batch_size=options["batch_size"])
+        ratings_changed(fixed)
+        self.stdout.write(self.style.SUCCESS(f"Repaired {len(fixed)} movies"))
@@ -0,0 +1,30 @@
+# Full-text search side table for movies
+
+from django.db import migrations
+
+from catalog.search import create_search_table, drop_search_table
+
+TABLE = 'movies_movie_search'
+
+
+def create_index(apps, schema_editor):
+    from movies.search import movie_index
+
+    create_search_table(schema_editor, TABLE, ['title', 'directors', 'actors', 'description'])
+    Movie = apps.get_model('movies', 'Movie')
+    movie_index.rebuild(queryset=Movie.objects.prefetch_related('directors', 'actors'))
+
+
+def drop_index(apps, schema_editor):
+    drop_search_table(schema_editor, TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_alter_actor_name_alter_director_name_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:42
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_aggregates(apps, schema_editor):
+    Movie = apps.get_model('movies', 'Movie')
+    Review = apps.get_model('movies', 'Review')
+    rows = Review.objects.order_by().values('movie').annotate(total=Sum('rating'), count=Count('id'))
+    movies = []
+    for row in rows:
+        movie = Movie(pk=row['movie'], rating_sum=row['total'], rating_count=row['count'])
+        movie.rating = row['total'] / row['count']
+        movies.append(movie)
+    Movie.objects.bulk_update(movies, ['rating', 'rating_sum', 'rating_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_aggregates, migrations.RunPython.noop),
+    ]
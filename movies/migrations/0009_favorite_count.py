@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:49
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_favorite_counts(apps, schema_editor):
+    Movie = apps.get_model('movies', 'Movie')
+    Favorite = apps.get_model('accounts', 'CustomUser').favorite_movies.through
+    rows = Favorite.objects.order_by().values('movie').annotate(count=Count('id'))
+    Movie.objects.bulk_update(
+        [Movie(pk=row['movie'], favorite_count=row['count']) for row in rows], ['favorite_count'], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('movies', '0008_movie_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='favorite_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['-favorite_count', 'id'], name='movie_popularity_idx'),
+        ),
+        migrations.RunPython(fill_favorite_counts, migrations.RunPython.noop),
+    ]
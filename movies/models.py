@@ -48,6 +48,11 @@ class Movie(models.Model):
         help_text="Duration in minutes"
     )
     rating = models.FloatField(default=0, db_index=True)
+    # Review aggregates, adjusted in place by movies.ratings
+    rating_sum = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+    # Users who favourited the movie, written behind by catalog.counters
+    favorite_count = models.IntegerField(default=0)
 
     genres = models.ManyToManyField(Genre, related_name="movies", blank=True)
     directors = models.ManyToManyField(Director, related_name="movies", blank=True)
@@ -59,6 +64,11 @@ class Movie(models.Model):
             models.Index(fields=['release_year'], name='movie_year_idx'),
             models.Index(fields=['rating'], name='movie_rating_idx'),
             models.Index(fields=['release_year', 'rating'], name='movie_year_rating_idx'),
+            # Keyset pagination: ordering column + id tie-breaker
+            models.Index(fields=['release_year', 'id'], name='movie_year_id_idx'),
+            models.Index(fields=['rating', 'id'], name='movie_rating_id_idx'),
+            # ?sort=popularity / ?ordering=popularity
+            models.Index(fields=['-favorite_count', 'id'], name='movie_popularity_idx'),
         ]
 
     def __str__(self):
@@ -77,7 +87,19 @@ class Review(models.Model):
             models.Index(fields=['movie', 'created_at'], name='review_movie_date_idx'),
             models.Index(fields=['user', 'created_at'], name='review_user_date_idx'),
             models.Index(fields=['rating'], name='review_rating_idx'),
+            # Keyset pagination: ordering column + id tie-breaker
+            models.Index(fields=['created_at', 'id'], name='review_created_id_idx'),
+            models.Index(fields=['rating', 'id'], name='review_rating_id_idx'),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored values, so a later save adjusts the movie aggregates by the difference;
+        # with either deferred, pre_save reads them instead
+        if "movie_id" in field_names and "rating" in field_names:
+            instance._stored_rating = (instance.movie_id, instance.rating)
+        return instance
+
     def __str__(self):
         return f"{self.movie.title} - {self.user.username} ({self.rating})"
@@ -0,0 +1,52 @@
+"""
+Review aggregates kept on ``Movie``.
+
+``rating_sum`` and ``rating_count`` are adjusted in place with F-expressions
+as reviews are created, changed and deleted, and ``rating`` (their average)
+is derived in the same UPDATE, so no request scans a movie's reviews.
+``recompute()`` repairs drift left by bulk writes that bypass the signals.
+"""
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast
+
+from .models import Movie, Review
+
+RATING_FIELDS = ['rating', 'rating_sum', 'rating_count']
+
+
+def adjust(movie_id, sum_delta, count_delta):
+    """Add ``sum_delta`` / ``count_delta`` to one movie's aggregates in a single UPDATE"""
+    new_sum = F('rating_sum') + sum_delta
+    new_count = F('rating_count') + count_delta
+    # Conditions see the row before the update
+    no_reviews_left = Q(rating_count__lte=-count_delta)
+    return Movie.objects.filter(pk=movie_id).update(
+        rating_sum=new_sum,
+        rating_count=new_count,
+        rating=Case(
+            When(no_reviews_left, then=Value(0.0)),
+            default=Cast(new_sum, FloatField()) / new_count,
+            output_field=FloatField(),
+        ),
+    )
+
+
+def recompute(batch_size=500):
+    """Reset drifted aggregates from one grouped query over reviews; returns the fixed ids"""
+    actual = {
+        row['movie']: (row['total'], row['count'])
+        for row in Review.objects.order_by().values('movie').annotate(total=Sum('rating'), count=Count('id'))
+    }
+    drifted = []
+    for movie in Movie.objects.only('id', *RATING_FIELDS).iterator(chunk_size=2000):
+        total, count = actual.get(movie.pk, (0, 0))
+        if count:
+            rating = total / count
+        else:
+            # Movies never reviewed keep their editorial rating
+            rating = 0.0 if movie.rating_count else movie.rating
+        if (movie.rating_sum, movie.rating_count) != (total, count) or abs(movie.rating - rating) > 1e-9:
+            movie.rating_sum, movie.rating_count, movie.rating = total, count, rating
+            drifted.append(movie)
+    Movie.objects.bulk_update(drifted, RATING_FIELDS, batch_size=batch_size)
+    return [movie.pk for movie in drifted]
@@ -0,0 +1,31 @@
+"""
+Search index for movies (title, description, director and actor names).
+"""
+from catalog.search import SearchIndex, register
+from .models import Movie
+
+
+class MovieSearchIndex(SearchIndex):
+    model = Movie
+    table = 'movies_movie_search'
+    columns = {'title': 'A', 'directors': 'B', 'actors': 'B', 'description': 'C'}
+    fallback_lookups = (
+        'title__icontains',
+        'description__icontains',
+        'directors__name__icontains',
+        'actors__name__icontains',
+    )
+
+    def get_queryset(self):
+        return Movie.objects.prefetch_related('directors', 'actors')
+
+    def document(self, movie):
+        return {
+            'title': movie.title,
+            'directors': ' '.join(director.name for director in movie.directors.all()),
+            'actors': ' '.join(actor.name for actor in movie.actors.all()),
+            'description': movie.description,
+        }
+
+
+movie_index = register(MovieSearchIndex())
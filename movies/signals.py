@@ -0,0 +1,236 @@
+"""
+Signal handlers keeping derived movie data in sync with the catalog.
+"""
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+from catalog import conditional, query_cache, representations
+from accounts.favorites import favorite_movies
+from accounts.models import CustomUser
+from catalog.autocomplete import autocomplete
+from . import ratings
+from .models import Movie, Director, Actor, Genre, Review
+from .search import movie_index
+
+
+@receiver(post_save, sender=Movie)
+def index_movie(sender, instance, raw=False, **kwargs):
+    if not raw:
+        movie_index.update([instance.pk])
+
+
+@receiver(post_delete, sender=Movie)
+def unindex_movie(sender, instance, **kwargs):
+    movie_index.remove([instance.pk])
+
+
+@receiver(post_save, sender=Director)
+@receiver(post_save, sender=Actor)
+def index_person_movies(sender, instance, raw=False, **kwargs):
+    if not raw:
+        movie_index.update(instance.movies.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Director)
+@receiver(pre_delete, sender=Actor)
+def remember_person_movies(sender, instance, **kwargs):
+    # The M2M rows are gone by post_delete, so collect the ids up front
+    instance._movie_ids = list(instance.movies.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Director)
+@receiver(post_delete, sender=Actor)
+def reindex_person_movies(sender, instance, **kwargs):
+    movie_index.update(getattr(instance, '_movie_ids', []))
+
+
+@receiver(m2m_changed, sender=Movie.directors.through)
+@receiver(m2m_changed, sender=Movie.actors.through)
+def index_movie_people(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._movie_ids = list(instance.movies.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        movie_index.update([instance.pk])
+    elif action == 'post_clear':
+        movie_index.update(getattr(instance, '_movie_ids', []))
+    else:
+        movie_index.update(pk_set or [])
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=Director)
+@receiver(post_save, sender=Actor)
+def autocomplete_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        autocomplete.update(instance)
+
+
+@receiver(post_delete, sender=Movie)
+@receiver(post_delete, sender=Director)
+@receiver(post_delete, sender=Actor)
+def autocomplete_delete(sender, instance, **kwargs):
+    autocomplete.discard(instance)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Director)
+@receiver(post_save, sender=Actor)
+@receiver(post_delete, sender=Movie)
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Director)
+@receiver(post_delete, sender=Actor)
+def bump_list_cache(sender, **kwargs):
+    query_cache.bump(sender)
+    conditional.touch(sender)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def touch_reviews(sender, **kwargs):
+    # Movie pages list their reviews
+    conditional.touch(Review)
+
+
+@receiver(m2m_changed, sender=Movie.genres.through)
+@receiver(m2m_changed, sender=Movie.directors.through)
+@receiver(m2m_changed, sender=Movie.actors.through)
+def bump_list_cache_m2m(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        query_cache.bump(type(instance))
+        conditional.touch(type(instance))
+
+
+def bump_movies(ids):
+    ids = list(ids)
+    representations.bump(Movie, ids)
+    conditional.touch(Movie, ids)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def bump_movie_representation(sender, instance, **kwargs):
+    bump_movies([instance.pk])
+
+
+@receiver(pre_delete, sender=Genre)
+def remember_genre_movies(sender, instance, **kwargs):
+    instance._movie_ids = list(instance.movies.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Director)
+@receiver(post_save, sender=Actor)
+def bump_related_movies(sender, instance, **kwargs):
+    bump_movies(instance.movies.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Director)
+@receiver(post_delete, sender=Actor)
+def bump_deleted_related_movies(sender, instance, **kwargs):
+    # _movie_ids comes from the pre_delete handlers above
+    bump_movies(getattr(instance, '_movie_ids', []))
+
+
+@receiver(m2m_changed, sender=Movie.genres.through)
+@receiver(m2m_changed, sender=Movie.directors.through)
+@receiver(m2m_changed, sender=Movie.actors.through)
+def bump_movie_links(sender, instance, action, reverse, pk_set, **kwargs):
+    # People's pre_clear ids are collected by index_movie_people
+    if reverse and action == 'pre_clear' and sender is Movie.genres.through:
+        instance._movie_ids = list(instance.movies.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_movies([instance.pk])
+    elif action == 'post_clear':
+        bump_movies(getattr(instance, '_movie_ids', []))
+    else:
+        bump_movies(pk_set or [])
+
+
+@receiver(m2m_changed, sender=CustomUser.favorite_movies.through)
+def touch_favorite_movies(sender, instance, action, reverse, pk_set, **kwargs):
+    # Pages mark the viewer's favourites, so their validators include this stamp
+    if reverse and action == 'pre_clear':
+        instance._user_ids = list(instance.favored_by_users.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        conditional.touch(CustomUser, [instance.pk])
+    elif action == 'post_clear':
+        conditional.touch(CustomUser, getattr(instance, '_user_ids', []))
+    else:
+        conditional.touch(CustomUser, pk_set or [])
+
+
+@receiver(m2m_changed, sender=CustomUser.favorite_movies.through)
+def sync_favorite_movies(sender, instance, action, reverse, pk_set, **kwargs):
+    favorite_movies.changed(instance, action, reverse, pk_set)
+
+
+@receiver(pre_delete, sender=CustomUser)
+def forget_deleted_user_favorite_movies(sender, instance, **kwargs):
+    favorite_movies.forget_user(instance)
+
+
+@receiver(pre_delete, sender=Movie)
+def forget_deleted_movie_favorites(sender, instance, **kwargs):
+    favorite_movies.forget_target(instance)
+
+
+def ratings_changed(movie_ids):
+    """Aggregates were updated in SQL, which the Movie signals never see"""
+    ids = [pk for pk in movie_ids if pk is not None]
+    if ids:
+        bump_movies(ids)
+        bump_list_cache(Movie)
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, raw=False, **kwargs):
+    # Reviews loaded with both fields already carry _stored_rating (see Review.from_db)
+    if not raw and not instance._state.adding and not hasattr(instance, '_stored_rating'):
+        instance._stored_rating = Review.objects.filter(pk=instance.pk).values_list('movie_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    stored = getattr(instance, '_stored_rating', None)
+    if created:
+        ratings.adjust(instance.movie_id, instance.rating, 1)
+        changed = [instance.movie_id]
+    elif stored is None:
+        # Nothing known about the row before this save; recompute_ratings repairs it
+        return
+    elif stored[0] != instance.movie_id:
+        movie_id, rating = stored
+        ratings.adjust(movie_id, -rating, -1)
+        ratings.adjust(instance.movie_id, instance.rating, 1)
+        changed = [movie_id, instance.movie_id]
+    elif stored[1] != instance.rating:
+        movie_id, rating = stored
+        ratings.adjust(movie_id, instance.rating - rating, 0)
+        changed = [movie_id]
+    else:
+        return
+    instance._stored_rating = (instance.movie_id, instance.rating)
+    ratings_changed(changed)
+
+
+@receiver(pre_delete, sender=Review)
+def remember_deleted_review_rating(sender, instance, **kwargs):
+    # Deferred fields can no longer be loaded once the row is gone
+    if getattr(instance, '_stored_rating', None) is None:
+        instance._stored_rating = (instance.movie_id, instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance, **kwargs):
+    movie_id, rating = getattr(instance, '_stored_rating', (instance.movie_id, instance.rating))
+    ratings.adjust(movie_id, -rating, -1)
+    ratings_changed([movie_id])
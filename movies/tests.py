@@ -0,0 +1,116 @@
+from rest_framework.test import APITestCase
+from rest_framework import status
+from .models import Movie, Director, Actor
+
+
+class MovieSearchIndexTests(APITestCase):
+    def setUp(self):
+        self.nolan = Director.objects.create(name="Christopher Nolan")
+        self.dicaprio = Actor.objects.create(name="Leonardo DiCaprio")
+        self.inception = Movie.objects.create(
+            title="Inception", description="A thief who steals secrets through dreams.", release_year=2010
+        )
+        self.inception.directors.add(self.nolan)
+        self.inception.actors.add(self.dicaprio)
+        self.dreamgirls = Movie.objects.create(title="Dreamgirls", description="Musical drama.", release_year=2006)
+
+    def search(self, query):
+        resp = self.client.get("/api/movies/", {"search": query})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return [m["id"] for m in resp.data["results"]]
+
+    def test_search_covers_people_and_description(self):
+        self.assertEqual(self.search("nolan"), [self.inception.id])
+        self.assertEqual(self.search("leonardo"), [self.inception.id])
+        self.assertEqual(self.search("thief secrets"), [self.inception.id])
+
+    def test_title_outranks_description(self):
+        self.assertEqual(self.search("dream"), [self.dreamgirls.id, self.inception.id])
+
+    def test_person_edits_refresh_index(self):
+        self.nolan.name = "Denis Villeneuve"
+        self.nolan.save()
+        self.assertEqual(self.search("nolan"), [])
+        self.assertEqual(self.search("villeneuve"), [self.inception.id])
+        self.dicaprio.movies.clear()
+        self.assertEqual(self.search("dicaprio"), [])
+        self.inception.actors.add(self.dicaprio)
+        self.dicaprio.delete()
+        self.assertEqual(self.search("dicaprio"), [])
+
+    def test_html_movie_list_uses_index(self):
+        resp = self.client.get("/movies/", {"q": "christopher"})
+        self.assertEqual(list(resp.context["page_obj"]), [self.inception])
+
+
+class RatingAggregateTests(APITestCase):
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        self.user = get_user_model().objects.create_user(username="critic", password="pass12345")
+        self.movie = Movie.objects.create(title="Rated", description="", release_year=2000)
+        self.other = Movie.objects.create(title="Other", description="", release_year=2001)
+        self.client.force_authenticate(self.user)
+
+    def assertAggregates(self, movie, total, count, rating):
+        movie.refresh_from_db()
+        self.assertEqual((movie.rating_sum, movie.rating_count), (total, count))
+        self.assertAlmostEqual(movie.rating, rating)
+
+    def test_api_create_update_delete(self):
+        first = self.client.post("/api/reviews/", {"movie": self.movie.id, "rating": 8}).data
+        self.client.post("/api/reviews/", {"movie": self.movie.id, "rating": 5})
+        self.assertAggregates(self.movie, 13, 2, 6.5)
+
+        self.client.patch(f"/api/reviews/{first['id']}/", {"rating": 10})
+        self.assertAggregates(self.movie, 15, 2, 7.5)
+        self.client.patch(f"/api/reviews/{first['id']}/", {"movie": self.other.id})
+        self.assertAggregates(self.movie, 5, 1, 5)
+        self.assertAggregates(self.other, 10, 1, 10)
+
+        self.client.delete(f"/api/reviews/{first['id']}/")
+        self.assertAggregates(self.other, 0, 0, 0)
+        # The API representation is refreshed with the new average
+        self.assertEqual(self.client.get(f"/api/movies/{self.movie.id}/").data["rating"], 5)
+
+    def test_html_review_updates_without_scanning_reviews(self):
+        from django.test.utils import CaptureQueriesContext
+        from django.db import connection
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(f"/movies/{self.movie.id}/", {"rating": 9, "comment": "Great"})
+        self.assertFalse([q for q in queries if "AVG(" in q["sql"].upper()])
+        self.assertAggregates(self.movie, 9, 1, 9)
+
+    def test_recompute_repairs_drift(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import Review
+        Review.objects.bulk_create([Review(movie=self.movie, user=self.user, rating=r) for r in (4, 6)])
+        self.assertAggregates(self.movie, 0, 0, 0)
+        out = StringIO()
+        call_command("recompute_ratings", stdout=out)
+        self.assertIn("Repaired 1 movies", out.getvalue())
+        self.assertAggregates(self.movie, 10, 2, 5)
+
+    def test_saving_review_with_movie_and_rating_deferred(self):
+        from .models import Review
+        review = Review.objects.create(movie=self.movie, user=self.user, rating=8)
+        deferred = Review.objects.only("id", "comment").get(pk=review.pk)
+        deferred.comment = "Edited"
+        deferred.save()
+        self.assertAggregates(self.movie, 8, 1, 8)
+
+    def test_saving_review_with_rating_deferred(self):
+        from .models import Review
+        review = Review.objects.create(movie=self.movie, user=self.user, rating=8)
+        partial = Review.objects.only("id", "movie_id", "comment").get(pk=review.pk)
+        partial.comment = "Edited"
+        partial.save()
+        self.assertAggregates(self.movie, 8, 1, 8)
+        partial = Review.objects.only("id", "movie_id", "comment").get(pk=review.pk)
+        partial.rating = 6
+        partial.save()
+        self.assertAggregates(self.movie, 6, 1, 6)
+
+        Review.objects.only("id").get(pk=review.pk).delete()
+        self.assertAggregates(self.movie, 0, 0, 0)
@@ -1,12 +1,19 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import JsonResponse
-from django.db.models import Q, Avg
-from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse
+from django.db.models import prefetch_related_objects
 from django.contrib import messages
-from .models import Movie, Genre, Review
+from .models import Movie, Genre, Review, Director, Actor
 from .forms import ReviewForm, MovieForm
+from .search import movie_index
+from accounts.favorites import favorite_movies
+from catalog import fragments, query_cache
+from catalog.conditional import conditional_page
+from catalog.facets import FACETS
+from catalog.page_cache import cache_anonymous
 
+@cache_anonymous(Movie, Genre, Director, Actor)
+@conditional_page(Movie, Genre, Director, Actor)
 def movie_list(request):
     movies = Movie.objects.all()
     
@@ -24,12 +31,7 @@ def movie_list(request):
     # Search
     query = request.GET.get('q')
     if query:
-        movies = movies.filter(
-            Q(title__icontains=query) |
-            Q(description__icontains=query) |
-            Q(directors__name__icontains=query) |
-            Q(actors__name__icontains=query)
-        ).distinct()
+        movies = movie_index.search(movies, query)
     
     # Filtering
     genre_filter = request.GET.get('genre')
@@ -44,18 +46,29 @@ def movie_list(request):
     if rating_filter:
         movies = movies.filter(rating__gte=float(rating_filter))
     
-    # Sorting
-    sort_by = request.GET.get('sort', '-release_year')
-    if sort_by in ['title', 'release_year', 'rating', '-title', '-release_year', '-rating']:
+    # Sorting (search results default to relevance)
+    sort_by = request.GET.get('sort', 'relevance' if query else '-release_year')
+    if sort_by == 'relevance' and query:
+        movies = movies.order_by('-search_rank', '-release_year')
+    elif sort_by == 'popularity':
+        movies = movies.order_by('-favorite_count', 'id')
+    elif sort_by in ['title', 'release_year', 'rating', '-title', '-release_year', '-rating']:
         movies = movies.order_by(sort_by)
     
-    # Pagination
-    paginator = Paginator(movies, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination (page ids and totals are cached per normalised filter set)
+    page_obj = query_cache.cached_page(
+        'movies', request.GET, [Movie, Genre, Director, Actor], movies,
+        hydrate=Movie.objects.all(), per_page=12
+    )
     
-    genres = Genre.objects.all()
-    years = Movie.objects.values_list('release_year', flat=True).distinct().order_by('-release_year')
+    favorite_ids = favorite_movies.ids(request.user)
+    for movie in page_obj:
+        movie.is_favorited = movie.pk in favorite_ids
+    # Only cards missing from the fragment cache need their genres
+    prefetch_related_objects(fragments.prime(request, 'movie-card', page_obj), 'genres')
+    
+    genres = FACETS['movie-genres'].options()
+    years = FACETS['movie-years'].options()
     
     context = {
         'page_obj': page_obj,
@@ -66,14 +79,12 @@ def movie_list(request):
     }
     return render(request, 'movies/movie_list.html', context)
 
+@cache_anonymous(Movie, Genre, Director, Actor, Review)
 def movie_detail(request, movie_id):
     movie = get_object_or_404(Movie, id=movie_id)
     reviews = movie.reviews.all().select_related('user')
     
-    # Check if user has favorited this movie
-    is_favorited = False
-    if request.user.is_authenticated:
-        is_favorited = request.user.favorite_movies.filter(id=movie_id).exists()
+    is_favorited = movie.pk in favorite_movies.ids(request.user)
     
     # Handle review submission
     if request.method == 'POST' and request.user.is_authenticated:
@@ -82,14 +93,10 @@ def movie_detail(request, movie_id):
             review = form.save(commit=False)
             review.movie = movie
             review.user = request.user
+            # The movie's rating aggregates follow via movies.signals
             review.save()
             
-            # Update movie rating
-            avg_rating = movie.reviews.aggregate(Avg('rating'))['rating__avg']
-            movie.rating = avg_rating or 0
-            movie.save()
-            
-            return redirect('movie_detail', movie_id=movie_id)
+            return redirect('movies:movie_detail', movie_id=movie_id)
     else:
         form = ReviewForm()
     
@@ -103,19 +110,14 @@ def movie_detail(request, movie_id):
 
 @login_required
 def toggle_favorite_movie(request, movie_id):
-    movie = get_object_or_404(Movie, id=movie_id)
-    
-    if request.user.favorite_movies.filter(id=movie_id).exists():
-        request.user.favorite_movies.remove(movie)
-        is_favorited = False
-    else:
-        request.user.favorite_movies.add(movie)
-        is_favorited = True
+    is_favorited = favorite_movies.toggle(request.user, movie_id)
+    if is_favorited is None:
+        raise Http404
     
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({'is_favorited': is_favorited})
     
-    return redirect('movie_detail', movie_id=movie_id)
+    return redirect('movies:movie_detail', movie_id=movie_id)
 
 
 @user_passes_test(lambda u: u.is_staff)
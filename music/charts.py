@@ -0,0 +1,171 @@
+"""
+Materialized popular-tracks leaderboards, overall and per genre.
+
+A board holds the top ``CHART_SIZE + CHART_BUFFER`` tracks by rating (ties
+broken by title, then id) as ready-to-render dicts, so the home page and
+``/api/charts/`` are served without touching the database. Saving a track
+moves only its own entry on the boards it belongs to; the spare entries let
+tracks fall out of the top ``CHART_SIZE`` without a rebuild. Edits that
+change genre membership retire every per-genre board at once, and a board
+that is missing or has run short is rebuilt from a single query on read.
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from catalog.cache import shared_cache
+from .models import Album, Track
+
+CHART_SIZE = 10
+CHART_BUFFER = 10
+CAPACITY = CHART_SIZE + CHART_BUFFER
+DEFAULT_TIMEOUT = 86400
+LOCK_TIMEOUT = 5
+LOCK_WAIT = 0.2
+
+GENERATION_KEY = 'charts:genre-gen'
+
+
+def _timeout():
+    return getattr(settings, 'CHART_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def _genre_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def _board_key(genre_id=None):
+    if genre_id is None:
+        return 'charts:overall'
+    return f'charts:genre:{_genre_generation()}:{genre_id}'
+
+
+def _rank(entry):
+    return (-entry['rating'], entry['title'], entry['id'])
+
+
+def _acquire(lock, wait=LOCK_WAIT):
+    deadline = time.monotonic() + wait
+    while not cache.add(lock, 1, LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def _fallback_artists(track_ids):
+    """track id -> name of its first linked artist, for tracks without an album"""
+    names = {}
+    rows = Track.artists.through.objects.filter(track_id__in=track_ids).order_by('track_id', '-artist_id')
+    for track_id, name in rows.values_list('track_id', 'artist__name'):
+        names[track_id] = name
+    return names
+
+
+def entries(queryset):
+    """Board entries for the tracks in ``queryset``, in its order"""
+    rows = list(queryset.values(
+        'id', 'title', 'duration', 'rating', 'album_id', 'album__title', 'album__artist__name',
+    ))
+    orphans = [row['id'] for row in rows if row['album_id'] is None]
+    fallback = _fallback_artists(orphans) if orphans else {}
+    return [{
+        'id': row['id'],
+        'title': row['title'],
+        'duration': row['duration'],
+        'rating': row['rating'],
+        'album_id': row['album_id'],
+        'album_title': row['album__title'],
+        'artist': row['album__artist__name'] or fallback.get(row['id']),
+    } for row in rows]
+
+
+def _rebuild(key, genre_id):
+    queryset = Track.objects.all()
+    if genre_id is not None:
+        queryset = queryset.filter(album__genres=genre_id)
+    tracks = entries(queryset.order_by('-rating', 'title', 'id')[:CAPACITY])
+    board = {'tracks': tracks, 'complete': len(tracks) < CAPACITY}
+    # A concurrent update may be writing a newer board; never overwrite it
+    lock = f'{key}:lock'
+    if _acquire(lock, wait=0):
+        try:
+            cache.set(key, board, _timeout())
+        finally:
+            cache.delete(lock)
+    return board
+
+
+def chart(genre_id=None, limit=CHART_SIZE):
+    """The top ``limit`` (at most ``CHART_SIZE``) entries, overall or within a genre"""
+    key = _board_key(genre_id)
+    board = cache.get(key)
+    if board is None:
+        board = _rebuild(key, genre_id)
+    return board['tracks'][:min(limit, CHART_SIZE)]
+
+
+def _apply(key, changes):
+    """
+    Replace the entries of ``changes`` (track id -> entry, or None when the
+    track left the board's scope) on the board under ``key``.
+    """
+    lock = f'{key}:lock'
+    if not _acquire(lock):
+        # Dropping the board is always safe; a lost update is not
+        cache.delete(key)
+        return
+    try:
+        board = shared_cache().get(key)
+        if board is None:
+            return
+        tracks = [entry for entry in board['tracks'] if entry['id'] not in changes]
+        complete = board['complete']
+        # Everything ranked after the last entry of a partial board is unknown
+        floor = _rank(board['tracks'][-1]) if not complete and board['tracks'] else None
+        for entry in changes.values():
+            if entry is not None and (floor is None or _rank(entry) <= floor):
+                tracks.append(entry)
+        tracks.sort(key=_rank)
+        if not complete and len(tracks) < CHART_SIZE:
+            cache.delete(key)
+            return
+        if len(tracks) > CAPACITY:
+            tracks, complete = tracks[:CAPACITY], False
+        cache.set(key, {'tracks': tracks, 'complete': complete}, _timeout())
+    finally:
+        cache.delete(lock)
+
+
+def update_tracks(track_ids):
+    """Move ``track_ids`` to their current place on every board they belong to"""
+    track_ids = set(track_ids)
+    if not track_ids:
+        return
+    fresh = {entry['id']: entry for entry in entries(Track.objects.filter(pk__in=track_ids))}
+    scopes = defaultdict(set)
+    scopes[None] = track_ids
+    rows = Album.genres.through.objects.filter(album__tracks__in=list(fresh))
+    for track_id, genre_id in rows.values_list('album__tracks', 'genre_id'):
+        scopes[genre_id].add(track_id)
+    for genre_id, ids in scopes.items():
+        _apply(_board_key(genre_id), {pk: fresh.get(pk) for pk in ids})
+
+
+def remove_tracks(track_ids):
+    """Take deleted tracks off the overall board and retire the per-genre boards"""
+    track_ids = set(track_ids)
+    if track_ids:
+        _apply(_board_key(), dict.fromkeys(track_ids))
+        reset_genre_boards()
+
+
+def reset_genre_boards():
+    """Retire every per-genre board; each is rebuilt on its next read"""
+    cache.set(GENERATION_KEY, time.time_ns(), None)
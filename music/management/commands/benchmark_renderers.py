@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from api.renderers import FastJSONRenderer, MessagePackRenderer
+from music.models import Artist, Genre, Album, Track
+from music.serializers import TrackSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare rendering time of TrackSerializer pages: stdlib JSON vs orjson vs MessagePack"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=100)
+        parser.add_argument("--rounds", type=int, default=200)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options["page_size"], options["rounds"])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _run(self, page_size, rounds):
+        # Synthetic page inside a rolled-back transaction, so no data is kept
+        genres = [Genre.objects.create(name=f"bench-genre-{i}") for i in range(3)]
+        artists = [Artist.objects.create(name=f"bench-artist-{i}", bio="биография " * 30) for i in range(page_size)]
+        tracks = []
+        for i, artist in enumerate(artists):
+            album = Album.objects.create(title=f"bench-album-{i}", artist=artist, release_year=2000)
+            album.genres.set(genres)
+            track = Track.objects.create(title=f"bench-track-{i}", album=album, duration=200, rating=4.5)
+            track.artists.set(artists[i:i + 2])
+            tracks.append(track)
+        page = {"count": page_size, "next": None, "previous": None,
+                "results": TrackSerializer(tracks, many=True).data}
+
+        baseline = JSONRenderer().render(page)
+        fast = FastJSONRenderer().render(page)
+        if fast != baseline:
+            self.stderr.write("FastJSONRenderer output differs from JSONRenderer")
+        renderers = [("json (stdlib)", JSONRenderer()), ("json (fast)", FastJSONRenderer())]
+        if MessagePackRenderer.available:
+            renderers.append(("msgpack", MessagePackRenderer()))
+
+        base_ms = None
+        for name, renderer in renderers:
+            ms = self._time(lambda: renderer.render(page), rounds)
+            base_ms = base_ms or ms
+            size = len(renderer.render(page))
+            self.stdout.write(f"{name}: {ms:.3f} ms/page, {size} bytes, speedup x{base_ms / ms:.1f}")
+
+    def _time(self, fn, rounds):
+        fn()
+        started = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        return (time.perf_counter() - started) * 1000 / rounds
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from music.models import Artist, Genre, Album, Track
+from music.projections import serialize_tracks, serialize_albums
+from music.serializers import TrackSerializer, AlbumSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare list serialization time: ModelSerializer vs values() projections"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=20)
+        parser.add_argument("--rounds", type=int, default=200)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options["page_size"], options["rounds"])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _run(self, page_size, rounds):
+        # Synthetic page inside a rolled-back transaction, so no data is kept
+        genres = [Genre.objects.create(name=f"bench-genre-{i}") for i in range(3)]
+        artists = [Artist.objects.create(name=f"bench-artist-{i}", bio="bio" * 50) for i in range(page_size)]
+        tracks = []
+        for i, artist in enumerate(artists):
+            album = Album.objects.create(title=f"bench-album-{i}", artist=artist, release_year=2000)
+            album.genres.set(genres)
+            track = Track.objects.create(title=f"bench-track-{i}", album=album, duration=200)
+            track.artists.set(artists[i:i + 2])
+            tracks.append(track)
+        albums = list(Album.objects.filter(title__startswith="bench-album-"))
+        track_page = list(Track.objects.filter(pk__in=[t.pk for t in tracks]))
+
+        rows = [
+            ("tracks", lambda: TrackSerializer(track_page, many=True).data, lambda: serialize_tracks(track_page)),
+            ("albums", lambda: AlbumSerializer(albums, many=True).data, lambda: serialize_albums(albums)),
+        ]
+        for name, slow, fast in rows:
+            slow_ms = self._time(slow, rounds)
+            fast_ms = self._time(fast, rounds)
+            self.stdout.write(
+                f"{name}: serializer {slow_ms:.2f} ms/page, projection {fast_ms:.2f} ms/page, "
+                f"speedup x{slow_ms / fast_ms:.1f}"
+            )
+
+    def _time(self, fn, rounds):
+        fn()
+        started = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        return (time.perf_counter() - started) * 1000 / rounds
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from catalog.search import get_indexes
+
+
+class Command(BaseCommand):
+    help = "Rebuild full-text search indexes for the catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        for index in get_indexes():
+            if not index.supported:
+                self.stdout.write(self.style.WARNING(f"{index.table}: backend not supported, skipped"))
+                continue
+            count = index.rebuild(batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"{index.table}: indexed {count} objects"))
@@ -0,0 +1,30 @@
+# Full-text search side table for tracks
+
+from django.db import migrations
+
+from catalog.search import create_search_table, drop_search_table
+
+TABLE = 'music_track_search'
+
+
+def create_index(apps, schema_editor):
+    from music.search import track_index
+
+    create_search_table(schema_editor, TABLE, ['title', 'album', 'artists'])
+    Track = apps.get_model('music', 'Track')
+    track_index.rebuild(queryset=Track.objects.select_related('album').prefetch_related('artists'))
+
+
+def drop_index(apps, schema_editor):
+    drop_search_table(schema_editor, TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0009_alter_album_release_year_alter_album_title_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:49
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_favorite_counts(apps, schema_editor):
+    Track = apps.get_model('music', 'Track')
+    Favorite = apps.get_model('accounts', 'CustomUser').favorite_music.through
+    rows = Favorite.objects.order_by().values('track').annotate(count=Count('id'))
+    Track.objects.bulk_update(
+        [Track(pk=row['track'], favorite_count=row['count']) for row in rows], ['favorite_count'], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('music', '0011_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='favorite_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['-favorite_count', 'id'], name='track_popularity_idx'),
+        ),
+        migrations.RunPython(fill_favorite_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+POSITION_GAP = 1024
+
+
+def fill_positions(apps, schema_editor):
+    PlaylistTrack = apps.get_model('music', 'PlaylistTrack')
+    entries = []
+    playlist_id, position = None, 0
+    for entry in PlaylistTrack.objects.order_by('playlist_id', 'id').only('id', 'playlist_id'):
+        if entry.playlist_id != playlist_id:
+            playlist_id, position = entry.playlist_id, 0
+        position += POSITION_GAP
+        entry.position = position
+        entries.append(entry)
+    PlaylistTrack.objects.bulk_update(entries, ['position'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0012_favorite_count'),
+    ]
+
+    operations = [
+        # The auto-created join table becomes PlaylistTrack, keeping its rows
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='PlaylistTrack',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('playlist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='music.playlist')),
+                        ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='playlist_entries', to='music.track')),
+                    ],
+                    options={
+                        'db_table': 'music_playlist_tracks',
+                        'unique_together': {('playlist', 'track')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='playlist',
+                    name='tracks',
+                    field=models.ManyToManyField(blank=True, related_name='in_playlists', through='music.PlaylistTrack', to='music.track'),
+                ),
+            ],
+        ),
+        migrations.AlterModelTable(
+            name='playlisttrack',
+            table=None,
+        ),
+        migrations.AddField(
+            model_name='playlisttrack',
+            name='position',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_positions, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='playlisttrack',
+            options={'ordering': ['position', 'id']},
+        ),
+        migrations.AlterUniqueTogether(
+            name='playlisttrack',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='playlisttrack',
+            constraint=models.UniqueConstraint(fields=('playlist', 'track'), name='playlist_track_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='playlisttrack',
+            index=models.Index(fields=['playlist', 'position'], name='playlist_position_idx'),
+        ),
+    ]
@@ -44,6 +44,8 @@ class Album(models.Model):
             models.Index(fields=['title'], name='album_title_idx'),
             models.Index(fields=['release_year'], name='album_year_idx'),
             models.Index(fields=['artist', 'release_year'], name='album_artist_year_idx'),
+            # Keyset pagination: ordering column + id tie-breaker
+            models.Index(fields=['release_year', 'id'], name='album_year_id_idx'),
         ]
 
     def __str__(self):
@@ -62,12 +64,18 @@ class Track(models.Model):
     duration = models.IntegerField(help_text="Duration in seconds")
     rating = models.FloatField(default=0, db_index=True)
     artists = models.ManyToManyField(Artist, related_name="tracks", blank=True)
+    # Users who favourited the track, written behind by catalog.counters
+    favorite_count = models.IntegerField(default=0)
 
     class Meta:
         indexes = [
             models.Index(fields=['title'], name='track_title_idx'),
             models.Index(fields=['rating'], name='track_rating_idx'),
             models.Index(fields=['album', 'title'], name='track_album_title_idx'),
+            # Keyset pagination: ordering column + id tie-breaker
+            models.Index(fields=['title', 'id'], name='track_title_id_idx'),
+            # ?sort=popularity / ?ordering=popularity
+            models.Index(fields=['-favorite_count', 'id'], name='track_popularity_idx'),
         ]
 
     def __str__(self):
@@ -79,7 +87,33 @@ class Playlist(models.Model):
     description = models.TextField(blank=True, null=True)
     is_public = models.BooleanField(default=False)
     user = models.ForeignKey('accounts.CustomUser', on_delete=models.CASCADE, related_name='playlists')
-    tracks = models.ManyToManyField(Track, related_name='in_playlists', blank=True)
+    tracks = models.ManyToManyField(Track, related_name='in_playlists', blank=True, through='PlaylistTrack')
 
     def __str__(self):
         return f"{self.name} ({'public' if self.is_public else 'private'})"
+
+    def ordered_tracks(self):
+        return self.tracks.order_by(*PlaylistTrack.TRACK_ORDER)
+
+
+class PlaylistTrack(models.Model):
+    """A track's place in a playlist; see music.playlists for the position scheme"""
+    # Order of Track querysets joined through this table
+    TRACK_ORDER = ('playlist_entries__position', 'playlist_entries__id')
+
+    playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, related_name='entries')
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='playlist_entries')
+    # Gap-based sort key; rows added through Playlist.tracks get one on post_add
+    position = models.BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['position', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['playlist', 'track'], name='playlist_track_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['playlist', 'position'], name='playlist_position_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.playlist_id}:{self.track_id}@{self.position}"
@@ -0,0 +1,213 @@
+"""
+Ordered playlist edits.
+
+Each ``PlaylistTrack`` row carries a sparse integer ``position``; new rows
+are spaced ``POSITION_GAP`` apart. Inserting or moving a track reads at
+most the two neighbours of the target slot through the
+``(playlist, position)`` index and writes that one row with the midpoint of
+their positions. Only when two neighbours have no room left between them is
+the playlist renumbered, in one ``bulk_update``. Membership is a lookup on
+the ``(playlist, track)`` unique index. Bulk edits (``extend``, ``discard``,
+``assign``) write only the rows that differ, with bulk inserts and deletes;
+``assign`` leaves every row that kept its relative order where it is.
+"""
+import bisect
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+
+from .models import PlaylistTrack
+
+POSITION_GAP = 1024
+
+
+def _entries(playlist):
+    return PlaylistTrack.objects.filter(playlist=playlist)
+
+
+def contains(playlist, track_id):
+    return _entries(playlist).filter(track_id=track_id).exists()
+
+
+def renumber(playlist):
+    """Respace every position ``POSITION_GAP`` apart, keeping the order"""
+    entries = list(_entries(playlist).order_by('position', 'id').only('id', 'position'))
+    for index, entry in enumerate(entries, start=1):
+        entry.position = index * POSITION_GAP
+    PlaylistTrack.objects.bulk_update(entries, ['position'], batch_size=500)
+
+
+def _slot(playlist, index, exclude=None):
+    """Position for a row placed at ``index`` (``None``: the end), or None if there is no room"""
+    entries = _entries(playlist)
+    if exclude is not None:
+        entries = entries.exclude(track_id=exclude)
+    neighbours = []
+    if index is not None:
+        positions = entries.order_by('position', 'id').values_list('position', flat=True)
+        neighbours = list(positions[max(index - 1, 0):index + 1])
+    if index is None or (index > 0 and not neighbours):
+        last = entries.aggregate(last=Max('position'))['last']
+        return POSITION_GAP if last is None else last + POSITION_GAP
+    if index <= 0:
+        before, after = None, neighbours[0] if neighbours else None
+    else:
+        before, after = neighbours[0], neighbours[1] if len(neighbours) > 1 else None
+    if before is None and after is None:
+        return POSITION_GAP
+    if before is None:
+        return after - POSITION_GAP
+    if after is None:
+        return before + POSITION_GAP
+    if after - before < 2:
+        return None
+    return (before + after) // 2
+
+
+def _place(playlist, index, exclude=None):
+    position = _slot(playlist, index, exclude)
+    if position is None:
+        renumber(playlist)
+        position = _slot(playlist, index, exclude)
+    return position
+
+
+def insert(playlist, track_id, index=None):
+    """Add ``track_id`` at ``index`` (default: the end); False if it is already there"""
+    with transaction.atomic():
+        position = _place(playlist, index)
+        try:
+            with transaction.atomic():
+                PlaylistTrack.objects.create(playlist=playlist, track_id=track_id, position=position)
+        except IntegrityError:
+            return False
+    return True
+
+
+def move(playlist, track_id, index):
+    """Move ``track_id`` to ``index``; False if it is not in the playlist"""
+    with transaction.atomic():
+        position = _place(playlist, index, exclude=track_id)
+        return bool(_entries(playlist).filter(track_id=track_id).update(position=position))
+
+
+def remove(playlist, track_id):
+    """Take ``track_id`` out; False if it was not in the playlist"""
+    deleted, _ = _entries(playlist).filter(track_id=track_id).delete()
+    return bool(deleted)
+
+
+def place_unpositioned(playlist_ids):
+    """Give rows added through ``Playlist.tracks`` (no position yet) places at the end"""
+    for playlist_id in playlist_ids:
+        entries = PlaylistTrack.objects.filter(playlist_id=playlist_id)
+        pending = list(entries.filter(position__isnull=True).order_by('id').values_list('id', flat=True))
+        if not pending:
+            continue
+        last = entries.aggregate(last=Max('position'))['last'] or 0
+        # Rows were inserted in id order, so an offset from the id keeps it
+        entries.filter(id__in=pending).update(position=last + (F('id') - pending[0] + 1) * POSITION_GAP)
+
+
+def extend(playlist, track_ids):
+    """Append the ``track_ids`` not yet in the playlist with one bulk insert; returns them"""
+    with transaction.atomic():
+        entries = _entries(playlist)
+        present = set(entries.values_list('track_id', flat=True))
+        new = [pk for pk in dict.fromkeys(track_ids) if pk not in present]
+        if new:
+            last = entries.aggregate(last=Max('position'))['last'] or 0
+            PlaylistTrack.objects.bulk_create([
+                PlaylistTrack(playlist=playlist, track_id=pk, position=last + index * POSITION_GAP)
+                for index, pk in enumerate(new, start=1)
+            ], batch_size=500, ignore_conflicts=True)
+    return new
+
+
+def discard(playlist, track_ids):
+    """Take every one of ``track_ids`` out with one delete; returns how many were there"""
+    if not track_ids:
+        return 0
+    deleted, _ = _entries(playlist).filter(track_id__in=list(track_ids)).delete()
+    return deleted
+
+
+def _longest_increasing(keys):
+    """Indices of one longest strictly increasing subsequence of ``keys``"""
+    tails, tail_keys, previous = [], [], []
+    for i, key in enumerate(keys):
+        j = bisect.bisect_left(tail_keys, key)
+        previous.append(tails[j - 1] if j else None)
+        if j == len(tails):
+            tails.append(i)
+            tail_keys.append(key)
+        else:
+            tails[j] = i
+            tail_keys[j] = key
+    kept = set()
+    i = tails[-1] if tails else None
+    while i is not None:
+        kept.add(i)
+        i = previous[i]
+    return kept
+
+
+def _spread(entries, kept):
+    """
+    Positions for ``entries`` (``None`` for new rows) in list order: the
+    ``kept`` indices keep theirs, every other row is spaced between its kept
+    neighbours. None when some neighbours have no room left.
+    """
+    positions = [None] * len(entries)
+    before, run = None, []
+    for i in range(len(entries) + 1):
+        if i < len(entries) and i not in kept:
+            run.append(i)
+            continue
+        after = entries[i].position if i < len(entries) else None
+        if run:
+            if before is not None and after is not None:
+                step = (after - before) // (len(run) + 1)
+                if step < 1:
+                    return None
+            else:
+                step = POSITION_GAP
+            if before is None and after is not None:
+                first = after - len(run) * step
+            else:
+                first = (before or 0) + step
+            for offset, index in enumerate(run):
+                positions[index] = first + offset * step
+            run = []
+        if i < len(entries):
+            positions[i] = before = after
+    return positions
+
+
+def assign(playlist, track_ids):
+    """
+    Make the playlist exactly ``track_ids``, in that order. Only the
+    difference is written: one delete for dropped tracks, one bulk insert
+    for new ones and a ``bulk_update`` of the rows that moved. The longest
+    run of rows already in the right relative order keeps its positions;
+    the others get places between them.
+    """
+    wanted = list(dict.fromkeys(track_ids))
+    with transaction.atomic():
+        current = {entry.track_id: entry for entry in _entries(playlist).only('id', 'track_id', 'position')}
+        discard(playlist, current.keys() - set(wanted))
+        entries = [current.get(pk) for pk in wanted]
+        placed = [i for i, entry in enumerate(entries) if entry is not None and entry.position is not None]
+        kept = _longest_increasing([(entries[i].position, entries[i].id) for i in placed])
+        positions = _spread(entries, {placed[i] for i in kept})
+        if positions is None:
+            positions = [index * POSITION_GAP for index in range(1, len(wanted) + 1)]
+        created, moved = [], []
+        for pk, entry, position in zip(wanted, entries, positions):
+            if entry is None:
+                created.append(PlaylistTrack(playlist=playlist, track_id=pk, position=position))
+            elif entry.position != position:
+                entry.position = position
+                moved.append(entry)
+        PlaylistTrack.objects.bulk_create(created, batch_size=500)
+        PlaylistTrack.objects.bulk_update(moved, ['position'], batch_size=500)
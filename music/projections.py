@@ -0,0 +1,81 @@
+"""
+Fast read path for track and album lists.
+
+Builds the same JSON shape as ``TrackSerializer`` / ``AlbumSerializer`` from
+``values()`` rows, with one batched query per related table for the whole
+page, instead of instantiating a tree of DRF fields for every object.
+"""
+from collections import defaultdict
+
+from .models import Album, Track
+
+ARTIST_FIELDS = ('id', 'name', 'bio', 'country', 'formed_year')
+
+
+def _artist(row, prefix=''):
+    return {field: row[prefix + field] for field in ARTIST_FIELDS}
+
+
+def album_genres(album_ids):
+    """album id -> [{id, name}, ...]"""
+    genres = defaultdict(list)
+    rows = Album.genres.through.objects.filter(album_id__in=album_ids).order_by('genre_id')
+    for album_id, genre_id, name in rows.values_list('album_id', 'genre_id', 'genre__name'):
+        genres[album_id].append({'id': genre_id, 'name': name})
+    return genres
+
+
+def track_artists(track_ids):
+    """track id -> [artist dict, ...]"""
+    artists = defaultdict(list)
+    lookups = ['track_id'] + [f'artist__{field}' for field in ARTIST_FIELDS]
+    rows = Track.artists.through.objects.filter(track_id__in=track_ids).order_by('artist_id')
+    for row in rows.values(*lookups):
+        artists[row['track_id']].append(_artist(row, 'artist__'))
+    return artists
+
+
+def albums_by_id(album_ids):
+    """album id -> AlbumSerializer-shaped dict"""
+    album_ids = list(album_ids)
+    if not album_ids:
+        return {}
+    lookups = ['id', 'title', 'release_year', 'description'] + [f'artist__{f}' for f in ARTIST_FIELDS]
+    genres = album_genres(album_ids)
+    return {
+        row['id']: {
+            'id': row['id'],
+            'title': row['title'],
+            'artist': _artist(row, 'artist__'),
+            'release_year': row['release_year'],
+            'description': row['description'],
+            'genres': genres.get(row['id'], []),
+        }
+        for row in Album.objects.filter(id__in=album_ids).values(*lookups)
+    }
+
+
+def serialize_albums(albums):
+    """Serialize a page of Album instances (or ids), keeping their order"""
+    ids = [getattr(album, 'pk', album) for album in albums]
+    rows = albums_by_id(ids)
+    return [rows[pk] for pk in ids if pk in rows]
+
+
+def serialize_tracks(tracks):
+    """Serialize a page of Track instances, keeping their order"""
+    tracks = list(tracks)
+    ids = [track.pk for track in tracks]
+    albums = albums_by_id({track.album_id for track in tracks if track.album_id})
+    artists = track_artists(ids)
+    return [
+        {
+            'id': track.pk,
+            'title': track.title,
+            'duration': track.duration,
+            'rating': float(track.rating) if track.rating is not None else None,
+            'album': albums.get(track.album_id),
+            'artists': artists.get(track.pk, []),
+        }
+        for track in tracks
+    ]
@@ -0,0 +1,25 @@
+"""
+Search index for tracks (title, album title and artist names).
+"""
+from catalog.search import SearchIndex, register
+from .models import Track
+
+
+class TrackSearchIndex(SearchIndex):
+    model = Track
+    table = 'music_track_search'
+    columns = {'title': 'A', 'album': 'B', 'artists': 'B'}
+    fallback_lookups = ('title__icontains', 'album__title__icontains', 'artists__name__icontains')
+
+    def get_queryset(self):
+        return Track.objects.select_related('album').prefetch_related('artists')
+
+    def document(self, track):
+        return {
+            'title': track.title,
+            'album': track.album.title if track.album else '',
+            'artists': ' '.join(artist.name for artist in track.artists.all()),
+        }
+
+
+track_index = register(TrackSearchIndex())
@@ -1,26 +1,30 @@
 from rest_framework import serializers
+from catalog.flex_fields import FlexFieldsMixin
+from django.db import transaction
+from catalog.relations import BulkPrimaryKeyRelatedField
 from .models import Genre, Artist, Album, Track, Playlist
+from . import playlists
 
 
-class GenreSerializer(serializers.ModelSerializer):
+class GenreSerializer(FlexFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Genre
         fields = ["id", "name"]
 
 
-class ArtistSerializer(serializers.ModelSerializer):
+class ArtistSerializer(FlexFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Artist
         fields = ["id", "name", "bio", "country", "formed_year"]
 
 
-class AlbumSerializer(serializers.ModelSerializer):
+class AlbumSerializer(FlexFieldsMixin, serializers.ModelSerializer):
     artist = ArtistSerializer(read_only=True)
     artist_id = serializers.PrimaryKeyRelatedField(
         queryset=Artist.objects.all(), source="artist", write_only=True
     )
     genres = GenreSerializer(many=True, read_only=True)
-    genre_ids = serializers.PrimaryKeyRelatedField(
+    genre_ids = BulkPrimaryKeyRelatedField(
         many=True, queryset=Genre.objects.all(), source="genres", write_only=True
     )
 
@@ -38,13 +42,13 @@ class AlbumSerializer(serializers.ModelSerializer):
         ]
 
 
-class TrackSerializer(serializers.ModelSerializer):
+class TrackSerializer(FlexFieldsMixin, serializers.ModelSerializer):
     album = AlbumSerializer(read_only=True)
     album_id = serializers.PrimaryKeyRelatedField(
         allow_null=True, required=False, queryset=Album.objects.all(), source="album", write_only=True
     )
     artists = ArtistSerializer(many=True, read_only=True)
-    artist_ids = serializers.PrimaryKeyRelatedField(
+    artist_ids = BulkPrimaryKeyRelatedField(
         many=True, required=False, queryset=Artist.objects.all(), source="artists", write_only=True
     )
 
@@ -62,13 +66,58 @@ class TrackSerializer(serializers.ModelSerializer):
         ]
 
 
-class PlaylistSerializer(serializers.ModelSerializer):
+class PlaylistEntrySerializer(serializers.Serializer):
+    """A track and (optionally) the index it should end up at"""
+    track_id = serializers.IntegerField(min_value=1)
+    index = serializers.IntegerField(min_value=0, required=False, allow_null=True)
+
+
+class PlaylistSerializer(FlexFieldsMixin, serializers.ModelSerializer):
+    """
+    ``track_ids`` replaces the whole list (in the given order); a PATCH may
+    instead send ``add`` (appended), ``remove`` and ``move`` (``track_id`` /
+    ``index`` pairs, applied in turn). Only the difference is written.
+    """
     tracks = TrackSerializer(many=True, read_only=True)
-    track_ids = serializers.PrimaryKeyRelatedField(
+    track_ids = BulkPrimaryKeyRelatedField(
         many=True, queryset=Track.objects.all(), source="tracks", write_only=True
     )
+    add = BulkPrimaryKeyRelatedField(many=True, queryset=Track.objects.all(), required=False, write_only=True)
+    remove = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, write_only=True)
+    move = serializers.ListField(child=PlaylistEntrySerializer(), required=False, write_only=True)
 
     class Meta:
         model = Playlist
-        fields = ["id", "name", "description", "is_public", "tracks", "track_ids"]
+        fields = ["id", "name", "description", "is_public", "tracks", "track_ids", "add", "remove", "move"]
+
+    def validate_move(self, value):
+        if any(entry.get("index") is None for entry in value):
+            raise serializers.ValidationError("Every move needs an index.")
+        return value
+
+    def create(self, validated_data):
+        edits = self._pop_edits(validated_data)
+        with transaction.atomic():
+            playlist = super().create(validated_data)
+            self._apply_edits(playlist, edits)
+        return playlist
+
+    def update(self, instance, validated_data):
+        edits = self._pop_edits(validated_data)
+        with transaction.atomic():
+            playlist = super().update(instance, validated_data)
+            self._apply_edits(playlist, edits)
+        return playlist
+
+    def _pop_edits(self, validated_data):
+        return {name: validated_data.pop(name) for name in ("tracks", "remove", "add", "move") if name in validated_data}
 
+    def _apply_edits(self, playlist, edits):
+        if "tracks" in edits:
+            playlists.assign(playlist, [track.pk for track in edits["tracks"]])
+        if "remove" in edits:
+            playlists.discard(playlist, edits["remove"])
+        if "add" in edits:
+            playlists.extend(playlist, [track.pk for track in edits["add"]])
+        for entry in edits.get("move", []):
+            playlists.move(playlist, entry["track_id"], entry["index"])
@@ -0,0 +1,293 @@
+"""
+Signal handlers keeping derived music data in sync with the catalog.
+"""
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+from catalog import conditional, query_cache, representations
+from accounts.favorites import favorite_tracks
+from accounts.models import CustomUser
+from catalog.autocomplete import autocomplete
+from . import charts, playlists
+from .models import Track, Album, Artist, Genre, Playlist
+from .search import track_index
+
+
+@receiver(post_save, sender=Track)
+def index_track(sender, instance, raw=False, **kwargs):
+    if not raw:
+        track_index.update([instance.pk])
+
+
+@receiver(post_delete, sender=Track)
+def unindex_track(sender, instance, **kwargs):
+    track_index.remove([instance.pk])
+
+
+@receiver(post_save, sender=Album)
+def index_album_tracks(sender, instance, raw=False, **kwargs):
+    if not raw:
+        track_index.update(instance.tracks.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Artist)
+def index_artist_tracks(sender, instance, raw=False, **kwargs):
+    if not raw:
+        track_index.update(instance.tracks.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Artist)
+def remember_artist_tracks(sender, instance, **kwargs):
+    # The M2M rows are gone by post_delete, so collect the ids up front
+    instance._track_ids = list(instance.tracks.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Artist)
+def reindex_artist_tracks(sender, instance, **kwargs):
+    track_index.update(getattr(instance, '_track_ids', []))
+
+
+@receiver(m2m_changed, sender=Track.artists.through)
+def index_track_artists(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._track_ids = list(instance.tracks.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        track_index.update([instance.pk])
+    elif action == 'post_clear':
+        track_index.update(getattr(instance, '_track_ids', []))
+    else:
+        track_index.update(pk_set or [])
+
+
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=Track)
+def autocomplete_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        autocomplete.update(instance)
+
+
+@receiver(post_delete, sender=Artist)
+@receiver(post_delete, sender=Album)
+@receiver(post_delete, sender=Track)
+def autocomplete_delete(sender, instance, **kwargs):
+    autocomplete.discard(instance)
+
+
+@receiver(post_save, sender=Track)
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Track)
+@receiver(post_delete, sender=Album)
+@receiver(post_delete, sender=Artist)
+@receiver(post_delete, sender=Genre)
+def bump_list_cache(sender, **kwargs):
+    query_cache.bump(sender)
+    conditional.touch(sender)
+
+
+@receiver(m2m_changed, sender=Track.artists.through)
+@receiver(m2m_changed, sender=Album.genres.through)
+def bump_list_cache_m2m(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        query_cache.bump(type(instance))
+        conditional.touch(type(instance))
+
+
+def bump_tracks(ids):
+    ids = list(ids)
+    representations.bump(Track, ids)
+    conditional.touch(Track, ids)
+
+
+def bump_albums(ids):
+    """Albums and the tracks that embed them"""
+    ids = list(ids)
+    representations.bump(Album, ids)
+    conditional.touch(Album, ids)
+    bump_tracks(Track.objects.filter(album_id__in=ids).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Track)
+@receiver(post_delete, sender=Track)
+def bump_track_representation(sender, instance, **kwargs):
+    bump_tracks([instance.pk])
+
+
+@receiver(post_save, sender=Track)
+@receiver(post_delete, sender=Track)
+def touch_track_albums(sender, instance, **kwargs):
+    # Album cards show a track count; _previous_album_id comes from remember_track_album
+    ids = {instance.album_id, getattr(instance, '_previous_album_id', None)} - {None}
+    conditional.touch(Album, ids)
+
+
+@receiver(post_save, sender=Album)
+def bump_album_representation(sender, instance, **kwargs):
+    bump_albums([instance.pk])
+
+
+@receiver(post_delete, sender=Album)
+def bump_deleted_album(sender, instance, **kwargs):
+    # Its tracks cascade and bump themselves
+    representations.bump(Album, [instance.pk])
+    conditional.touch(Album, [instance.pk])
+
+
+@receiver(pre_delete, sender=Genre)
+def remember_genre_albums(sender, instance, **kwargs):
+    instance._album_ids = list(instance.albums.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Artist)
+def bump_artist_representations(sender, instance, **kwargs):
+    bump_albums(instance.albums.values_list('id', flat=True))
+    bump_tracks(instance.tracks.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Artist)
+def bump_deleted_artist(sender, instance, **kwargs):
+    # Its albums cascade and bump themselves; _track_ids comes from remember_artist_tracks
+    bump_tracks(getattr(instance, '_track_ids', []))
+
+
+@receiver(post_save, sender=Genre)
+def bump_genre_representations(sender, instance, **kwargs):
+    bump_albums(instance.albums.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Genre)
+def bump_deleted_genre(sender, instance, **kwargs):
+    bump_albums(getattr(instance, '_album_ids', []))
+
+
+@receiver(m2m_changed, sender=Track.artists.through)
+def bump_track_artists(sender, instance, action, reverse, pk_set, **kwargs):
+    # Reverse pre_clear ids are collected by index_track_artists
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_tracks([instance.pk])
+    elif action == 'post_clear':
+        bump_tracks(getattr(instance, '_track_ids', []))
+    else:
+        bump_tracks(pk_set or [])
+
+
+@receiver(m2m_changed, sender=Album.genres.through)
+def bump_album_genres(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._album_ids = list(instance.albums.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_albums([instance.pk])
+    elif action == 'post_clear':
+        bump_albums(getattr(instance, '_album_ids', []))
+    else:
+        bump_albums(pk_set or [])
+
+
+@receiver(m2m_changed, sender=CustomUser.favorite_music.through)
+def touch_favorite_music(sender, instance, action, reverse, pk_set, **kwargs):
+    # Pages mark the viewer's favourites, so their validators include this stamp
+    if reverse and action == 'pre_clear':
+        instance._user_ids = list(instance.favored_by_users.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        conditional.touch(CustomUser, [instance.pk])
+    elif action == 'post_clear':
+        conditional.touch(CustomUser, getattr(instance, '_user_ids', []))
+    else:
+        conditional.touch(CustomUser, pk_set or [])
+
+
+@receiver(m2m_changed, sender=CustomUser.favorite_music.through)
+def sync_favorite_music(sender, instance, action, reverse, pk_set, **kwargs):
+    favorite_tracks.changed(instance, action, reverse, pk_set)
+
+
+@receiver(pre_delete, sender=CustomUser)
+def forget_deleted_user_favorite_music(sender, instance, **kwargs):
+    favorite_tracks.forget_user(instance)
+
+
+@receiver(pre_delete, sender=Track)
+def forget_deleted_track_favorites(sender, instance, **kwargs):
+    favorite_tracks.forget_target(instance)
+
+
+@receiver(pre_save, sender=Track)
+def remember_track_album(sender, instance, raw=False, **kwargs):
+    if not raw and not instance._state.adding:
+        instance._previous_album_id = (
+            Track.objects.filter(pk=instance.pk).values_list('album_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Track)
+def chart_track(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    # A move to another album changes which genre boards the track is on
+    if not created and getattr(instance, '_previous_album_id', None) != instance.album_id:
+        charts.reset_genre_boards()
+    charts.update_tracks([instance.pk])
+
+
+@receiver(post_delete, sender=Track)
+def unchart_track(sender, instance, **kwargs):
+    charts.remove_tracks([instance.pk])
+
+
+@receiver(post_save, sender=Album)
+def chart_album_tracks(sender, instance, raw=False, **kwargs):
+    if not raw:
+        charts.update_tracks(instance.tracks.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Artist)
+def chart_artist_tracks(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ids = set(Track.objects.filter(album__artist=instance).values_list('id', flat=True))
+        charts.update_tracks(ids | set(instance.tracks.values_list('id', flat=True)))
+
+
+@receiver(post_delete, sender=Artist)
+def chart_deleted_artist(sender, instance, **kwargs):
+    # Album tracks cascade and unchart themselves; _track_ids comes from remember_artist_tracks
+    charts.update_tracks(getattr(instance, '_track_ids', []))
+
+
+@receiver(m2m_changed, sender=Track.artists.through)
+def chart_track_artists(sender, instance, action, reverse, pk_set, **kwargs):
+    # Only album-less tracks show a linked artist, but which ones are is not known here
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        charts.update_tracks([instance.pk])
+    elif action == 'post_clear':
+        charts.update_tracks(getattr(instance, '_track_ids', []))
+    else:
+        charts.update_tracks(pk_set or [])
+
+
+@receiver(m2m_changed, sender=Album.genres.through)
+def reset_genre_charts(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        charts.reset_genre_boards()
+
+
+@receiver(post_delete, sender=Genre)
+def reset_deleted_genre_chart(sender, **kwargs):
+    charts.reset_genre_boards()
+
+
+@receiver(m2m_changed, sender=Playlist.tracks.through)
+def position_playlist_tracks(sender, instance, action, reverse, pk_set, **kwargs):
+    # Playlist.tracks.add()/set() insert rows without a position
+    if action == 'post_add':
+        playlists.place_unpositioned((pk_set or []) if reverse else [instance.pk])
@@ -67,3 +67,446 @@ class MoviesApiTests(APITestCase):
         self.assertEqual(resp2.status_code, status.HTTP_200_OK)
 
 
+
+
+class TrackSearchIndexTests(APITestCase):
+    def setUp(self):
+        self.beatles = Artist.objects.create(name="The Beatles")
+        self.album = Album.objects.create(title="Abbey Road", artist=self.beatles, release_year=1969)
+        self.come_together = Track.objects.create(title="Come Together", album=self.album, duration=259)
+        self.come_together.artists.add(self.beatles)
+        self.something = Track.objects.create(title="Something", album=self.album, duration=182)
+        self.road_song = Track.objects.create(title="Road Song", duration=200)
+
+    def test_search_by_artist_via_m2m(self):
+        resp = self.client.get("/api/tracks/", {"search": "beatles"})
+        self.assertEqual([t["id"] for t in resp.data["results"]], [self.come_together.id])
+
+    def test_prefix_search_ranks_title_matches_first(self):
+        resp = self.client.get("/api/tracks/", {"search": "road"})
+        ids = [t["id"] for t in resp.data["results"]]
+        self.assertEqual(ids[0], self.road_song.id)
+        self.assertEqual(set(ids), {self.road_song.id, self.come_together.id, self.something.id})
+
+    def test_index_follows_renames_and_deletes(self):
+        self.album.title = "Let It Be"
+        self.album.save()
+        self.assertEqual(self.client.get("/api/tracks/", {"search": "abbey"}).data["count"], 0)
+        self.assertEqual(self.client.get("/api/tracks/", {"search": "let it"}).data["count"], 2)
+        self.beatles.delete()
+        self.assertEqual(self.client.get("/api/tracks/", {"search": "beatles"}).data["count"], 0)
+
+    def test_html_track_list_uses_index(self):
+        resp = self.client.get("/music/tracks/", {"search": "some"})
+        self.assertEqual(list(resp.context["page_obj"]), [self.something])
+
+    def test_rebuild_command(self):
+        from django.core.management import call_command
+        from io import StringIO
+        from .search import track_index
+
+        track_index.remove([self.something.id])
+        self.assertEqual(self.client.get("/api/tracks/", {"search": "something"}).data["count"], 0)
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(self.client.get("/api/tracks/", {"search": "something"}).data["count"], 1)
+
+
+class ListQueryCacheTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.artist = Artist.objects.create(name="Queen")
+        self.album = Album.objects.create(title="A Night at the Opera", artist=self.artist, release_year=1975)
+        self.track = Track.objects.create(title="Bohemian Rhapsody", album=self.album, duration=355)
+
+    def test_repeat_request_skips_filter_and_count(self):
+        first = self.client.get("/music/tracks/", {"search": "Bohemian ", "sort": "title"})
+        self.assertEqual(list(first.context["page_obj"]), [self.track])
+        # Only the page hydration query remains; the genre dropdown is cached
+        with self.assertNumQueries(1):
+            second = self.client.get("/music/tracks/", {"sort": "title", "search": "bohemian"})
+        self.assertEqual(list(second.context["page_obj"]), [self.track])
+        self.assertEqual(second.context["page_obj"].paginator.count, 1)
+
+    def test_writes_invalidate_cached_lists(self):
+        self.client.get("/music/albums/", {"q": "opera"})
+        Album.objects.create(title="Opera Nights", artist=self.artist, release_year=1980)
+        resp = self.client.get("/music/albums/", {"q": "opera"})
+        self.assertEqual(resp.context["page_obj"].paginator.count, 2)
+        self.artist.name = "Queen II"
+        self.artist.save()
+        resp = self.client.get("/music/tracks/", {"search": "queen"})
+        self.assertEqual(resp.context["page_obj"].paginator.count, 0)
+
+    def test_generation_moves_again_on_commit(self):
+        from django.db import transaction
+        from catalog import query_cache
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Album.objects.create(title="Opera Nights", artist=self.artist, release_year=1980)
+                pending = query_cache.generations([Album])
+        self.assertNotEqual(query_cache.generations([Album]), pending)
+
+
+class CatalogPaginatorTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        artist = Artist.objects.create(name="Capped Artist")
+        album = Album.objects.create(title="Capped Album", artist=artist, release_year=2001)
+        for i in range(45):
+            Track.objects.create(title=f"Song {i}", album=album, duration=100)
+
+    def test_large_filtered_count_is_capped_and_cached(self):
+        from django.test import override_settings
+        with override_settings(LIST_COUNT_THRESHOLD=25):
+            resp = self.client.get("/music/tracks/", {"search": "song"})
+            paginator = resp.context["page_obj"].paginator
+            self.assertEqual(paginator.count_display, "более 25")
+            self.assertContains(resp, "более 25")
+            # Page 2 reuses the filter set's cached total; only its rows are queried
+            with self.assertNumQueries(1):
+                self.client.get("/music/tracks/", {"search": "song", "page": 2})
+            # Page 3 lies past the cap, so the count is extended to reach it
+            resp = self.client.get("/music/tracks/", {"search": "song", "page": 3})
+            self.assertEqual(resp.context["page_obj"].number, 3)
+
+    def test_small_counts_stay_exact(self):
+        resp = self.client.get("/music/tracks/", {"search": "song"})
+        self.assertEqual(resp.context["page_obj"].paginator.count_display, "45")
+
+    def test_unfiltered_list_uses_table_statistics(self):
+        from django.db import connection
+        from django.test import override_settings
+        from catalog.paginator import estimate_table_rows
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.assertEqual(estimate_table_rows(Track), 45)
+        with override_settings(LIST_COUNT_THRESHOLD=10):
+            resp = self.client.get("/music/tracks/")
+        self.assertEqual(resp.context["page_obj"].paginator.count_display, "≈45")
+
+    def test_stale_statistics_never_hide_the_requested_page(self):
+        from django.db import connection
+        from django.test import override_settings
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        album = Album.objects.get()
+        for i in range(45, 75):
+            Track.objects.create(title=f"Song {i}", album=album, duration=100)
+        with override_settings(LIST_COUNT_THRESHOLD=10):
+            # Page 1 records the estimate of 45; page 4 starts at row 61
+            self.assertEqual(self.client.get("/music/tracks/").context["page_obj"].paginator.count_display, "≈45")
+            page = self.client.get("/music/tracks/", {"page": 4}).context["page_obj"]
+        self.assertEqual(page.number, 4)
+        self.assertEqual(page.paginator.count_display, "более 61")
+
+
+class ProjectionSerializerTests(APITestCase):
+    def setUp(self):
+        self.rock = Genre.objects.create(name="Rock")
+        self.pop = Genre.objects.create(name="Pop")
+        self.artist = Artist.objects.create(name="Projected", bio="Bio", country="UK", formed_year=1970)
+        self.other = Artist.objects.create(name="Guest")
+        self.album = Album.objects.create(title="Shape", artist=self.artist, release_year=1999, description="d")
+        self.album.genres.add(self.rock, self.pop)
+        self.track = Track.objects.create(title="One", album=self.album, duration=100, rating=4.5)
+        self.track.artists.add(self.artist, self.other)
+        self.single = Track.objects.create(title="Two", duration=90)
+
+    def test_same_json_as_model_serializers(self):
+        import json
+        from .projections import serialize_tracks, serialize_albums
+        from .serializers import TrackSerializer, AlbumSerializer
+
+        tracks = list(Track.objects.order_by("id"))
+        self.assertEqual(
+            json.loads(json.dumps(serialize_tracks(tracks))),
+            json.loads(json.dumps(TrackSerializer(tracks, many=True).data)),
+        )
+        albums = list(Album.objects.all())
+        self.assertEqual(serialize_albums(albums), json.loads(json.dumps(AlbumSerializer(albums, many=True).data)))
+
+    def test_list_query_count_does_not_grow_with_page(self):
+        for i in range(10):
+            track = Track.objects.create(title=f"More {i}", album=self.album, duration=100)
+            track.artists.add(self.artist)
+        # count, page, albums (+artist), album genres, track artists
+        with self.assertNumQueries(5):
+            resp = self.client.get("/api/tracks/")
+        self.assertEqual(resp.data["count"], 12)
+
+
+class FragmentCacheTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.artist = Artist.objects.create(name="Card Artist")
+        self.genre = Genre.objects.create(name="Card Genre")
+        self.album = Album.objects.create(title="Card Album", artist=self.artist, release_year=2001)
+        self.album.genres.add(self.genre)
+        self.track = Track.objects.create(title="Card Track", album=self.album, duration=200)
+        self.user = CustomUser.objects.create_user(username="cards", password="pass12345")
+        self.movie = Movie.objects.create(title="Card Movie", release_year=2001, duration=100)
+
+    def lookups(self, name, result):
+        from catalog.fragments import FRAGMENT_LOOKUPS
+        return FRAGMENT_LOOKUPS.labels(name, result)._value.get()
+
+    def test_cards_come_from_cache_until_the_object_changes(self):
+        self.client.get("/music/albums/")
+        hits = self.lookups("album-card", "hit")
+        # Different URL, so the page itself is rendered again
+        response = self.client.get("/music/albums/", {"sort": "title"})
+        self.assertEqual(self.lookups("album-card", "hit"), hits + 1)
+        self.assertContains(response, "1 трек")
+
+        Track.objects.create(title="Second Card Track", album=self.album, duration=100)
+        misses = self.lookups("album-card", "miss")
+        self.assertContains(self.client.get("/music/albums/"), "2 трек")
+        self.assertEqual(self.lookups("album-card", "miss"), misses + 1)
+
+        self.genre.name = "Renamed Genre"
+        self.genre.save()
+        self.assertContains(self.client.get("/music/albums/"), "Renamed Genre")
+
+    def test_viewer_variants_and_csrf_are_not_shared(self):
+        self.client.get("/movies/")
+        self.client.force_login(self.user)
+        self.user.favorite_movies.add(self.movie)
+        response = self.client.get("/movies/")
+        self.assertContains(response, "fill: currentColor")
+        token = response.context["csrf_token"]
+        self.assertContains(response, f'name="csrfmiddlewaretoken" value="{token}"')
+        self.assertNotContains(response, "csrf-token-placeholder")
+
+        self.user.favorite_movies.remove(self.movie)
+        self.assertNotContains(self.client.get("/movies/", {"sort": "title"}), "fill: currentColor")
+
+    def test_warm_track_page_skips_card_queries(self):
+        self.track.artists.add(self.artist)
+        self.client.get("/music/tracks/")
+        self.client.get("/music/tracks/", {"sort": "-title"})
+        # Page rows only: genres and artists come from the facet and fragment caches
+        with self.assertNumQueries(1):
+            self.client.get("/music/tracks/", {"sort": "-title", "page": 1})
+
+
+class AnonymousPageCacheTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.artist = Artist.objects.create(name="Paged Artist")
+        self.album = Album.objects.create(title="Paged Album", artist=self.artist, release_year=1999)
+        self.track = Track.objects.create(title="Paged Track", album=self.album, duration=100)
+
+    def test_repeat_anonymous_request_is_served_from_cache(self):
+        first = self.client.get("/music/tracks/", {"sort": "title", "utm_source": "mail", "genre": ""})
+        self.assertEqual(first["Cache-Control"], "public, max-age=60")
+        self.assertIn("Cookie", first["Vary"])
+        with self.assertNumQueries(0):
+            second = self.client.get("/music/tracks/", {"sort": "title"})
+        self.assertEqual(second.content, first.content)
+        revalidated = self.client.get("/music/tracks/", {"sort": "title"}, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_writes_purge_tagged_pages(self):
+        url = f"/music/albums/{self.album.id}/"
+        self.client.get(url)
+        Track.objects.create(title="Late Addition", album=self.album, duration=100)
+        self.assertContains(self.client.get(url), "Late Addition")
+
+        from catalog.page_cache import purge
+        self.client.get(url)
+        self.client.get("/movies/")
+        purge(Album)
+        with self.assertNumQueries(0):
+            self.client.get("/movies/")
+        self.assertIsNotNone(self.client.get(url).context)
+
+    def test_signed_in_and_cookie_setting_responses_are_not_stored(self):
+        user = CustomUser.objects.create_user(username="paged", password="pass12345")
+        self.client.force_login(user)
+        response = self.client.get("/music/tracks/")
+        self.assertIn("private", response["Cache-Control"])
+        self.client.logout()
+
+        # The login page sets a CSRF cookie, so it is never served from cache
+        self.client.get("/accounts/login/")
+        self.assertIsNotNone(self.client.get("/accounts/login/").context)
+
+
+class PlaylistOrderTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import Playlist
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username="ordered", password="pass12345")
+        self.client.force_login(self.user)
+        album = Album.objects.create(title="Ordered Album", artist=Artist.objects.create(name="O"), release_year=2001)
+        self.tracks = [Track.objects.create(title=f"T{i}", album=album, duration=100) for i in range(4)]
+        self.playlist = Playlist.objects.create(user=self.user, name="Mine")
+        self.playlist.tracks.add(*self.tracks[:3])
+
+    def order(self):
+        return [track.id for track in self.playlist.ordered_tracks()]
+
+    def test_tracks_added_through_the_relation_are_appended_in_order(self):
+        t0, t1, t2, t3 = [track.id for track in self.tracks]
+        self.assertEqual(self.order(), [t0, t1, t2])
+        self.playlist.tracks.add(self.tracks[3])
+        self.assertEqual(self.order(), [t0, t1, t2, t3])
+
+    def test_insert_and_move_write_a_single_row(self):
+        from . import playlists
+        t0, t1, t2, t3 = [track.id for track in self.tracks]
+        # Read the two neighbours, insert one row (plus the savepoints)
+        with self.assertNumQueries(6):
+            self.assertTrue(playlists.insert(self.playlist, t3, 1))
+        self.assertEqual(self.order(), [t0, t3, t1, t2])
+        with self.assertNumQueries(4):
+            self.assertTrue(playlists.move(self.playlist, t0, 3))
+        self.assertEqual(self.order(), [t3, t1, t2, t0])
+        self.assertFalse(playlists.insert(self.playlist, t1))
+        self.assertFalse(playlists.move(self.playlist, 10 ** 6, 0))
+
+    def test_exhausted_gap_renumbers(self):
+        from . import playlists
+        from .models import PlaylistTrack
+        t0, t1, t2, t3 = [track.id for track in self.tracks]
+        PlaylistTrack.objects.filter(track_id=t1).update(position=PlaylistTrack.objects.get(track_id=t0).position + 1)
+        playlists.insert(self.playlist, t3, 1)
+        self.assertEqual(self.order(), [t0, t3, t1, t2])
+        positions = list(PlaylistTrack.objects.filter(playlist=self.playlist).order_by("position").values_list("position", flat=True))
+        self.assertTrue(all(b - a > 1 for a, b in zip(positions, positions[1:])))
+
+    def test_api_edits_and_ordered_representation(self):
+        t0, t1, t2, t3 = [track.id for track in self.tracks]
+        url = f"/api/playlists/{self.playlist.id}/"
+        self.assertEqual(self.client.post(url + "insert/", {"track_id": t3, "index": 0}).status_code, 204)
+        self.assertEqual(self.client.post(url + "move/", {"track_id": t1, "index": 3}).status_code, 204)
+        self.assertEqual(self.client.post(url + "remove/", {"track_id": t2}).status_code, 204)
+        self.assertEqual([t["id"] for t in self.client.get(url).data["tracks"]], [t3, t0, t1])
+        projected = self.client.get(url, {"fields": "id,tracks.id"})
+        self.assertEqual([t["id"] for t in projected.data["tracks"]], [t3, t0, t1])
+
+        self.assertEqual(self.client.post(url + "insert/", {"track_id": t0}).status_code, 400)
+        self.assertEqual(self.client.post(url + "insert/", {"track_id": 10 ** 6}).status_code, 404)
+        self.assertEqual(self.client.post(url + "move/", {"track_id": t2, "index": 0}).status_code, 404)
+        self.assertEqual(self.client.post(url + "move/", {"track_id": t0}).status_code, 400)
+        self.assertEqual(self.client.post(url + "remove/", {"track_id": t2}).status_code, 404)
+
+    def test_html_playlist_actions(self):
+        t0, t1, t2, t3 = [track.id for track in self.tracks]
+        url = f"/music/playlists/{self.playlist.id}/"
+        self.client.post(url, {"action": "move", "track_id": t2, "index": 0})
+        self.client.post(url, {"action": "insert", "track_id": t3, "index": 1})
+        self.client.post(url, {"action": "remove", "track_id": t0})
+        self.assertEqual(self.order(), [t2, t3, t1])
+        # The legacy form posts only a track id and toggles membership
+        self.client.post(url, {"track_id": t1})
+        self.assertEqual(self.order(), [t2, t3])
+        response = self.client.get(url)
+        self.assertEqual([track.id for track in response.context["tracks"]], [t2, t3])
+
+
+class PlaylistBulkEditTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import Playlist
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username="bulk", password="pass12345")
+        self.client.force_login(self.user)
+        album = Album.objects.create(title="Bulk Album", artist=Artist.objects.create(name="B"), release_year=2002)
+        self.tracks = Track.objects.bulk_create(
+            [Track(title=f"B{i}", album=album, duration=100) for i in range(40)]
+        )
+        self.ids = [track.id for track in self.tracks]
+        self.playlist = Playlist.objects.create(user=self.user, name="Bulk")
+        self.url = f"/api/playlists/{self.playlist.id}/"
+
+    def order(self):
+        return [track.id for track in self.playlist.ordered_tracks()]
+
+    def patch(self, data):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, data, format="json")
+        return response, len(queries)
+
+    def test_add_remove_move_apply_only_the_difference(self):
+        response, few = self.patch({"add": self.ids[:5]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([t["id"] for t in response.data["tracks"]], self.ids[:5])
+        response, many = self.patch({"add": self.ids[5:]})
+        self.assertEqual(many, few)
+        self.assertEqual(self.order(), self.ids)
+
+        response = self.client.patch(self.url, {
+            "remove": self.ids[10:],
+            "add": [self.ids[0], self.ids[20]],
+            "move": [{"track_id": self.ids[9], "index": 0}],
+        }, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.order(), [self.ids[9]] + self.ids[:9] + [self.ids[20]])
+
+    def test_track_ids_replace_in_the_given_order(self):
+        order = self.ids[::-1][:10]
+        response = self.client.put(self.url, {"name": "Bulk", "track_ids": order}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.order(), order)
+        self.client.patch(self.url, {"track_ids": order[2:] + order[:1]}, format="json")
+        self.assertEqual(self.order(), order[2:] + order[:1])
+
+    def test_track_ids_rewrite_only_the_moved_rows(self):
+        from .models import PlaylistTrack
+        self.patch({"add": self.ids[:20]})
+        before = dict(PlaylistTrack.objects.filter(playlist=self.playlist).values_list("track_id", "position"))
+        order = [self.ids[19]] + self.ids[:5] + [self.ids[30]] + self.ids[5:19]
+        self.assertEqual(self.patch({"track_ids": order})[0].status_code, 200)
+        self.assertEqual(self.order(), order)
+        after = dict(PlaylistTrack.objects.filter(playlist=self.playlist).values_list("track_id", "position"))
+        changed = {pk for pk in order if before.get(pk) != after[pk]}
+        self.assertEqual(changed, {self.ids[19], self.ids[30]})
+
+    def test_ids_are_validated_in_one_query(self):
+        response, queries = self.patch({"add": self.ids + [10 ** 6]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(10 ** 6), str(response.data))
+        # Session, user and playlist rows, then one IN query for all 41 ids
+        self.assertEqual(queries, 4)
+        self.assertEqual(self.patch({"add": ["x"]})[0].status_code, 400)
+        self.assertEqual(self.patch({"move": [{"track_id": self.ids[0]}]})[0].status_code, 400)
+        self.assertEqual(self.order(), [])
+
+    def test_album_and_movie_id_lists_use_one_query(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from api.serializers import MovieSerializer
+        from .serializers import AlbumSerializer
+        genres = Genre.objects.bulk_create([Genre(name=f"G{i}") for i in range(20)])
+        actors = Actor.objects.bulk_create([Actor(name=f"A{i}") for i in range(20)])
+        director = Director.objects.create(name="D")
+        album = AlbumSerializer(data={
+            "title": "Many Genres", "artist_id": self.tracks[0].album.artist_id, "release_year": 2003,
+            "genre_ids": [genre.id for genre in reversed(genres)],
+        })
+        movie = MovieSerializer(data={
+            "title": "Big Cast", "description": "d", "release_year": 2003, "duration": 90,
+            "genre_ids": [], "director_ids": [director.id], "actor_ids": [actor.id for actor in actors],
+        })
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(album.is_valid(), album.errors)
+        # The unique title check and the artist, then all 20 genres at once
+        self.assertEqual(len(queries), 3)
+        self.assertEqual([g.id for g in album.validated_data["genres"]], [g.id for g in reversed(genres)])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(movie.is_valid(), movie.errors)
+        # Likewise: the title check, then one query per non-empty id list
+        self.assertEqual(len(queries), 3)
+
+        movie = MovieSerializer(data={"title": "X", "release_year": 2003, "duration": 90,
+                                      "genre_ids": [], "director_ids": [], "actor_ids": [10 ** 6]})
+        self.assertFalse(movie.is_valid())
+        self.assertEqual(movie.errors["actor_ids"][0].code, "does_not_exist")
@@ -1,14 +1,23 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Q
-from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse
+from django.db.models import Q, prefetch_related_objects
 from .models import Track, Album, Artist, Genre, Playlist
 from .forms import PlaylistForm, TrackForm, AlbumForm
+from . import playlists
+from .search import track_index
+from accounts.favorites import favorite_tracks
+from catalog import fragments, query_cache
+from catalog.conditional import conditional_page
+from catalog.facets import FACETS
+from catalog.page_cache import cache_anonymous
 
+@cache_anonymous(Track, Album, Artist, Genre)
+@conditional_page(Track, Album, Artist, Genre)
 def track_list(request):
-    tracks = Track.objects.all().select_related('album', 'album__artist')
+    base = Track.objects.all().select_related('album', 'album__artist')
+    tracks = base
     
     # Handle form submission for adding tracks (admin only)
     track_form = TrackForm()
@@ -24,11 +33,7 @@ def track_list(request):
     # Search
     query = request.GET.get('search') or request.GET.get('q')
     if query:
-        tracks = tracks.filter(
-            Q(title__icontains=query) |
-            Q(album__title__icontains=query) |
-            Q(artists__name__icontains=query)
-        ).distinct()
+        tracks = track_index.search(tracks, query)
     
     # Filtering
     genre_filter = request.GET.get('genre')
@@ -39,42 +44,51 @@ def track_list(request):
     if artist_filter:
         tracks = tracks.filter(artists__name=artist_filter)
     
-    # Sorting
-    sort_by = request.GET.get('sort', 'title')
-    if sort_by in ['title', 'album__title', '-title', '-album__title', 'duration', '-duration', 'rating', '-rating', 'id', '-id']:
+    # Sorting (search results default to relevance)
+    sort_by = request.GET.get('sort', 'relevance' if query else 'title')
+    if sort_by == 'relevance' and query:
+        tracks = tracks.order_by('-search_rank', 'title')
+    elif sort_by == 'popularity':
+        tracks = tracks.order_by('-favorite_count', 'id')
+    elif sort_by in ['title', 'album__title', '-title', '-album__title', 'duration', '-duration', 'rating', '-rating', 'id', '-id']:
         tracks = tracks.order_by(sort_by)
     
-    # Pagination
-    paginator = Paginator(tracks, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination (page ids and totals are cached per normalised filter set)
+    page_obj = query_cache.cached_page(
+        'tracks', request.GET, [Track, Album, Artist, Genre], tracks, hydrate=base, per_page=20
+    )
     
-    genres = Genre.objects.all()
-    artists = Artist.objects.all()
+    # Cards vary by favourite state; their markup comes from the fragment cache
+    favorite_ids = favorite_tracks.ids(request.user)
+    for track in page_obj:
+        track.is_favorited = track.pk in favorite_ids
+    fragments.prime(request, 'track-card', page_obj)
+    
+    # Artists are too many to list; the page looks them up through /api/facets/
+    genres = FACETS['music-genres'].options()
     
     context = {
         'page_obj': page_obj,
         'genres': genres,
-        'artists': artists,
         'search_query': query or '',
         'track_form': track_form,
     }
     return render(request, 'music/track_list.html', context)
 
+@cache_anonymous(Track, Album, Artist)
 def track_detail(request, track_id):
     track = get_object_or_404(Track, id=track_id)
-    is_favorited = False
-    if request.user.is_authenticated:
-        is_favorited = request.user.favorite_music.filter(id=track_id).exists()
-    
     context = {
         'track': track,
-        'is_favorited': is_favorited,
+        'is_favorited': track.pk in favorite_tracks.ids(request.user),
     }
     return render(request, 'music/track_detail.html', context)
 
+@cache_anonymous(Album, Artist, Genre, Track)
+@conditional_page(Album, Artist, Genre)
 def album_list(request):
-    albums = Album.objects.all().select_related('artist').prefetch_related('genres')
+    base = Album.objects.all().select_related('artist')
+    albums = base
     
     # Handle form submission for adding albums (admin only)
     album_form = AlbumForm()
@@ -98,9 +112,11 @@ def album_list(request):
     if genre_filter:
         albums = albums.filter(genres__name=genre_filter)
     
-    paginator = Paginator(albums, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = query_cache.cached_page(
+        'albums', request.GET, [Album, Artist, Genre], albums, hydrate=base, per_page=12
+    )
+    # Only cards missing from the fragment cache need their genres
+    prefetch_related_objects(fragments.prime(request, 'album-card', page_obj), 'genres')
     
     genres = Genre.objects.all()
     
@@ -112,9 +128,13 @@ def album_list(request):
     }
     return render(request, 'music/album_list.html', context)
 
+@cache_anonymous(Album, Artist, Genre, Track)
 def album_detail(request, album_id):
     album = get_object_or_404(Album, id=album_id)
-    tracks = album.tracks.all().select_related('album')
+    tracks = list(album.tracks.all().select_related('album'))
+    favorite_ids = favorite_tracks.ids(request.user)
+    for track in tracks:
+        track.is_favorited = track.pk in favorite_ids
     
     context = {
         'album': album,
@@ -124,14 +144,9 @@ def album_detail(request, album_id):
 
 @login_required
 def toggle_favorite_track(request, track_id):
-    track = get_object_or_404(Track, id=track_id)
-    
-    if request.user.favorite_music.filter(id=track_id).exists():
-        request.user.favorite_music.remove(track)
-        is_favorited = False
-    else:
-        request.user.favorite_music.add(track)
-        is_favorited = True
+    is_favorited = favorite_tracks.toggle(request.user, track_id)
+    if is_favorited is None:
+        raise Http404
     
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({'is_favorited': is_favorited})
@@ -163,16 +178,26 @@ def playlist_detail(request, playlist_id):
     playlist = get_object_or_404(Playlist, id=playlist_id, user=request.user)
     
     if request.method == 'POST':
-        track_id = request.POST.get('track_id')
-        if track_id:
-            track = get_object_or_404(Track, id=track_id)
-            if track in playlist.tracks.all():
-                playlist.tracks.remove(track)
-            else:
-                playlist.tracks.add(track)
+        track_id = request.POST.get('track_id', '')
+        action = request.POST.get('action', 'toggle')
+        index = request.POST.get('index', '')
+        index = int(index) if index.lstrip('-').isdigit() else None
+        if track_id.isdigit():
+            track_id = int(track_id)
+            if action == 'move' and index is not None:
+                playlists.move(playlist, track_id, max(index, 0))
+            elif action == 'remove' or (action == 'toggle' and playlists.contains(playlist, track_id)):
+                playlists.remove(playlist, track_id)
+            elif action in ('insert', 'toggle'):
+                track = get_object_or_404(Track, id=track_id)
+                if not playlists.insert(playlist, track.pk, index if index is None else max(index, 0)):
+                    messages.info(request, f'Трек "{track.title}" уже есть в плейлисте')
+        return redirect('music:playlist_detail', playlist_id=playlist.id)
     
+    tracks = playlist.ordered_tracks().select_related('album').prefetch_related('artists')
     context = {
         'playlist': playlist,
+        'tracks': tracks,
     }
     return render(request, 'music/playlist_detail.html', context)
 